@@ -1,10 +1,15 @@
 import streamlit as st
-import subprocess
-import os
 import sys
 import json
+import time
 from pathlib import Path
 
+# los módulos del pipeline (scripts/) se importan como hermanos, igual que entre sí
+sys.path.insert(0, str(Path(__file__).parent.resolve() / "scripts"))
+from utils.jobs import JobManager, DEFAULT_TIMEOUT_SEC
+from runs import current, partition_dir, DEFAULT_PARTITION
+from lineage_index import LineageIndex
+
 # --- Configuración General ---
 st.set_page_config(
     page_title="SteelTrace CSRD Pipeline",
@@ -12,17 +17,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Definir la ruta base del proyecto y asegurar el CWD
+# Ruta base del proyecto. No se cambia el CWD: el proceso es compartido entre sesiones
+# y cada ejecución del pipeline trabaja en su propio directorio de run.
 ROOT_DIR = Path(__file__).parent.resolve()
-os.chdir(ROOT_DIR)
 
 DATA_PATH = ROOT_DIR / "data" / "samples"
-OUTPUT_PATH = ROOT_DIR 
 try:
     SAMPLE_FILES = [f.name for f in DATA_PATH.glob("*.json")]
 except FileNotFoundError:
     SAMPLE_FILES = []
 
+# Tamaño máximo de cada parte de descarga del paquete de auditoría
+DOWNLOAD_PART_BYTES = 64 * 1024 * 1024
+
+# Panel de ejecuciones en segundo plano
+JOBS_SHOWN = 5
+LOG_TAIL_LINES = 200
+JOB_ICONS = {"queued": "🕒", "pending": "🕒", "running": "⏳", "ok": "✅", "failed": "❌",
+             "timeout": "⏱️", "cancelled": "⏹️", "skipped": "⏭️"}
+
+# Límites de previsualización de artefactos (lecturas acotadas y paginadas)
+PREVIEW_BYTES = 256 * 1024
+PAGE_LINES = 200
+JSON_MAX_BYTES = 2 * 1024 * 1024
+
+# Consultas de linaje (data/lineage.sqlite)
+LINEAGE_KINDS = ["kpi", "kpi_group", "record", "normalized_file", "source_file", "rdf_node", "xbrl_fact"]
+LINEAGE_LIMIT = 500
+
 # Listado de scripts del pipeline en orden de ejecución
 PIPELINE_SCRIPTS = [
     "mcp_ingest.py",
@@ -34,72 +56,232 @@ PIPELINE_SCRIPTS = [
     "hitl_kappa.py",
     "package_release.py"
 ]
+# Vista previa por muestreo estratificado (scripts/preview.py): solo ingesta, SHACL y RAGA
+PREVIEW_SCRIPTS = PIPELINE_SCRIPTS[:3]
 
 # --- Utilidades ---
 
-def load_file_content(file_path: Path):
-    """Carga y retorna el contenido de un archivo como texto (UTF-8) o None si no existe."""
+def file_signature(file_path: Path):
+    """(mtime_ns, tamaño) del archivo, o None si no existe. Es la clave de invalidación de la caché."""
     try:
-        # Retorna la cadena de texto
-        return file_path.read_text(encoding="utf-8")
+        stat = file_path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
     except FileNotFoundError:
         return None
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def _read_head(path_str: str, sig, limit: int):
+    # lectura acotada: nunca más de `limit` bytes aunque el artefacto pese cientos de MB
+    with open(path_str, "rb") as f:
+        data = f.read(limit + 1)
+    return data[:limit].decode("utf-8", errors="replace"), len(data) > limit
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _parse_json(path_str: str, sig):
+    return json.loads(Path(path_str).read_text(encoding="utf-8"))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _page_offsets(path_str: str, sig, page_lines: int):
+    # offsets de inicio de cada página de `page_lines` líneas (un único recorrido por versión del archivo)
+    offsets, pos = [0], 0
+    with open(path_str, "rb") as f:
+        for n, line in enumerate(f, start=1):
+            pos += len(line)
+            if n % page_lines == 0 and pos < sig[1]:
+                offsets.append(pos)
+    return offsets
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def _read_page(path_str: str, sig, offset: int, page_lines: int, limit: int):
+    lines, budget = [], limit
+    with open(path_str, "rb") as f:
+        f.seek(offset)
+        for _ in range(page_lines):
+            line = f.readline(budget)
+            if not line:
+                break
+            lines.append(line)
+            budget -= len(line)
+            if budget <= 0:
+                break
+    return b"".join(lines).decode("utf-8", errors="replace")
+
+def load_file_content(file_path: Path, limit: int | None = None):
+    """Carga y retorna el contenido (hasta `limit` bytes) como texto UTF-8, o None si no existe. Cacheado por mtime."""
+    sig = file_signature(file_path)
+    if sig is None:
+        return None
+    try:
+        return _read_head(str(file_path), sig, limit or PREVIEW_BYTES)[0]
     except Exception as e:
         return f"Error al leer {file_path.name}: {e}"
 
-def run_script_and_capture_output(script_name):
-    """
-    Ejecuta un script del pipeline usando sys.executable para asegurar el entorno.
-    """
-    script_path = ROOT_DIR / "scripts" / script_name
-    
-    # 1. Mostrar la información de ejecución
-    with st.spinner(f"Ejecutando script: **{script_name}**..."):
-        # Muestra el path del intérprete de Streamlit
-        st.code(f"Comando: {sys.executable} {script_name}", language="bash")
+@st.cache_resource
+def get_job_manager():
+    """Un único gestor de ejecuciones por servidor: compartido entre reruns y sesiones."""
+    return JobManager(ROOT_DIR)
 
-        try:
-            # Usar sys.executable para que encuentre todas las dependencias
-            result = subprocess.run(
-                [sys.executable, str(script_path)], 
-                capture_output=True, 
-                text=True, 
-                check=True,
-                timeout=60
-            )
-            st.success(f"✅ Ejecución de **{script_name}** completada con éxito.")
-            st.info("Salida del script (STDOUT):")
-            st.code(result.stdout, language="text")
-            return result.stdout
-            
-        except subprocess.CalledProcessError as e:
-            st.error(f"❌ Ejecución de **{script_name}** FALLIDA con código de retorno {e.returncode}.")
-            st.text("STDOUT:")
-            st.code(e.stdout, language="text")
-            st.text("STDERR (El error principal):")
-            st.code(e.stderr, language="text")
-            return None
-            
-        except FileNotFoundError:
-            st.error(f"❌ Error: No se encontró el script **{script_name}**. Verifique que existe en la carpeta `scripts/`.")
-            return None
-        except Exception as e:
-            st.error(f"❌ Error inesperado al ejecutar **{script_name}**: {e}")
-            return None
-
-def safe_json_display(content):
-    """Muestra contenido JSON o un mensaje de advertencia si es None o inválido."""
-    if content is None:
+@st.fragment(run_every=1.0)
+def render_jobs():
+    """Panel de ejecuciones: se refresca cada segundo mostrando progreso y logs en vivo."""
+    manager = get_job_manager()
+    jobs = manager.recent(JOBS_SHOWN)
+    if not jobs:
+        st.caption("No hay ejecuciones todavía.")
+        return
+    for job in jobs:
+        snap = job.snapshot(tail=LOG_TAIL_LINES)
+        icon = JOB_ICONS.get(snap["status"], "•")
+        mode = " · 🔍 vista previa" if "STEELTRACE_PREVIEW" in snap["env"] else ""
+        then = f" · ⏩ sigue en `{snap['followup']}`" if snap["followup"] else ""
+        st.markdown(f"{icon} **Ejecución `{snap['id']}`** ({snap['partition']}, run `{snap['run_id'] or '—'}`{mode}) — {snap['status']}{then} · "
+                    + " → ".join(f"{JOB_ICONS.get(s['status'], '•')} {s['name']}" for s in snap["stages"]))
+        st.progress(snap["progress"])
+        if snap["status"] in ("queued", "running"):
+            st.button("⏹️ Cancelar", key=f"cancel_{snap['id']}", on_click=manager.cancel, args=(snap["id"],))
+        log = "\n".join(line if stream == "stdout" else f"[stderr] {line}" for stream, line in snap["log"])
+        st.code(log or "(sin salida todavía)", language="text")
+
+def zip_part_reader(path: Path, offset: int, length: int):
+    """Devuelve un callable que lee solo [offset, offset+length) del archivo al pulsar descargar."""
+    def _read():
+        with path.open("rb") as f:
+            f.seek(offset)
+            return f.read(length)
+    return _read
+
+def show_text_file(file_path: Path, language="text", key=None, missing_msg="Archivo de salida aún no generado o no encontrado."):
+    """Muestra un archivo de texto; si supera PREVIEW_BYTES se pagina por bloques de PAGE_LINES líneas."""
+    sig = file_signature(file_path)
+    if sig is None:
+        st.info(missing_msg)
+        return
+    text, truncated = _read_head(str(file_path), sig, PREVIEW_BYTES)
+    if not truncated:
+        st.code(text, language=language)
+        return
+    offsets = _page_offsets(str(file_path), sig, PAGE_LINES)
+    page = st.number_input(
+        f"Página de `{file_path.name}` ({len(offsets)} páginas de {PAGE_LINES} líneas)",
+        min_value=1, max_value=len(offsets), value=1, key=key or f"page_{file_path}"
+    )
+    st.code(_read_page(str(file_path), sig, offsets[page - 1], PAGE_LINES, PREVIEW_BYTES), language=language)
+    st.caption(f"{file_path.name}: {sig[1]/1e6:.1f} MB — vista paginada (máx. {PREVIEW_BYTES // 1024} KB por página).")
+
+def show_json_file(file_path: Path, key=None):
+    """Muestra un JSON con st.json si es pequeño; los grandes (o inválidos) se muestran como texto paginado."""
+    sig = file_signature(file_path)
+    if sig is None:
         st.warning("Archivo de salida aún no generado o no encontrado. Ejecuta el paso correspondiente.")
         return
-    try:
-        # Intenta cargar la cadena como objeto JSON (requerido por st.json)
-        st.json(json.loads(content))
-    except json.JSONDecodeError:
-        st.warning("Contenido no es JSON válido. Mostrando como texto simple:")
-        st.code(content, language="text")
-    except Exception:
-         st.code(content, language="text")
+    if sig[1] <= JSON_MAX_BYTES:
+        try:
+            st.json(_parse_json(str(file_path), sig))
+            return
+        except json.JSONDecodeError:
+            st.warning("Contenido no es JSON válido. Mostrando como texto simple:")
+    show_text_file(file_path, language="json", key=key)
+
+@st.cache_resource(max_entries=4)
+def _lineage_index(path_str: str, sig):
+    # conexión de solo lectura por (ruta, mtime, tamaño): un índice reescrito abre una nueva
+    return LineageIndex(path_str, readonly=True)
+
+def render_lineage(db_path: Path):
+    """Panel de procedencia: hacia atrás (de dónde sale) o hacia delante (qué afecta) desde un nodo."""
+    sig = file_signature(db_path)
+    if sig is None:
+        st.warning("Índice de linaje no generado. Ejecuta el pipeline (o `python scripts/lineage_index.py import`).")
+        return
+    idx = _lineage_index(str(db_path), sig)
+    c1, c2, c3 = st.columns([1, 1, 2])
+    with c1:
+        direction = st.radio("Dirección", ["⬅️ Procedencia", "➡️ Impacto"], key="lin_dir")
+    with c2:
+        kind = st.selectbox("Tipo de nodo", LINEAGE_KINDS, key="lin_kind")
+    with c3:
+        like = st.text_input("Filtrar claves", key="lin_like")
+        keys = idx.keys(kind, like)
+        key = st.selectbox("Nodo", keys, key="lin_key") if keys else None
+    c4, c5, c6 = st.columns(3)
+    with c4:
+        entity = st.text_input("Entidad (solo KPI)", key="lin_entity").strip() or None
+    with c5:
+        depth = st.number_input("Profundidad", min_value=1, max_value=10, value=10, key="lin_depth")
+    with c6:
+        skip_records = st.checkbox("Omitir registros", value=direction.endswith("Impacto"), key="lin_skip",
+                                   help="Hacia delante, los archivos llegan a los KPI por el atajo archivo → grupo.")
+    if key is None:
+        st.info("Sin nodos de ese tipo.")
+        return
+    t0 = time.perf_counter()
+    skip = ("record",) if skip_records else ()
+    if direction.endswith("Impacto"):
+        rows = idx.downstream(kind, key, depth, skip=skip, limit=LINEAGE_LIMIT)
+    elif kind == "kpi" and entity:
+        rows = idx.feeds(key, entity, depth, skip=skip, limit=LINEAGE_LIMIT)
+    else:
+        rows = idx.upstream(kind, key, depth, skip=skip, limit=LINEAGE_LIMIT)
+    elapsed = (time.perf_counter() - t0) * 1000
+    counts = {}
+    for r in rows:
+        counts[r["kind"]] = counts.get(r["kind"], 0) + 1
+    st.caption(f"{len(rows)} nodos en {elapsed:.1f} ms · " + " · ".join(f"{k}: {n}" for k, n in counts.items())
+               + (f" (límite {LINEAGE_LIMIT})" if len(rows) >= LINEAGE_LIMIT else ""))
+    st.dataframe([{**r, "attrs": json.dumps(r["attrs"], ensure_ascii=False) if r["attrs"] else ""} for r in rows],
+                 width="stretch", hide_index=True)
+
+def render_preview_controls(partition: str, stage_timeout: float):
+    """Vista previa: ingesta → SHACL → RAGA sobre una muestra estratificada (entidad, periodo,
+    source_system), en su propia partición; opcionalmente encadena la ejecución exacta."""
+    import preview
+    col_p1, col_p2, col_p3 = st.columns([1, 1, 1])
+    with col_p1:
+        sample_n = st.number_input("Registros por dominio (muestra)", min_value=100, value=preview.SAMPLE_SIZE, step=500)
+    with col_p2:
+        then_full = st.checkbox("Después, ejecución completa en segundo plano", value=False)
+    with col_p3:
+        if st.button("🔍 Vista previa (muestra estratificada)"):
+            get_job_manager().submit(PREVIEW_SCRIPTS, default_timeout=stage_timeout,
+                                     partition=partition + preview.PARTITION_SUFFIX,
+                                     env={"STEELTRACE_PREVIEW": int(sample_n)},
+                                     then={"stages": PIPELINE_SCRIPTS, "default_timeout": stage_timeout,
+                                           "partition": partition} if then_full else None)
+
+def render_preview(partition: str):
+    """Última vista previa completada: KPIs y tasas DQ/SHACL estimados para la población, con IC."""
+    import preview
+    run_dir = current(partition + preview.PARTITION_SUFFIX)
+    path = run_dir / preview.REPORT if run_dir else None
+    sig = file_signature(path) if path else None
+    if sig is None:
+        st.info("Sin vista previa todavía: pulsa «🔍 Vista previa».")
+        return
+    rep = _parse_json(str(path), sig)
+    stages = rep.get("stages", {})
+    st.caption(f"Muestra de {rep['sample_size']} registros por dominio · IC {int(rep['level'] * 100)} % · "
+               f"run `{run_dir.name}`")
+    fmt = lambda e: f"{e['estimate']}  [{e['ci'][0]}, {e['ci'][1]}]"
+    if "RAGA.compute" in stages:
+        st.subheader("KPIs estimados")
+        st.dataframe([{"DP": dp, "estimación [IC]": fmt(e), "muestra": e["records_sampled"], "población": e["records_total"]}
+                      for dp, e in stages["RAGA.compute"].items()], width="stretch", hide_index=True)
+    if "MCP.ingest" in stages:
+        ing = stages["MCP.ingest"]
+        st.subheader(f"Calidad de datos — decisión: {ing['dq_pass']}")
+        st.dataframe([{"dominio": dom, "schema": fmt(v["schema_validity"]),
+                       **{c: f"{fmt(e)} {v['dq_decision'][c]}" for c, e in v["dq"].items()},
+                       "muestra": v["records_sampled"], "población": v["records_total"], "estratos": v["strata"]}
+                      for dom, v in ing["domains"].items()], width="stretch", hide_index=True)
+    if "SHACL.validate" in stages:
+        st.subheader("Conformidad SHACL estimada")
+        st.dataframe([{"dominio": dom, "conformidad [IC]": fmt(e), "muestra": e["records_sampled"],
+                       "violaciones en la muestra": e["violations_in_sample"]}
+                      for dom, e in stages["SHACL.validate"].items()], width="stretch", hide_index=True)
+
+def lazy_expander(label: str, key: str):
+    """Expander con estado: su contenido solo se calcula cuando está abierto (comprobar `.open`)."""
+    return st.expander(label, key=key, on_change="rerun")
 
 # --- Interfaz de Streamlit ---
 
@@ -127,12 +309,7 @@ def main():
             file_path = DATA_PATH / selected_file_name
             st.subheader(f"Contenido de: `{selected_file_name}`")
             
-            content = load_file_content(file_path)
-            if content:
-                try:
-                    st.json(json.loads(content))
-                except:
-                    st.code(content, language="json")
+            show_json_file(file_path, key="page_sample")
 
             with st.expander("Ver Contrato/Schema Relacionado (`contracts/`):"):
                 if "energy" in selected_file_name:
@@ -159,95 +336,141 @@ def main():
         st.header("Ejecución Paso a Paso del Pipeline de Gobernanza")
         st.markdown("Presiona los botones en orden para generar los artefactos de cumplimiento.")
 
-        if 'execution_logs' not in st.session_state:
-            st.session_state.execution_logs = {}
-        
+        manager = get_job_manager()
+        partition = st.sidebar.text_input(
+            "Partición", value=DEFAULT_PARTITION,
+            help="Cada partición tiene sus propios runs y su puntero 'current'; particiones distintas corren en paralelo."
+        ).strip() or DEFAULT_PARTITION
+        try:
+            partition_dir(partition)
+        except ValueError as e:
+            st.sidebar.error(str(e))
+            st.stop()
+        stage_timeout = st.sidebar.number_input(
+            "Timeout por defecto por etapa (s)", min_value=10, value=int(DEFAULT_TIMEOUT_SEC), step=60,
+            help="Las etapas que lo superen se detienen y la ejecución se marca como 'timeout'. SHACL tiene su propio límite (STAGE_TIMEOUTS)."
+        )
+
+        # Las ejecuciones corren en segundo plano; pulsar de nuevo con las mismas entradas
+        # (o desde otra sesión) se une a la ejecución en curso en lugar de duplicarla.
+        if st.button("⏩ Ejecutar pipeline completo", type="primary"):
+            manager.submit(PIPELINE_SCRIPTS, default_timeout=stage_timeout, partition=partition)
+
+        render_preview_controls(partition, stage_timeout)
+
         for i, script in enumerate(PIPELINE_SCRIPTS):
             st.subheader(f"Paso {i+1}: {script}")
             
-            if st.button(f"▶️ Ejecutar {script}", key=f"run_btn_{i}", type="secondary", help="Ejecuta el script y muestra los logs de salida."):
-                run_script_and_capture_output(script)
-        
+            if st.button(f"▶️ Ejecutar {script}", key=f"run_btn_{i}", type="secondary", help="Ejecuta el script en segundo plano y muestra los logs en vivo."):
+                manager.submit([script], default_timeout=stage_timeout, partition=partition)
+
+        st.subheader("Ejecuciones")
+        render_jobs()
         st.divider()
 
         # --- VISUALIZACIÓN DE ARTEFACTOS GENERADOS ---
         st.header("Artefactos de Salida Clave")
         st.markdown("Revisa los reportes generados después de ejecutar los pasos.")
+        # los artefactos se leen del último run completado de la partición ("current")
+        OUTPUT_PATH = current(partition) or ROOT_DIR
+        st.caption(f"Mostrando artefactos de: `{OUTPUT_PATH.relative_to(ROOT_DIR) if OUTPUT_PATH != ROOT_DIR else '.'}`")
+
+        # 0. Vista previa (partición "<partición>-preview")
+        exp = lazy_expander("🔍 Vista previa: estimaciones con intervalos de confianza", key="exp_preview")
+        with exp:
+            if exp.open:
+                render_preview(partition)
 
+        # Cada expander solo lee sus artefactos cuando está abierto; las lecturas se cachean por (ruta, mtime, tamaño)
         # 1. Reporte DQ y Linaje (Paso 1)
-        with st.expander("✅ Ingesta/Data Quality (DQ) y Linaje"):
-            safe_json_display(load_file_content(OUTPUT_PATH / "data" / "dq_report.json"))
-            st.code(load_file_content(OUTPUT_PATH / "data" / "lineage.jsonl"), language="json")
+        exp = lazy_expander("✅ Ingesta/Data Quality (DQ) y Linaje", key="exp_dq")
+        with exp:
+            if exp.open:
+                show_json_file(OUTPUT_PATH / "data" / "dq_report.json")
+                show_text_file(OUTPUT_PATH / "data" / "lineage.jsonl", language="json")
 
         # 2. Validación Semántica (Paso 2)
-        with st.expander("✅ Validación SHACL y Grafo RDF (Trazabilidad Semántica)"):
-            validation_content = load_file_content(OUTPUT_PATH / "ontology" / "validation.log")
-            linaje_content = load_file_content(OUTPUT_PATH / "ontology" / "linaje.ttl")
+        exp = lazy_expander("✅ Validación SHACL y Grafo RDF (Trazabilidad Semántica)", key="exp_shacl")
+        with exp:
+            if exp.open:
+                show_text_file(OUTPUT_PATH / "ontology" / "validation.log", language="markdown",
+                               missing_msg="Log de validación no generado.")
+                show_text_file(OUTPUT_PATH / "ontology" / "linaje.ttl", language="turtle",
+                               missing_msg="El Linaje RDF (TTL) aún no ha sido generado. Ejecute el Paso 2.")
 
-            st.code(validation_content if validation_content is not None else "Log de validación no generado.", language="markdown")
-            
-            if linaje_content:
-                st.code(linaje_content[:1000], language="turtle")
-            else:
-                 st.info("El Linaje RDF (TTL) aún no ha sido generado. Ejecute el Paso 2.")
+        # 2b. Consultas de linaje sobre el índice SQLite que alimentan todas las etapas
+        exp = lazy_expander("🔎 Linaje: consultas de procedencia", key="exp_lineage")
+        with exp:
+            if exp.open:
+                render_lineage(OUTPUT_PATH / "data" / "lineage.sqlite")
 
         # 3. KPIs y Explicación RAGA (Paso 3)
-        with st.expander("✅ RAGA: KPIs y Explicaciones (Hipótesis/Evidencia)"):
-            kpis_content = load_file_content(OUTPUT_PATH / "raga" / "kpis.json")
-            explain_content = load_file_content(OUTPUT_PATH / "raga" / "explain.json")
-            
-            col_k1, col_k2 = st.columns(2)
-            with col_k1:
-                st.subheader("KPIs")
-                safe_json_display(kpis_content)
-            with col_k2:
-                st.subheader("Explicación RAGA")
-                safe_json_display(explain_content)
+        exp = lazy_expander("✅ RAGA: KPIs y Explicaciones (Hipótesis/Evidencia)", key="exp_raga")
+        with exp:
+            if exp.open:
+                col_k1, col_k2 = st.columns(2)
+                with col_k1:
+                    st.subheader("KPIs")
+                    show_json_file(OUTPUT_PATH / "raga" / "kpis.json")
+                with col_k2:
+                    st.subheader("Explicación RAGA")
+                    show_json_file(OUTPUT_PATH / "raga" / "explain.json")
 
         # 4. Decisión del EEE-Gate (Paso 4)
-        with st.expander("✅ EEE-Gate: Decisión de Publicación"):
-            safe_json_display(load_file_content(OUTPUT_PATH / "ops" / "gate_report.json"))
+        exp = lazy_expander("✅ EEE-Gate: Decisión de Publicación", key="exp_gate")
+        with exp:
+            if exp.open:
+                show_json_file(OUTPUT_PATH / "ops" / "gate_report.json")
 
         # 5. Evidencias y XBRL (Pasos 5 & 6)
-        with st.expander("✅ Evidencias (Merkle) y XBRL (Salida Verificable)"):
-            st.code(load_file_content(OUTPUT_PATH / "evidence" / "evidence_manifest.json"), language="json")
-            
-            xbrl_val_content = load_file_content(OUTPUT_PATH / "xbrl" / "validation.log")
-            st.code(xbrl_val_content if xbrl_val_content is not None else "Log de validación XBRL no generado.", language="text")
+        exp = lazy_expander("✅ Evidencias (Merkle) y XBRL (Salida Verificable)", key="exp_evidence")
+        with exp:
+            if exp.open:
+                show_text_file(OUTPUT_PATH / "evidence" / "evidence_manifest.json", language="json")
+                show_text_file(OUTPUT_PATH / "xbrl" / "validation.log",
+                               missing_msg="Log de validación XBRL no generado.")
 
         # 6. HITL Kappa (Paso 7)
-        with st.expander("✅ HITL: Acuerdo Inter-Evaluador (Kappa de Cohen)"):
-            safe_json_display(load_file_content(OUTPUT_PATH / "ops" / "hitl_kappa.json"))
+        exp = lazy_expander("✅ HITL: Acuerdo Inter-Evaluador (Kappa de Cohen)", key="exp_hitl")
+        with exp:
+            if exp.open:
+                show_json_file(OUTPUT_PATH / "ops" / "hitl_kappa.json")
 
         # 7. Paquete Final (Paso 8)
-        with st.expander("📦 Paquete de Auditoría ZIP"):
-            audit_dir = OUTPUT_PATH / "release" / "audit"
+        exp = lazy_expander("📦 Paquete de Auditoría ZIP", key="exp_zip")
+        with exp:
+            if exp.open:
+                audit_dir = OUTPUT_PATH / "release" / "audit"
             
-            if audit_dir.is_dir():
-                zip_files = [f for f in audit_dir.glob("*.zip")]
+                if audit_dir.is_dir():
+                    zip_files = [f for f in audit_dir.glob("*.zip")]
                 
-                if zip_files:
-                    st.success("✅ Paquete de Auditoría ZIP generado. ¡Descarga para auditar!")
+                    if zip_files:
+                        st.success("✅ Paquete de Auditoría ZIP generado. ¡Descarga para auditar!")
                     
-                    for zip_file_path in zip_files:
-                        try:
-                            # Leer el contenido del archivo como bytes (esencial para ZIPs)
-                            zip_bytes = zip_file_path.read_bytes()
-                            
-                            # Crear el botón de descarga para Streamlit
-                            st.download_button(
-                                label=f"⬇️ Descargar: {zip_file_path.name}",
-                                data=zip_bytes,
-                                file_name=zip_file_path.name,
-                                mime="application/zip",
-                                key=zip_file_path.name
-                            )
-                        except Exception as e:
-                            st.error(f"Error al preparar la descarga de {zip_file_path.name}: {e}")
+                        for zip_file_path in zip_files:
+                            try:
+                                size = zip_file_path.stat().st_size
+                                # Descarga diferida: el ZIP solo se lee al pulsar el botón, y los
+                                # paquetes grandes se ofrecen en partes de DOWNLOAD_PART_BYTES
+                                n_parts = max(1, -(-size // DOWNLOAD_PART_BYTES))
+                                for part in range(n_parts):
+                                    suffix = f".part{part+1:03d}" if n_parts > 1 else ""
+                                    st.download_button(
+                                        label=f"⬇️ Descargar: {zip_file_path.name}{suffix}",
+                                        data=zip_part_reader(zip_file_path, part * DOWNLOAD_PART_BYTES, DOWNLOAD_PART_BYTES),
+                                        file_name=zip_file_path.name + suffix,
+                                        mime="application/zip",
+                                        key=zip_file_path.name + suffix
+                                    )
+                                if n_parts > 1:
+                                    st.caption(f"Paquete de {size/1e6:.0f} MB en {n_parts} partes: reúnelas con `cat {zip_file_path.name}.part* > {zip_file_path.name}`.")
+                            except Exception as e:
+                                st.error(f"Error al preparar la descarga de {zip_file_path.name}: {e}")
+                    else:
+                        st.info("El directorio de auditoría existe, pero aún no se ha generado el archivo ZIP (Ejecute el Paso 8).")
                 else:
-                    st.info("El directorio de auditoría existe, pero aún no se ha generado el archivo ZIP (Ejecute el Paso 8).")
-            else:
-                 st.warning("El directorio 'release/audit' aún no ha sido creado. Ejecute los pasos del pipeline.")
+                     st.warning("El directorio 'release/audit' aún no ha sido creado. Ejecute los pasos del pipeline.")
 
 
 # Ejecutar la aplicación principal
@@ -0,0 +1,244 @@
+"""
+Acuerdo entre revisores (HITL) vectorizado con NumPy.
+
+- Etiquetas codificadas como matriz ítems × revisores (int8, -1 = sin etiqueta).
+- AgreementStats: estadísticos suficientes y fusionables (como DDSketch en slo_store):
+    · tensor de confusión R×R×K×K → κ de Cohen de todos los pares en una pasada
+      (cada par sobre los ítems que ambos etiquetaron)
+    · sumas por ítem para κ de Fleiss con número variable de revisores
+    · matriz de coincidencias para α de Krippendorff (nominal u ordinal)
+  add() acepta bloques de filas: el log de revisiones se procesa por trozos y,
+  con update(), solo las filas nuevas desde la última ejecución.
+- bootstrap(): IC por remuestreo de ítems con pesos (multinomial → bincount),
+  en paralelo por lotes; cada réplica es un producto de matrices.
+"""
+import csv, json, os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+MISSING = -1
+CHUNK_ROWS = 5000
+BOOT_BATCH = 25
+WORKERS = int(os.environ.get("STEELTRACE_BOOT_WORKERS", os.cpu_count() or 4))
+
+def encode(rows: list[list[str]], mapping: dict[str, int]) -> np.ndarray:
+    """Filas de etiquetas (una columna por revisor) → int8; vacías o desconocidas = MISSING."""
+    norm = {k.strip().lower(): v for k, v in mapping.items()}
+    return np.array([[norm.get(c.strip().lower(), MISSING) for c in r] for r in rows],
+                    dtype=np.int8).reshape(len(rows), -1)
+
+def one_hot(labels: np.ndarray, k: int) -> np.ndarray:
+    """ítems × revisores × K (float64); los ausentes quedan a cero."""
+    x = np.zeros((*labels.shape, k))
+    i, r = np.nonzero(labels != MISSING)
+    x[i, r, labels[i, r]] = 1.0
+    return x
+
+def prepare(labels: np.ndarray, k: int) -> tuple:
+    """Términos por ítem reutilizables entre réplicas: one-hot aplanado, recuentos N, ítems válidos, 1/(n-1), P_i."""
+    x = one_hot(labels, k)
+    counts = x.sum(axis=1)
+    n = counts.sum(axis=1)
+    valid = n >= 2
+    inv = np.divide(1.0, n - 1, out=np.zeros_like(n), where=valid)
+    p_item = np.divide((counts ** 2).sum(axis=1) - n, n * (n - 1), out=np.zeros_like(n), where=valid)
+    return x.reshape(len(labels), -1), counts, valid.astype(float), inv, p_item
+
+class AgreementStats:
+    def __init__(self, n_raters: int, k: int):
+        self.r, self.k = n_raters, k
+        self.confusion = np.zeros((n_raters * k, n_raters * k))   # (r,k) × (s,l)
+        self.fleiss_p = 0.0          # Σ P_i sobre ítems con ≥2 etiquetas
+        self.fleiss_items = 0.0
+        self.fleiss_cats = np.zeros(k)
+        self.coincidence = np.zeros((k, k))
+        self.items = 0
+
+    def add(self, labels: np.ndarray, weights: np.ndarray | None = None) -> "AgreementStats":
+        return self.add_prepared(prepare(labels, self.k), weights)
+
+    def add_prepared(self, prep: tuple, weights: np.ndarray | None = None) -> "AgreementStats":
+        flat, counts, valid, inv, p_item = prep
+        w = np.ones(len(flat)) if weights is None else weights
+        self.confusion += flat.T @ (flat * w[:, None])
+        self.fleiss_p += float(w @ p_item)
+        self.fleiss_items += float(w @ valid)
+        self.fleiss_cats += (w * valid) @ counts
+        wc = counts * (w * inv)[:, None]
+        self.coincidence += wc.T @ counts - np.diag(wc.sum(axis=0))
+        self.items += int(w.sum())
+        return self
+
+    def merge(self, other: "AgreementStats") -> "AgreementStats":
+        self.confusion += other.confusion
+        self.fleiss_p += other.fleiss_p
+        self.fleiss_items += other.fleiss_items
+        self.fleiss_cats += other.fleiss_cats
+        self.coincidence += other.coincidence
+        self.items += other.items
+        return self
+
+    def cohen_matrix(self) -> np.ndarray:
+        """κ de Cohen R×R (NaN en la diagonal y en pares sin ítems comunes)."""
+        c = self.confusion.reshape(self.r, self.k, self.r, self.k).transpose(0, 2, 1, 3)
+        n = c.sum(axis=(2, 3))
+        po = np.einsum("rskk->rs", c)
+        pe = np.einsum("rsk,rsk->rs", c.sum(axis=3), c.sum(axis=2))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            po, pe = po / n, pe / (n * n)
+            kappa = np.where(pe < 1, (po - pe) / (1 - pe), 1.0)   # una sola etiqueta común → acuerdo total
+        kappa[n == 0] = np.nan
+        np.fill_diagonal(kappa, np.nan)
+        return kappa
+
+    def fleiss(self) -> float:
+        total = self.fleiss_cats.sum()
+        if not self.fleiss_items or not total:
+            return float("nan")
+        p_bar = self.fleiss_p / self.fleiss_items
+        p_e = float(((self.fleiss_cats / total) ** 2).sum())
+        return 1.0 if p_e == 1 else (p_bar - p_e) / (1 - p_e)
+
+    def alpha(self, metric: str = "nominal") -> float:
+        o = self.coincidence
+        nk = o.sum(axis=1)
+        n = nk.sum()
+        if n <= 1:
+            return float("nan")
+        d = _distance(nk, metric)
+        expected = (np.outer(nk, nk) * d).sum()
+        return 1.0 if expected == 0 else float(1 - (n - 1) * (o * d).sum() / expected)
+
+    def to_dict(self) -> dict:
+        return {"raters": self.r, "k": self.k, "items": self.items,
+                "confusion": self.confusion.tolist(), "fleiss_p": self.fleiss_p,
+                "fleiss_items": self.fleiss_items, "fleiss_cats": self.fleiss_cats.tolist(),
+                "coincidence": self.coincidence.tolist()}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "AgreementStats":
+        s = cls(d["raters"], d["k"])
+        s.items = d["items"]
+        s.confusion = np.array(d["confusion"], dtype=float).reshape(s.confusion.shape)
+        s.fleiss_p, s.fleiss_items = d["fleiss_p"], d["fleiss_items"]
+        s.fleiss_cats = np.array(d["fleiss_cats"], dtype=float)
+        s.coincidence = np.array(d["coincidence"], dtype=float)
+        return s
+
+def _distance(nk: np.ndarray, metric: str) -> np.ndarray:
+    k = len(nk)
+    if metric == "nominal":
+        return 1.0 - np.eye(k)
+    if metric == "ordinal":
+        # δ²_kl = (Σ_{g=k..l} n_g − (n_k + n_l)/2)²
+        cum = np.concatenate([[0.0], np.cumsum(nk)])
+        lo, hi = np.minimum.outer(np.arange(k), np.arange(k)), np.maximum.outer(np.arange(k), np.arange(k))
+        return (cum[hi + 1] - cum[lo] - (nk[:, None] + nk[None, :]) / 2) ** 2
+    raise ValueError(f"métrica no soportada: {metric}")
+
+def mean_kappa(kappa: np.ndarray) -> float:
+    upper = kappa[np.triu_indices_from(kappa, k=1)]
+    upper = upper[~np.isnan(upper)]
+    return float(upper.mean()) if upper.size else float("nan")
+
+def summary(stats: AgreementStats, metric: str = "nominal") -> dict:
+    kappa = stats.cohen_matrix()
+    return {"kappa_mean": mean_kappa(kappa), "fleiss_kappa": stats.fleiss(),
+            "krippendorff_alpha": stats.alpha(metric)}
+
+def _boot_batch(prep: tuple, r: int, k: int, reps: int, seed, metric: str) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    n = len(prep[0])
+    out = []
+    for _ in range(reps):
+        w = np.bincount(rng.integers(0, n, n), minlength=n).astype(float)
+        out.append(summary(AgreementStats(r, k).add_prepared(prep, w), metric))
+    return out
+
+def bootstrap(labels: np.ndarray, k: int, n_boot: int = 200, seed: int = 0, metric: str = "nominal",
+              level: float = 0.95, workers: int = WORKERS) -> dict[str, list[float] | None]:
+    """IC percentil por remuestreo de ítems; los lotes de réplicas se reparten entre hilos (BLAS libera el GIL)."""
+    if not len(labels) or n_boot <= 0:
+        return {}
+    prep = prepare(labels, k)
+    sizes = [min(BOOT_BATCH, n_boot - i) for i in range(0, n_boot, BOOT_BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        batches = pool.map(lambda a: _boot_batch(prep, labels.shape[1], k, *a, metric), zip(sizes, seeds))
+        reps = [r for batch in batches for r in batch]
+    tail = (1 - level) / 2 * 100
+    out = {}
+    for key in reps[0]:
+        v = np.array([r[key] for r in reps])
+        v = v[~np.isnan(v)]
+        out[key] = [round(float(x), 4) for x in np.percentile(v, [tail, 100 - tail])] if v.size else None
+    return out
+
+# -------- Lectura incremental del log de revisiones --------
+
+def read_chunks(path: Path, offset: int = 0, chunk_rows: int = CHUNK_ROWS):
+    """Filas completas (terminadas en salto de línea) desde `offset`, por bloques: (filas, offset_siguiente)."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            lines = []
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break    # línea a medio escribir: se procesará en la siguiente actualización
+                lines.append(raw.decode("utf-8"))
+                offset += len(raw)
+                if len(lines) >= chunk_rows:
+                    break
+            if not lines:
+                return
+            yield [r for r in csv.reader(lines) if r], offset
+            if len(lines) < chunk_rows:
+                return
+
+def update(csv_path: Path, state_path: Path, labels_path: Path, mapping: dict[str, int],
+           id_column: str = "dp_id") -> tuple[AgreementStats, np.ndarray, list[str]]:
+    """Incorpora al estado las filas nuevas del CSV; si cambia la cabecera o el archivo se trunca, reconstruye."""
+    k = max(mapping.values()) + 1
+    with open(csv_path, "rb") as f:
+        header_line = f.readline()
+    header = next(csv.reader([header_line.decode("utf-8")]), [])   # mismo parser que las filas (comillas)
+    raters = [h for h in header if h != id_column]
+    cols = [i for i, h in enumerate(header) if h != id_column]
+    state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else None
+    fresh = (state is None or state["header"] != header or state["offset"] > csv_path.stat().st_size
+             or not labels_path.exists())
+    if fresh:
+        stats, offset, blocks = AgreementStats(len(raters), k), len(header_line), []
+    else:
+        stats, offset, blocks = AgreementStats.from_dict(state["stats"]), state["offset"], [np.load(labels_path)]
+    for rows, offset in read_chunks(csv_path, offset):
+        block = encode([[r[i] if i < len(r) else "" for i in cols] for r in rows], mapping)
+        stats.add(block)
+        blocks.append(block)
+    labels = np.concatenate(blocks) if blocks else np.empty((0, len(raters)), dtype=np.int8)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(labels_path, labels)
+    state_path.write_text(json.dumps({"header": header, "offset": offset, "stats": stats.to_dict()}))
+    return stats, labels, raters
+
+if __name__ == "__main__":
+    # comprobación con ejemplos calculados a mano: python scripts/agreement.py
+    import tempfile
+    # Cohen: 50 ítems, 2 revisores; sí/sí 20, sí/no 5, no/sí 10, no/no 15 → po 0.7, pe 0.5, κ 0.4
+    pairs = [[0, 0]] * 20 + [[0, 1]] * 5 + [[1, 0]] * 10 + [[1, 1]] * 15
+    k2 = AgreementStats(2, 2).add(np.array(pairs, dtype=np.int8)).cohen_matrix()
+    assert abs(k2[0, 1] - 0.4) < 1e-9, k2
+    # Fleiss (1971), 10 ítems × 14 revisores × 5 categorías → κ = 0.20993
+    counts = [[0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+              [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7]]
+    labels = np.array([[c for c, m in enumerate(row) for _ in range(m)] for row in counts], dtype=np.int8)
+    fk = AgreementStats(14, 5).add(labels).fleiss()
+    assert abs(fk - 0.20993) < 1e-4, fk
+    # cabecera con comillas: se parsea igual que las filas
+    with tempfile.TemporaryDirectory() as d:
+        p = Path(d) / "reviews.csv"
+        p.write_text('dp_id,"Pérez, A",B\nx,yes,yes\ny,no,yes\n', encoding="utf-8")
+        stats, lab, raters = update(p, Path(d) / "state.json", Path(d) / "labels.npy", {"yes": 0, "no": 1})
+        assert raters == ["Pérez, A", "B"] and lab.tolist() == [[0, 0], [1, 0]], (raters, lab)
+    print("agreement OK: κ Cohen 0.4, κ Fleiss %.5f" % fk)
@@ -0,0 +1,332 @@
+"""
+Conectores asyncio para las fuentes de mcp_ingest (ERP, HR, GRC).
+
+Configuración en ops/sources.yaml: un bloque por source_system con su tipo de conector
+y las entidades (dominios de dq_rules) que expone. Tipos registrados:
+
+  file    → JSON local (los data/samples actuales), paginado en memoria
+  http    → API paginada GET <url>/<entidad>?page=N&page_size=M → {"records": [...], "next_page": N+1 | null,
+            "pages": total?}; cliente HTTP/1.1 keep-alive con pool de conexiones (como TSAClient en tsa.py);
+            si la API informa del total, las páginas se piden en paralelo (hasta pool_size)
+  sqlite  → tabla con paginación por rowid; pool de conexiones usadas desde hilos
+
+extract() lanza una tarea por (fuente, entidad); cada conector limita sus peticiones
+en vuelo con su pool y las páginas pasan por una cola acotada (backpressure) hacia el
+consumidor, que valida en un hilo (fuera del bucle de eventos) mientras siguen llegando
+páginas de otras fuentes.
+
+Stand-ins locales para pruebas: serve_http() publica un directorio de JSON o una base
+SQLite como API paginada; make_sqlite() crea una tabla a partir de registros.
+"""
+import asyncio, json, sqlite3, sys, time
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+SOURCES_FILE = Path("ops/sources.yaml")
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_POOL_SIZE = 4
+QUEUE_PAGES = 16          # páginas en cola antes de frenar a los extractores
+CONNECTORS: dict[str, type] = {}
+
+def register(kind: str):
+    def deco(cls):
+        CONNECTORS[kind] = cls
+        return cls
+    return deco
+
+class Connector(ABC):
+    """Base: pages(entity) produce listas de registros; uri(entity) identifica el origen en el linaje."""
+
+    def __init__(self, system: str, cfg: dict):
+        self.system = system
+        self.cfg = cfg
+        self.page_size = int(cfg.get("page_size", DEFAULT_PAGE_SIZE))
+        self.pool_size = int(cfg.get("pool_size", DEFAULT_POOL_SIZE))
+
+    @abstractmethod
+    def uri(self, entity: str) -> str: ...
+
+    @abstractmethod
+    def pages(self, entity: str) -> AsyncIterator[list[dict]]:
+        """Generador asíncrono de páginas (listas de registros) de la entidad."""
+
+    async def close(self):
+        pass
+
+@register("file")
+class FileConnector(Connector):
+    def path(self, entity: str) -> Path:
+        return Path(self.cfg["entities"][entity])
+
+    def uri(self, entity: str) -> str:
+        return str(self.path(entity))
+
+    async def pages(self, entity: str):
+        records = json.loads(await asyncio.to_thread(self.path(entity).read_text, encoding="utf-8"))
+        if not isinstance(records, list):
+            raise ValueError(f"{self.path(entity)} debe ser una lista de objetos JSON")
+        for i in range(0, len(records), self.page_size):
+            yield records[i:i + self.page_size]
+
+class HTTPError(Exception):
+    pass
+
+@register("http")
+class HTTPConnector(Connector):
+    def __init__(self, system: str, cfg: dict):
+        super().__init__(system, cfg)
+        u = urlsplit(cfg["url"].rstrip("/"))
+        self.host, self.port, self.prefix = u.hostname, u.port or 80, u.path
+        self._pool: asyncio.Queue | None = None
+        self._open = 0
+
+    def uri(self, entity: str) -> str:
+        return f"{self.cfg['url'].rstrip('/')}/{self.cfg['entities'].get(entity, entity)}"
+
+    async def _acquire(self):
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+        if self._pool.empty() and self._open < self.pool_size:
+            self._open += 1   # se reserva antes del await; se devuelve si la conexión falla
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except BaseException:
+                self._open -= 1
+                raise
+        return await self._pool.get()
+
+    async def get_json(self, path: str) -> dict:
+        reader, writer = await self._acquire()
+        ok = False
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n\r\n".encode())
+            await writer.drain()
+            status = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                k, _, v = line.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            if len(status) < 2 or status[1] != "200":
+                raise HTTPError(f"{self.system} GET {path}: HTTP {' '.join(status[1:]).strip()}")
+            ok = headers.get("connection", "").lower() != "close"
+            return json.loads(body)
+        finally:
+            if ok:
+                self._pool.put_nowait((reader, writer))
+            else:
+                self._open -= 1
+                writer.close()
+
+    async def pages(self, entity: str):
+        path = f"{self.prefix}/{self.cfg['entities'].get(entity, entity)}"
+        url = lambda p: f"{path}?page={p}&page_size={self.page_size}"
+        first = await self.get_json(url(0))
+        yield first["records"]
+        total = first.get("pages")
+        if total is None:
+            # sin total conocido: se sigue next_page de forma secuencial
+            page = first.get("next_page")
+            while page is not None:
+                data = await self.get_json(url(page))
+                yield data["records"]
+                page = data.get("next_page")
+            return
+        # total conocido: hasta pool_size páginas en vuelo, entregadas en orden
+        inflight: dict[int, asyncio.Task] = {}
+        nxt = 1
+        try:
+            for p in range(1, total):
+                while nxt < total and len(inflight) < self.pool_size:
+                    inflight[nxt] = asyncio.create_task(self.get_json(url(nxt)))
+                    nxt += 1
+                yield (await inflight.pop(p))["records"]
+        finally:
+            for t in inflight.values():
+                t.cancel()
+
+    async def close(self):
+        while self._pool is not None and not self._pool.empty():
+            _, writer = self._pool.get_nowait()
+            writer.close()
+        self._open = 0
+
+@register("sqlite")
+class SQLiteConnector(Connector):
+    def __init__(self, system: str, cfg: dict):
+        super().__init__(system, cfg)
+        self._pool: asyncio.Queue | None = None
+        self._open = 0
+
+    def uri(self, entity: str) -> str:
+        return f"sqlite:///{self.cfg['path']}#{self.cfg['entities'].get(entity, entity)}"
+
+    async def _acquire(self) -> sqlite3.Connection:
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+        if self._pool.empty() and self._open < self.pool_size:
+            uri = f"file:{Path(self.cfg['path']).resolve()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._open += 1
+            return conn
+        return await self._pool.get()
+
+    @staticmethod
+    def _fetch(conn: sqlite3.Connection, table: str, after: int, limit: int) -> tuple[list[str], list[tuple]]:
+        # paginación por rowid (keyset): coste constante por página, sin OFFSET
+        cur = conn.execute(f'SELECT rowid, * FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?', (after, limit))
+        return [d[0] for d in cur.description[1:]], cur.fetchall()
+
+    async def pages(self, entity: str):
+        table = self.cfg["entities"].get(entity, entity)
+        after = 0
+        while True:
+            conn = await self._acquire()
+            try:
+                cols, rows = await asyncio.to_thread(self._fetch, conn, table, after, self.page_size)
+            finally:
+                self._pool.put_nowait(conn)
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield [_decode_row(dict(zip(cols, r[1:]))) for r in rows]
+            if len(rows) < self.page_size:
+                return
+
+    async def close(self):
+        while self._pool is not None and not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._open = 0
+
+def _decode_row(row: dict) -> dict:
+    # columnas JSON (listas/objetos serializados) vuelven a su forma original; NULL → clave ausente
+    out = {}
+    for k, v in row.items():
+        if v is None:
+            continue
+        if isinstance(v, str) and v[:1] in "[{":
+            try:
+                v = json.loads(v)
+            except ValueError:
+                pass
+        out[k] = v
+    return out
+
+# -------- Extracción concurrente --------
+def load_sources(path: Path = SOURCES_FILE) -> dict[str, Connector]:
+    import yaml
+    cfg = yaml.safe_load(path.read_text(encoding="utf-8"))["sources"]
+    out = {}
+    for system, c in cfg.items():
+        if c.get("kind") not in CONNECTORS:
+            raise ValueError(f"{system}: conector desconocido {c.get('kind')!r} (hay: {sorted(CONNECTORS)})")
+        out[system] = CONNECTORS[c["kind"]](system, c)
+    return out
+
+async def extract(sources: dict[str, Connector], on_page, queue_pages: int = QUEUE_PAGES) -> dict:
+    """
+    Extrae todas las (fuente, entidad) en paralelo y llama a on_page(system, entity, page_no, records)
+    según llegan las páginas, de una en una y en un hilo: el bucle sigue atendiendo las descargas
+    de las demás fuentes mientras se valida. Devuelve tiempos por flujo y el tiempo total
+    (acotado por el más lento).
+    """
+    q: asyncio.Queue = asyncio.Queue(maxsize=queue_pages)
+    timings: dict[str, float] = {}
+    done = object()
+
+    async def pump(system: str, conn: Connector, entity: str):
+        t0 = time.perf_counter()
+        try:
+            n = 0
+            async for page in conn.pages(entity):
+                await q.put((system, entity, n, page))     # espera si el consumidor va por detrás
+                n += 1
+        finally:
+            timings[f"{system}/{entity}"] = round(time.perf_counter() - t0, 4)
+
+    t0 = time.perf_counter()
+    streams = [(s, c, e) for s, c in sources.items() for e in c.cfg["entities"]]
+    tasks = [asyncio.create_task(pump(*st)) for st in streams]
+    finisher = asyncio.create_task(_close_when_done(tasks, q, done))
+    try:
+        while (item := await q.get()) is not done:
+            await asyncio.to_thread(on_page, *item)
+        for t in tasks:
+            if t.done() and not t.cancelled() and t.exception() is not None:
+                raise t.exception()
+    finally:
+        for t in tasks:
+            t.cancel()
+        finisher.cancel()
+        await asyncio.gather(*tasks, finisher, return_exceptions=True)
+        await asyncio.gather(*(c.close() for c in sources.values()), return_exceptions=True)
+    return {"streams": timings, "wall_sec": round(time.perf_counter() - t0, 4),
+            "sum_stream_sec": round(sum(timings.values()), 4)}
+
+async def _close_when_done(tasks: list, q: asyncio.Queue, done):
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    await q.put(done)
+
+# -------- Stand-ins locales --------
+def make_sqlite(db: Path, table: str, records: list[dict]):
+    cols = sorted({k for r in records for k in r})
+    with sqlite3.connect(db) as conn:
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(f'CREATE TABLE "{table}" ({", ".join(f"{chr(34)}{c}{chr(34)}" for c in cols)})')
+        conn.executemany(f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(cols))})',
+                         [[json.dumps(r[c]) if isinstance(r.get(c), (list, dict)) else r.get(c) for c in cols]
+                          for r in records])
+
+async def serve_http(root: Path, host: str = "127.0.0.1", port: int = 8089, delay_sec: float = 0.0):
+    """API paginada sobre <root>/<entidad>.json o una base SQLite (root = *.sqlite); delay_sec simula latencia."""
+    root = Path(root)
+
+    def records_for(entity: str) -> list[dict]:
+        if root.suffix == ".sqlite":
+            with sqlite3.connect(root) as conn:
+                cur = conn.execute(f'SELECT * FROM "{entity}" ORDER BY rowid')
+                cols = [d[0] for d in cur.description]
+                return [_decode_row(dict(zip(cols, r))) for r in cur.fetchall()]
+        return json.loads((root / f"{entity}.json").read_text(encoding="utf-8"))
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                url = urlsplit(line.decode("latin-1").split(" ")[1])
+                qs = parse_qs(url.query)
+                page, size = int(qs.get("page", [0])[0]), int(qs.get("page_size", [DEFAULT_PAGE_SIZE])[0])
+                try:
+                    recs = records_for(url.path.rstrip("/").rsplit("/", 1)[-1])
+                    chunk = recs[page * size:(page + 1) * size]
+                    nxt = page + 1 if (page + 1) * size < len(recs) else None
+                    pages = max(1, -(-len(recs) // size))
+                    status, body = "200 OK", json.dumps({"records": chunk, "next_page": nxt, "pages": pages}).encode()
+                except (FileNotFoundError, sqlite3.OperationalError) as e:
+                    status, body = "404 Not Found", json.dumps({"error": str(e)}).encode()
+                if delay_sec:
+                    await asyncio.sleep(delay_sec)
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    # python scripts/connectors.py serve <dir|db.sqlite> [puerto] [retardo_s]  → API paginada local
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 8089
+        delay = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+        print(f"API de prueba en http://127.0.0.1:{port}/<entidad> ({sys.argv[2]})")
+        asyncio.run(serve_http(Path(sys.argv[2]), port=port, delay_sec=delay))
+    else:
+        print("Uso: python scripts/connectors.py serve <dir|db.sqlite> [puerto] [retardo_s]")
@@ -0,0 +1,247 @@
+"""
+Servicio de calidad de datos (DQ) en proceso para micro-lotes.
+
+    svc = DQService()                              # carga y compila contracts/dq_rules.yaml una vez
+    svc.score("energy", records)                   # → tasas del lote + latencia; actualiza contadores
+    svc.report()                                   # → tasas acumuladas y móviles (últimos ROLLING_BATCHES)
+
+- Cada regla del YAML se compila a un predicado Python; las comparaciones de
+  consistencia ("a <= b", "a <= b + 1000") se interpretan de forma genérica.
+- Contadores por regla: acumulados y ventana móvil por lotes (sumas incrementales).
+- Fuentes en streaming: consume() lee de una queue.Queue y serve() expone un
+  servidor JSON-lines por TCP (una línea = un micro-lote); el dominio se deduce de
+  source_system (erp_* → energy, hr_* → hr, grc_* → ethics) si no se indica.
+"""
+import asyncio, json, re, sys, threading, time
+from collections import deque
+from datetime import date
+from pathlib import Path
+
+DQ_RULES_FILE = Path("contracts/dq_rules.yaml")
+CATEGORIES = ["completeness", "validity", "consistency", "timeliness"]
+DQ_THRESHOLD = 0.95
+ROLLING_BATCHES = 100
+SOURCE_DOMAINS = {"erp": "energy", "hr": "hr", "grc": "ethics"}
+PORT = 3170
+
+_CMP = re.compile(r"^(\w+)\s*(<=|>=|==|<|>)\s*(\w+)(?:\s*([+-])\s*(\d+(?:\.\d+)?))?$")
+_ARG = re.compile(r"^(\w+)\('([^']*)'\)$")
+_OPS = {"<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b, "==": lambda a, b: a == b,
+        "<": lambda a, b: a < b, ">": lambda a, b: a > b}
+
+# -------- Predicados --------
+def is_date_iso(s) -> bool:
+    if not isinstance(s, str) or len(s) != 10 or s[4] != "-" or s[7] != "-":
+        return False
+    try:
+        date.fromisoformat(s)
+        return True
+    except ValueError:
+        return False
+
+def is_yyyy_mm(s) -> bool:
+    return isinstance(s, str) and bool(re.fullmatch(r"\d{4}-\d{2}", s))
+
+def _number(v) -> float | None:
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def _compare(row: dict, left: str, op, right: str, offset: float) -> bool:
+    # numérico (campo ausente = 0, como en la versión original; presente pero None no cumple)
+    # o, si no, fechas ISO
+    a, b = row.get(left, 0), row.get(right, 0)
+    na, nb = _number(a), _number(b)
+    if na is not None and nb is not None:
+        return op(na, nb + offset)
+    if offset == 0 and is_date_iso(a) and is_date_iso(b):
+        return op(a, b)   # YYYY-MM-DD válido: el orden lexicográfico es el cronológico
+    return False
+
+def compile_rule(rule: dict):
+    """Regla del YAML → predicado row -> bool. Las reglas desconocidas pasan (compatibilidad) y se anotan."""
+    name, field = rule.get("rule", ""), rule.get("field")
+    if name == "not_null":
+        return lambda row: row.get(field) is not None, True
+    if name == "is_date":
+        return lambda row: is_date_iso(row.get(field)), True
+    if name == "is_yyyy_mm":
+        return lambda row: is_yyyy_mm(row.get(field)), True
+    if name == ">=0":
+        def non_negative(row):
+            v = _number(row.get(field))
+            return v is not None and v >= 0
+        return non_negative, True
+    m = _ARG.match(name)
+    if m and m.group(1) == "within_month":
+        month = m.group(2)
+        return lambda row: str(row.get(field, "")).startswith(month), True
+    if m and m.group(1) == "equals":
+        ref = m.group(2)
+        return lambda row: str(row.get(field, "")) == ref, True
+    m = _CMP.match(name)
+    if m:
+        left, op, right, sign, num = m.groups()
+        offset = float(num or 0) * (-1 if sign == "-" else 1)
+        return lambda row: _compare(row, left, _OPS[op], right, offset), True
+    return lambda row: True, False
+
+class _Rule:
+    __slots__ = ("domain", "category", "spec", "check", "known", "passed", "total")
+
+    def __init__(self, domain: str, category: str, spec: dict):
+        self.domain, self.category, self.spec = domain, category, spec
+        self.check, self.known = compile_rule(spec)
+        self.passed = self.total = 0
+
+# -------- Servicio --------
+class DQService:
+    def __init__(self, rules_path: Path | str = DQ_RULES_FILE, rolling_batches: int = ROLLING_BATCHES):
+        import yaml
+        self.rules_path = Path(rules_path)
+        self.spec = yaml.safe_load(self.rules_path.read_text(encoding="utf-8")) or {}
+        self.rules: dict[str, list[_Rule]] = {
+            dom: [_Rule(dom, cat, r) for cat in CATEGORIES for r in (cfg or {}).get(cat, [])]
+            for dom, cfg in self.spec.items()}
+        self.unknown = [f"{r.domain}.{r.category}: {r.spec.get('rule')}" for rs in self.rules.values()
+                        for r in rs if not r.known]
+        self.rolling_batches = rolling_batches
+        self.window = {dom: deque() for dom in self.rules}
+        self.rolling = {dom: [[0, 0] for _ in rs] for dom, rs in self.rules.items()}
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def domain_for(self, source_system: str) -> str | None:
+        return SOURCE_DOMAINS.get(str(source_system).split("_")[0].lower())
+
+    def _counts(self, domain: str, records: list[dict]) -> list[int]:
+        return [sum(1 for row in records if r.check(row)) for r in self.rules.get(domain, [])]
+
+    def evaluate(self, records: list[dict], domain: str) -> dict:
+        """Evaluación sin estado (formato del dq_report de mcp_ingest: by_rule + aggregate)."""
+        total = max(1, len(records))
+        res = {c: [] for c in CATEGORIES}
+        for r, passed in zip(self.rules.get(domain, []), self._counts(domain, records)):
+            res[r.category].append({"rule": r.spec, "pass_rate": passed / total})
+        return {"by_rule": res, "aggregate": _aggregate(res)}
+
+    def record_scores(self, records: list[dict], domain: str) -> dict[str, list[float]]:
+        """Por categoría, fracción de reglas que cumple cada registro: su media es el agregado
+        de evaluate(); preview.py la usa como variable por registro para estimar con IC."""
+        out = {}
+        for c in CATEGORIES:
+            rules = [r for r in self.rules.get(domain, []) if r.category == c]
+            out[c] = [sum(r.check(row) for r in rules) / len(rules) if rules else 1.0 for row in records]
+        return out
+
+    def score(self, domain: str | None, records: list[dict]) -> dict:
+        """Puntúa un micro-lote y actualiza los contadores acumulados y móviles del dominio."""
+        t0 = time.perf_counter()
+        if domain is None:
+            return self._score_mixed(records, t0)
+        if domain not in self.rules:
+            raise KeyError(f"Dominio sin reglas DQ: {domain}")
+        counts = self._counts(domain, records)
+        n = len(records)
+        with self.lock:
+            win, roll = self.window[domain], self.rolling[domain]
+            for r, p, acc in zip(self.rules[domain], counts, roll):
+                r.passed += p
+                r.total += n
+                acc[0] += p
+                acc[1] += n
+            win.append((counts, n))
+            if len(win) > self.rolling_batches:
+                old, old_n = win.popleft()
+                for p, acc in zip(old, roll):
+                    acc[0] -= p
+                    acc[1] -= old_n
+            self.batches += 1
+        res = {c: [] for c in CATEGORIES}
+        for r, p in zip(self.rules[domain], counts):
+            res[r.category].append({"rule": r.spec, "pass_rate": p / max(1, n)})
+        return {"domain": domain, "records": n, "aggregate": _aggregate(res), "by_rule": res,
+                "latency_ms": round((time.perf_counter() - t0) * 1000, 4)}
+
+    def _score_mixed(self, records: list[dict], t0: float) -> dict:
+        # lote de varias fuentes: se reparte por source_system; un registro sin dominio DQ
+        # se rechaza (índice en el lote) sin tumbar el resto
+        groups: dict[str, list] = {}
+        rejected = []
+        for i, row in enumerate(records):
+            dom = self.domain_for(row.get("source_system", ""))
+            if dom not in self.rules:
+                rejected.append({"index": i, "error": f"source_system sin dominio DQ: {row.get('source_system')}"})
+                continue
+            groups.setdefault(dom, []).append(row)
+        parts = {dom: self.score(dom, rows) for dom, rows in groups.items()}
+        return {"domains": parts, "records": len(records), "rejected": rejected,
+                "latency_ms": round((time.perf_counter() - t0) * 1000, 4)}
+
+    def report(self, domain: str | None = None) -> dict:
+        """Tasas por regla y agregados: acumulado desde el arranque y ventana móvil de lotes."""
+        out = {}
+        with self.lock:
+            for dom in ([domain] if domain else self.rules):
+                cum = {c: [] for c in CATEGORIES}
+                roll = {c: [] for c in CATEGORIES}
+                for r, (rp, rn) in zip(self.rules[dom], self.rolling[dom]):
+                    cum[r.category].append({"rule": r.spec, "pass_rate": r.passed / max(1, r.total)})
+                    roll[r.category].append({"rule": r.spec, "pass_rate": rp / max(1, rn)})
+                records = self.rules[dom][0].total if self.rules[dom] else 0
+                out[dom] = {"records": records, "batches_in_window": len(self.window[dom]),
+                            "cumulative": _aggregate(cum), "rolling": _aggregate(roll), "by_rule": cum}
+        return out
+
+def _aggregate(res: dict) -> dict:
+    agg = {k: (sum(x["pass_rate"] for x in v) / len(v)) if v else 1.0 for k, v in res.items()}
+    agg["dq_pass"] = all(v >= DQ_THRESHOLD for v in agg.values())
+    return agg
+
+# -------- Fuentes en streaming (stand-ins locales de los feeds ERP/HR/GRC) --------
+def consume(service: DQService, q, on_result=None):
+    """Bucle sobre una queue.Queue de micro-lotes {"domain"?, "records"}; None termina."""
+    while True:
+        msg = q.get()
+        if msg is None:
+            return
+        res = service.score(msg.get("domain"), msg["records"])
+        if on_result:
+            on_result(res)
+
+async def _handle(service: DQService, reader, writer):
+    try:
+        while line := await reader.readline():
+            try:
+                msg = json.loads(line)
+                if msg.get("op") == "report":
+                    out = service.report(msg.get("domain"))
+                else:
+                    out = service.score(msg.get("domain"), msg["records"])
+            except (ValueError, KeyError) as e:
+                out = {"error": str(e.args[0]) if e.args else str(e)}
+            writer.write((json.dumps(out) + "\n").encode("utf-8"))
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(host: str = "127.0.0.1", port: int = PORT, rules_path: Path | str = DQ_RULES_FILE):
+    service = DQService(rules_path)
+    server = await asyncio.start_server(lambda r, w: _handle(service, r, w), host, port)
+    print(f"DQ service en {host}:{port} ({sum(len(v) for v in service.rules.values())} reglas)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    # python scripts/dq_service.py serve [puerto]  → servidor JSON-lines
+    # python scripts/dq_service.py score <dominio> <archivo.json>
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        asyncio.run(serve(port=int(sys.argv[2]) if len(sys.argv) > 2 else PORT))
+    elif len(sys.argv) == 4 and sys.argv[1] == "score":
+        svc = DQService()
+        print(json.dumps(svc.score(sys.argv[2], json.loads(Path(sys.argv[3]).read_text(encoding="utf-8"))), indent=2))
+    else:
+        print("Uso: python scripts/dq_service.py serve [puerto] | score <dominio> <archivo.json>")
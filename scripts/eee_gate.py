@@ -1,11 +1,21 @@
-import json, re
+import inspect, json, re
 from pathlib import Path
+import numpy as np
 from datetime import datetime
+from tracing import stage, span
+from kpi_state import dirty_dps
+import materiality
+import latency
+from utils_hash import sha256_json
 
 CFG = Path("ops/eee_gate.yaml")
 KPIS = Path("raga/kpis.json")
 EXPL = Path("raga/explain.json")
 VAL  = Path("ontology/validation.log")
+REPORT = Path("ops/gate_report.json")
+RULES = Path("raga/rules.yaml")
+EPISTEMIC_SCORES = np.array([1.0, 0.7, 0.3])   # residual ≤ low, ≤ medium, > medium
+MIN_SAMPLED_CONFORMANCE = 0.95
 
 def load_yaml(p: Path):
     import yaml
@@ -20,13 +30,13 @@ def evidence_component(cfg) -> tuple[float, dict]:
     comp = ok / max(1, len(arts))
     return comp, {"artifacts_present": ok, "artifacts_total": len(arts)}
 
-def explicit_component(explain: dict) -> tuple[float, dict]:
+def explicit_component(explain: dict, reuse: dict | None = None) -> tuple[float, dict]:
     """
     mide completitud de explicaciones:
       - hipótesis presente
       - lista de evidencias no vacía
       - cita RAG disponible
-    score = media sobre todos los DP
+    score = media sobre todos los DP (los de `reuse` vienen del informe anterior)
     """
     dps = list(explain.keys())
     if not dps:
@@ -34,6 +44,10 @@ def explicit_component(explain: dict) -> tuple[float, dict]:
     scores = []
     details = []
     for dp, ex in explain.items():
+        if reuse and dp in reuse:
+            scores.append(reuse[dp]["score"])
+            details.append(reuse[dp])
+            continue
         hyp = 1.0 if ex.get("hypothesis") else 0.0
         ev  = 1.0 if ex.get("evidence") else 0.0
         cit = 1.0 if ex.get("citations") else 0.0
@@ -42,50 +56,106 @@ def explicit_component(explain: dict) -> tuple[float, dict]:
         details.append({"dp": dp, "hyp": hyp, "ev": ev, "cit": cit, "score": s})
     return sum(scores)/len(scores), {"details": details}
 
-def epistemic_component(explain: dict) -> tuple[float, dict]:
+def residual_bands(path: Path = RULES) -> tuple[float, float]:
+    r = load_yaml(path).get("residuals", {})
+    return float(r.get("low", 0.01)), float(r.get("medium", 0.05))
+
+def epistemic_component(explain: dict, reuse: dict | None = None, bands: tuple[float, float] | None = None) -> tuple[float, dict]:
     """
-    heurística epistémica simple basada en 'residual' ∈ [0,1]:
-      residual <= 0.01 → 1.0
-      0.01 < residual <= 0.05 → 0.7
-      > 0.05 → 0.3
-    score = media sobre DPs
+    epistémica a partir de 'residual' ∈ [0,1] (semiamplitud relativa del IC propagado,
+    raga_compute/uncertainty.py) y las bandas `residuals` de raga/rules.yaml:
+      residual <= low → 1.0
+      low < residual <= medium → 0.7
+      > medium → 0.3
+    score = media sobre DPs (los de `reuse` vienen del informe anterior)
     """
     dps = list(explain.keys())
     if not dps:
         return 0.0, {"details":[]}
-    m = []
-    details = []
-    for dp, ex in explain.items():
-        r = float(ex.get("residual", 1.0))
-        if r <= 0.01: s = 1.0
-        elif r <= 0.05: s = 0.7
-        else: s = 0.3
-        m.append(s)
-        details.append({"dp": dp, "residual": r, "score": s})
-    return sum(m)/len(m), {"details": details}
+    low, medium = bands or residual_bands()
+    fresh = [dp for dp in dps if not (reuse and dp in reuse)]
+    res = np.array([float(explain[dp].get("residual", 1.0)) for dp in fresh])
+    scores = EPISTEMIC_SCORES[np.digitize(res, [low, medium], right=True)]
+    new = {dp: {"dp": dp, "residual": float(r), "score": float(s),
+                "ci95": explain[dp].get("uncertainty", {}).get("ci95")}
+           for dp, r, s in zip(fresh, res, scores)}
+    details = [new[dp] if dp in new else reuse[dp] for dp in dps]
+    return sum(d["score"] for d in details) / len(details), {"bands": {"low": low, "medium": medium}, "details": details}
 
 def decision(score: float, th: float) -> str:
     if score >= th: return "publish"
     if score >= (th - 0.1): return "review"
     return "block"
 
-def main():
-    cfg = load_yaml(CFG)
-    th  = cfg["eee_gate"]["threshold_score"]
-    w   = cfg["eee_gate"]["weights"]
+def latency_component(cfg) -> tuple[float, dict]:
+    """
+    presupuestos de latencia (ver latency.py):
+      score = fracción de etapas dentro de presupuesto; 0 si el
+      time-to-evidence proyectado supera max_time_to_evidence_sec
+    """
+    meta = latency.evaluate(cfg["eee_gate"])
+    return meta["score"], meta
+
+def cap_decision(dec: str, lat_meta: dict) -> str:
+    # con cualquier presupuesto superado (de etapa o time-to-evidence), o con una validación
+    # muestreada cuya cota inferior de conformidad (IC95) cae bajo MIN_SAMPLED_CONFORMANCE,
+    # no se publica sin revisión humana
+    weak = any(d.get("conformance_ci95", [1.0])[0] < MIN_SAMPLED_CONFORMANCE for d in lat_meta["degraded"].values())
+    if dec == "publish" and (lat_meta["breaches"] or weak):
+        return "review"
+    return dec
+
+def config_hash(cfg: dict, bands: tuple[float, float]) -> str:
+    # cambia si cambian ops/eee_gate.yaml, las bandas `residuals` o el código de puntuación por DP
+    code = [inspect.getsource(f) for f in (explicit_component, epistemic_component)]
+    return sha256_json({"eee_gate": cfg["eee_gate"], "bands": list(bands),
+                        "scores": EPISTEMIC_SCORES.tolist(), "code": code})[:16]
+
+def clean_details(component: str, config: str) -> dict:
+    """Detalles por DP del informe anterior reutilizables (DP no marcados como sucios por RAGA).
+    `config`: config_hash() actual; si el informe anterior se puntuó con otro, no se reutiliza nada."""
+    dirty = dirty_dps()
+    if dirty is None or not REPORT.exists():
+        return {}
+    prev = json.loads(REPORT.read_text(encoding="utf-8")).get("meta", {}).get(component, {})
+    if prev.get("config") != config:
+        return {}
+    return {d["dp"]: d for d in prev.get("details", []) if d["dp"] not in dirty}
 
-    # cargar explicaciones y kpis
-    kpis = json.loads(KPIS.read_text(encoding="utf-8"))
-    explain = json.loads(EXPL.read_text(encoding="utf-8"))
+def main():
+    with span("load") as sp:
+        cfg = load_yaml(CFG)
+        th  = cfg["eee_gate"]["threshold_score"]
+        w   = cfg["eee_gate"]["weights"]
+
+        # cargar explicaciones y kpis
+        kpis = json.loads(KPIS.read_text(encoding="utf-8"))
+        explain = json.loads(EXPL.read_text(encoding="utf-8"))
+        # los DP de temas no materiales (raga/materiality.json) no se evalúan
+        material, skipped = materiality.split(kpis, materiality.load_map())
+        kpis = {dp: kpis[dp] for dp in material}
+        explain = {dp: ex for dp, ex in explain.items() if dp in kpis}
+        sp.set(dps=len(explain), skipped_non_material=len(skipped))
 
     # componentes
-    ev_score, ev_meta = evidence_component(cfg)
-    ex_score, ex_meta = explicit_component(explain)
-    ep_score, ep_meta = epistemic_component(explain)
-
-    eee_score = round(
-        w["epistemic"]*ep_score + w["explicit"]*ex_score + w["evidence"]*ev_score, 4
-    )
+    with span("components") as sp:
+        # componentes por DP: solo se recalculan los DP sucios (raga/dirty.json)
+        # con otra configuración del gate (pesos, umbrales, bandas, código) se recalculan todos
+        bands = residual_bands()
+        config = config_hash(cfg, bands)
+        reuse_ex, reuse_ep = clean_details("explicit", config), clean_details("epistemic", config)
+        ev_score, ev_meta = evidence_component(cfg)
+        ex_score, ex_meta = explicit_component(explain, reuse_ex)
+        ep_score, ep_meta = epistemic_component(explain, reuse_ep, bands)
+        ex_meta["config"] = ep_meta["config"] = config
+        sp.set(reused_dps=len(reuse_ex))
+        lat_score, lat_meta = latency_component(cfg)
+
+        eee_score = round(
+            w["epistemic"]*ep_score + w["explicit"]*ex_score + w["evidence"]*ev_score
+            + w.get("latency", 0.0)*lat_score, 4
+        )
+        global_decision = cap_decision(decision(eee_score, th), lat_meta)
 
     # decisión por DP (simple: aplica el mismo score; en real podrías granularizar por DP)
     details = []
@@ -96,7 +166,7 @@ def main():
             "explicit": ex_score,
             "evidence": ev_score,
             "eee_score": eee_score,
-            "decision": decision(eee_score, th)
+            "decision": cap_decision(decision(eee_score, th), lat_meta)
         })
 
     report = {
@@ -105,31 +175,37 @@ def main():
         "components": {
             "epistemic": ep_score,
             "explicit": ex_score,
-            "evidence": ev_score
+            "evidence": ev_score,
+            "latency": lat_score
         },
         "eee_score": eee_score,
         "threshold": th,
-        "global_decision": decision(eee_score, th),
+        "global_decision": global_decision,
+        "budget_breaches": lat_meta["breaches"],
+        "skipped_non_material": skipped,
         "meta": {
             "evidence": ev_meta,
             "explicit": ex_meta,
-            "epistemic": ep_meta
+            "epistemic": ep_meta,
+            "latency": lat_meta
         },
         "details": details
     }
 
-    Path("ops").mkdir(exist_ok=True)
-    Path("eee").mkdir(exist_ok=True)
-    Path("ops/gate_report.json").write_text(json.dumps(report, indent=2, ensure_ascii=False))
-    # resumen compacto para auditoría
-    Path("eee/eee_report.json").write_text(json.dumps({
-        "utc": report["generated_utc"],
-        "eee_score": eee_score,
-        "decision": report["global_decision"]
-    }, indent=2, ensure_ascii=False))
+    with span("write"):
+        Path("ops").mkdir(exist_ok=True)
+        Path("eee").mkdir(exist_ok=True)
+        REPORT.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        # resumen compacto para auditoría
+        Path("eee/eee_report.json").write_text(json.dumps({
+            "utc": report["generated_utc"],
+            "eee_score": eee_score,
+            "decision": report["global_decision"]
+        }, indent=2, ensure_ascii=False))
 
     print(f"EEE-Score: {eee_score} → {report['global_decision']}")
     print("→ ops/gate_report.json, eee/eee_report.json")
 
 if __name__ == "__main__":
-    main()
+    with stage("EEE.gate"):
+        main()
@@ -2,6 +2,8 @@ import json, os
 from pathlib import Path
 from datetime import datetime
 from merkle import build_manifest
+from tsa import stamp_roots, verify_tokens
+from tracing import stage, span
 
 RUN_ID = os.environ.get("STEELTRACE_RUN_ID", "2025Q1-ACME-0001")
 
@@ -20,19 +22,25 @@ def main():
     Path("evidence/tokens").mkdir(parents=True, exist_ok=True)
     Path("evidence/verify").mkdir(parents=True, exist_ok=True)
 
-    man = build_manifest(ARTIFACTS, RUN_ID)
+    with span("manifest") as sp:
+        man = build_manifest(ARTIFACTS, RUN_ID)
+        sp.set(artifacts=len(ARTIFACTS), bytes=sum(Path(a).stat().st_size for a in ARTIFACTS))
     man["created_utc"] = datetime.utcnow().isoformat() + "Z"
-    token = {
-        "tsa": "SIMULATED-TSA",
-        "ts_utc": datetime.utcnow().isoformat() + "Z",
-        "merkle_root": man["merkle_root"]
-    }
-    man["tsa_tokens"] = [token]
+    # sello de tiempo vía TSA configurable (STEELTRACE_TSA); por defecto firmante local
+    with span("tsa.stamp"):
+        token = stamp_roots([man["merkle_root"]])[0]
+    man["tsa_tokens"] = [{k: token[k] for k in ("tsa", "ts_utc", "merkle_root", "aggregate_root")}]
+    with span("tsa.verify"):
+        check = verify_tokens([token])[0]
 
     Path("evidence/evidence_manifest.json").write_text(json.dumps(man, indent=2, ensure_ascii=False))
     Path("evidence/tokens/2025Q1.tsr").write_text(json.dumps(token, indent=2))
-    Path("evidence/verify/2025Q1.txt").write_text("Verification: OK (simulated)\n")
+    Path("evidence/verify/2025Q1.txt").write_text(
+        f"Verification: {'OK' if check['ok'] else 'FAILED'} "
+        f"(signature={check['signature']}, imprint={check['imprint']}, inclusion={check['inclusion']})\n"
+    )
     print("Evidence manifest → evidence/evidence_manifest.json")
 
 if __name__ == "__main__":
-    main()
+    with stage("EVIDENCE.build"):
+        main()
@@ -0,0 +1,282 @@
+"""
+Worker precalentado (fork server) para lanzar etapas sin pagar el arranque del intérprete.
+
+    python scripts/forkserver.py serve [socket]      → servidor en primer plano
+    STEELTRACE_FORKSERVER=/ruta/forkserver.sock      → pipeline_run y JobManager despachan las etapas aquí
+
+El servidor importa una vez las dependencias pesadas (PRELOAD) y, por cada petición,
+hace fork(): el hijo cambia de directorio y entorno, toma como stdout/stderr los pipes
+que envía el cliente (SCM_RIGHTS) y ejecuta el script como __main__. Los módulos de
+scripts/ no se precargan: sus constantes y estado (trazas, rutas relativas) deben
+nacer en cada etapa.
+
+El socket ejecuta lo que se le pide: se crea con permisos 0600, solo atiende a clientes
+del mismo uid (SO_PEERCRED) y solo lanza scripts de ROOT/scripts.
+
+spawn() devuelve un objeto con la interfaz de subprocess.Popen que usan los
+orquestadores (stdout/stderr, poll, wait, communicate, terminate, kill, returncode) y cae a
+Popen si no hay servidor.
+"""
+import importlib, json, os, runpy, selectors, signal, socket, struct, subprocess, sys, threading, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PRELOAD = ["yaml", "jsonschema", "rdflib", "pyshacl", "lxml.etree", "numpy"]
+SCRIPTS = ROOT / "scripts"
+DEFAULT_SOCK = ROOT / "ops" / "forkserver.sock"
+REAP_INTERVAL_SEC = 0.05
+START_TIMEOUT_SEC = 30
+
+def _sock_path() -> str | None:
+    return os.environ.get("STEELTRACE_FORKSERVER") or None
+
+# -------- Servidor --------
+
+def preload() -> dict[str, float]:
+    """Importa PRELOAD y devuelve ms por módulo (las dependencias ausentes se omiten)."""
+    out = {}
+    for name in PRELOAD:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        out[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+def _child(req: dict, fds: list[int]):
+    # proceso hijo: nunca vuelve al bucle del servidor
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        sys.stdout.reconfigure(line_buffering=True)
+        os.chdir(req["cwd"])
+        os.environ.clear()
+        os.environ.update(req["env"])
+        sys.argv = [req["script"], *req.get("args", [])]
+        sys.path[0] = str(Path(req["script"]).parent)
+        code = 0
+        runpy.run_path(req["script"], run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        for f in (sys.stdout, sys.stderr):
+            try:
+                f.flush()
+            except Exception:
+                pass
+        os._exit(code)
+
+def _check(conn: socket.socket, req: dict):
+    """ValueError si el cliente no es del mismo usuario o el script no es una etapa de scripts/."""
+    if hasattr(socket, "SO_PEERCRED"):
+        _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        if uid != os.getuid():
+            raise ValueError(f"cliente con uid {uid} rechazado")
+    script = Path(req["script"]).resolve()
+    if script.parent != SCRIPTS or script.suffix != ".py" or not script.is_file():
+        raise ValueError(f"script fuera de {SCRIPTS}: {req['script']}")
+
+def _send(conn: socket.socket, msg: dict):
+    try:
+        conn.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+    except OSError:
+        pass
+
+def serve(path: str | os.PathLike = DEFAULT_SOCK):
+    path = str(path)
+    loaded = preload()
+    if os.path.exists(path):
+        os.unlink(path)
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old = os.umask(0o077)   # el socket nace 0600: sin ventana entre bind y chmod
+    try:
+        srv.bind(path)
+    finally:
+        os.umask(old)
+    os.chmod(path, 0o600)
+    srv.listen(64)
+    sel = selectors.DefaultSelector()
+    sel.register(srv, selectors.EVENT_READ)
+    children: dict[int, socket.socket] = {}
+    # SIGTERM → salida ordenada (se borra el socket); los hijos restauran el manejador por defecto
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"forkserver en {path} (precargado: {loaded})", flush=True)
+    try:
+        while True:
+            for key, _ in sel.select(timeout=REAP_INTERVAL_SEC):
+                conn, _ = srv.accept()
+                fds = []
+                try:
+                    data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+                    req = json.loads(data.decode("utf-8"))
+                    _check(conn, req)
+                except (OSError, ValueError, KeyError) as e:
+                    for fd in fds:
+                        os.close(fd)
+                    _send(conn, {"error": str(e)})
+                    conn.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    srv.close()
+                    conn.close()
+                    _child(req, fds)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                _send(conn, {"pid": pid})
+            # recogida de hijos sin hilos (fork + hilos no se mezclan bien)
+            while children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                conn = children.pop(pid, None)
+                if conn is not None:
+                    _send(conn, {"returncode": os.waitstatus_to_exitcode(status)})
+                    conn.close()
+    finally:
+        srv.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+# -------- Cliente --------
+
+class ForkedProcess:
+    """Etapa lanzada por el fork server; imita la parte de Popen que usan los orquestadores."""
+
+    def __init__(self, path: str, script: str, cwd, env: dict, args: list[str] | None = None):
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.conn.connect(path)
+            req = {"script": str(script), "args": args or [], "cwd": str(cwd), "env": dict(env)}
+            socket.send_fds(self.conn, [json.dumps(req).encode("utf-8")], [out_w, err_w])
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        self.stdout = os.fdopen(out_r, "r", encoding="utf-8", errors="replace")
+        self.stderr = os.fdopen(err_r, "r", encoding="utf-8", errors="replace")
+        self._buf = b""
+        msg = self._message(block=True) or {}
+        if "pid" not in msg:
+            raise OSError(f"forkserver: {msg.get('error', 'sin respuesta')}")
+        self.pid = msg["pid"]
+        self.returncode = None
+        self._readers = None
+
+    def _message(self, block: bool) -> dict | None:
+        while b"\n" not in self._buf:
+            try:
+                chunk = self.conn.recv(4096, 0 if block else socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return None
+            if not chunk:
+                # el servidor cayó sin informar del código de salida
+                return {"returncode": -signal.SIGKILL}
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\n", 1)
+        return json.loads(line)
+
+    def poll(self) -> int | None:
+        if self.returncode is None:
+            msg = self._message(block=False)
+            if msg is not None:
+                self.returncode = msg["returncode"]
+                self.conn.close()
+        return self.returncode
+
+    def wait(self, timeout: float | None = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(f"forkserver:{self.pid}", timeout)
+            time.sleep(REAP_INTERVAL_SEC)
+        return self.returncode
+
+    def communicate(self, timeout: float | None = None) -> tuple[str, str]:
+        # como Popen: TimeoutExpired si no termina a tiempo; se puede volver a llamar sin perder salida
+        if self._readers is None:
+            self._output = {}
+            self._readers = [threading.Thread(target=lambda k=k, f=f: self._output.__setitem__(k, f.read()), daemon=True)
+                             for k, f in (("out", self.stdout), ("err", self.stderr))]
+            for t in self._readers:
+                t.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._readers:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if t.is_alive():
+                raise subprocess.TimeoutExpired(f"forkserver:{self.pid}", timeout)
+        self.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return self._output.get("out", ""), self._output.get("err", "")
+
+    def _signal(self, sig: int):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        self._signal(signal.SIGKILL)
+
+def available(path: str | None = None) -> bool:
+    path = path or _sock_path()
+    if not path or not os.path.exists(path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+        return True
+    except OSError:
+        return False
+
+def ensure_server(path: str | None = None) -> bool:
+    """Arranca el servidor en segundo plano si STEELTRACE_FORKSERVER apunta a un socket sin servidor."""
+    path = path or _sock_path()
+    if not path:
+        return False
+    if available(path):
+        return True
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "serve", path],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT_SEC
+    while time.monotonic() < deadline:
+        if available(path):
+            return True
+        time.sleep(0.1)
+    return False
+
+def spawn(script, cwd, env: dict, args: list[str] | None = None):
+    """Lanza un script de etapa: fork server si está configurado y disponible; si no, Popen."""
+    path = _sock_path()
+    if path and available(path):
+        try:
+            return ForkedProcess(path, str(script), cwd, env, args)
+        except OSError:
+            pass
+    return subprocess.Popen([sys.executable, str(script), *(args or [])], cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        serve(sys.argv[2] if len(sys.argv) > 2 else (_sock_path() or DEFAULT_SOCK))
+    else:
+        print("Uso: python scripts/forkserver.py serve [socket]")
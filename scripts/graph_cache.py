@@ -0,0 +1,146 @@
+"""
+Caché de grafos RDF precompilados entre runs (ontología y shapes SHACL).
+
+    sh = load_graph(path)        # Graph ya parseado; desde la caché si el archivo no cambió
+    tbox = load_closure(path)    # cierre RDFS de la ontología (owlrl) + índices del TBox
+    entail(data, tbox)           # inferencia RDFS de los datos contra el TBox ya cerrado
+
+- Clave: sha256 del archivo + versión de rdflib + FORMAT_VERSION. Es direccionable
+  por contenido, así que se comparte entre runs y particiones (STEELTRACE_GRAPH_CACHE, por
+  defecto .cache/graphs en la raíz del repo: los runs trabajan en su propio directorio).
+- Pickle de la store en memoria (varias veces más rápido que volver a parsear Turtle);
+  escritura atómica; al reconstruir se borran las entradas anteriores del mismo archivo.
+- Unpickle ejecuta código: el directorio se crea 0700 y solo se lee una entrada si ella y el
+  directorio son del usuario actual y el directorio no admite escritura de grupo/otros; si no,
+  se reconstruye sin caché. Cualquier error al cargar una entrada también la reconstruye.
+- El cierre RDFS de la ontología se calcula una vez; por run solo se infieren las
+  consecuencias de los triples de datos (rdfs2/3/7/9 con subClassOf/subPropertyOf ya
+  cerrados), en lugar de que pyshacl recalcule el cierre completo en cada validación.
+"""
+import os, pickle, stat, sys
+from pathlib import Path
+from rdflib import Graph, Literal, RDF, RDFS
+from utils_hash import sha256_file
+
+FORMAT_VERSION = 1
+CACHE_DIR = Path(os.environ.get("STEELTRACE_GRAPH_CACHE",
+                                Path(__file__).resolve().parent.parent / ".cache" / "graphs"))
+
+def _versions() -> str:
+    # owlrl no entra en la clave: importarlo cuesta más que cargar la caché (subir FORMAT_VERSION
+    # si cambia la inferencia); rdflib sí, porque el pickle depende de sus clases
+    import rdflib
+    return f"rdflib{rdflib.__version__}-v{FORMAT_VERSION}"
+
+def _entry(path: Path, kind: str) -> Path:
+    key = sha256_file(path)[:24]
+    return CACHE_DIR / f"{path.stem}.{kind}.{key}.{_versions()}.pickle"
+
+def _trusted(*paths: Path) -> bool:
+    # nadie más que el usuario actual puede haber escrito lo que se va a deserializar
+    for p in paths:
+        st = p.stat()
+        if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return False
+    return True
+
+def _cached(path: Path, kind: str, build, stats: dict | None = None):
+    path = Path(path)
+    entry = _entry(path, kind)
+    CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not _trusted(CACHE_DIR):
+        print(f"AVISO: {CACHE_DIR} no es privado del usuario: caché de grafos desactivada", file=sys.stderr)
+        if stats is not None:
+            stats[path.name] = "untrusted"
+        return build(path)
+    if entry.exists() and _trusted(entry):
+        try:
+            with open(entry, "rb") as f:
+                obj = pickle.load(f)
+            if stats is not None:
+                stats[path.name] = "hit"
+            return obj
+        except Exception:
+            pass   # entrada corrupta, a medio escribir o de otra versión de rdflib: se reconstruye
+    obj = build(path)
+    for old in CACHE_DIR.glob(f"{path.stem}.{kind}.*.pickle"):
+        old.unlink(missing_ok=True)
+    tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, entry)
+    if stats is not None:
+        stats[path.name] = "miss"
+    return obj
+
+def _parse(path: Path) -> Graph:
+    g = Graph()
+    g.parse(path, format="turtle")
+    return g
+
+def load_graph(path: Path, stats: dict | None = None) -> Graph:
+    return _cached(path, "graph", _parse, stats)
+
+def _closure(path: Path) -> dict:
+    import owlrl
+    g = _parse(path)
+    owlrl.DeductiveClosure(owlrl.RDFS_Semantics).expand(g)
+    index = lambda pred: {s: frozenset(o for o in g.objects(s, pred) if o != s) for s in set(g.subjects(pred, None))}
+    return {"graph": g, "sub_class": index(RDFS.subClassOf), "sub_property": index(RDFS.subPropertyOf),
+            "domain": index(RDFS.domain), "range": index(RDFS.range)}
+
+def load_closure(path: Path, stats: dict | None = None) -> dict:
+    """{"graph": cierre RDFS de la ontología, "sub_class"/"sub_property"/"domain"/"range": índices}."""
+    return _cached(path, "closure", _closure, stats)
+
+def entail(data: Graph, tbox: dict) -> set[tuple]:
+    """Triples RDFS implicados por `data` dado el TBox cerrado (tipos por dominio/rango/subclase
+    y superpropiedades); no incluye los axiomáticos de owlrl (rdfs:Resource, tipado de literales)."""
+    sub_class, sub_prop, domain, rng = tbox["sub_class"], tbox["sub_property"], tbox["domain"], tbox["range"]
+    empty = frozenset()
+    out = set()
+
+    def typed(node, classes):
+        for c in classes:
+            out.add((node, RDF.type, c))
+            out.update((node, RDF.type, sup) for sup in sub_class.get(c, empty))
+
+    for s, p, o in data:
+        props = {p} | sub_prop.get(p, empty)
+        out.update((s, q, o) for q in props if q != p)
+        if p == RDF.type:
+            typed(s, [o])
+        for q in props:
+            typed(s, domain.get(q, empty))
+            if not isinstance(o, Literal):
+                typed(o, rng.get(q, empty))
+    return out
+
+if __name__ == "__main__":
+    # paridad de entail() con el cierre RDFS completo de owlrl: python scripts/graph_cache.py
+    import tempfile, owlrl
+    from rdflib import Namespace, URIRef
+    EX = Namespace("http://example.org/t#")
+    onto = """@prefix ex: <http://example.org/t#> . @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+    ex:B rdfs:subClassOf ex:A . ex:C rdfs:subClassOf ex:B .
+    ex:q rdfs:subPropertyOf ex:p . ex:r rdfs:subPropertyOf ex:q .
+    ex:p rdfs:domain ex:D . ex:q rdfs:range ex:C . ex:D rdfs:subClassOf ex:A .
+    ex:v rdfs:domain ex:B ."""
+    data = """@prefix ex: <http://example.org/t#> .
+    ex:x a ex:C ; ex:r ex:y ; ex:v 3 . ex:z ex:p ex:w . ex:y ex:v "s" ."""
+    with tempfile.TemporaryDirectory() as d:
+        CACHE_DIR = Path(d) / "cache"
+        src = Path(d) / "onto.ttl"
+        src.write_text(onto, encoding="utf-8")
+        stats = {}
+        tbox = load_closure(src, stats)
+        assert load_closure(src, stats)["sub_class"] == tbox["sub_class"] and stats[src.name] == "hit", stats
+        g = Graph().parse(data=data, format="turtle")
+        full = Graph().parse(data=onto, format="turtle") + g
+        owlrl.DeductiveClosure(owlrl.RDFS_Semantics).expand(full)
+        ours = set(tbox["graph"]) | set(g) | entail(g, tbox)
+        # solo triples sobre el vocabulario del ejemplo (fuera quedan los axiomáticos de owlrl)
+        ex = lambda t: all(not isinstance(x, URIRef) or x.startswith(EX) or x == RDF.type for x in t)
+        missing, extra = {t for t in full if ex(t)} - ours, {t for t in ours if ex(t)} - set(full)
+        assert not missing and not extra, (missing, extra)
+    print(f"graph_cache OK: {len(entail(g, tbox))} triples inferidos, iguales a owlrl")
@@ -1,25 +1,35 @@
-import pandas as pd
-from sklearn.metrics import cohen_kappa_score
+import os
 from pathlib import Path
-import json  # <<< ESTO FALTABA
+import json
+import numpy as np
+from agreement import update, bootstrap, summary
 
 MAP = {"valido":2, "revision":1, "incorrecto":0}
+REVIEWS = Path("docs/hitl_reviews.csv")
+STATE = Path("ops/hitl_agreement_state.json")   # estadísticos acumulados + offset leído del CSV
+LABELS = Path("ops/hitl_labels.npy")            # matriz ítems × revisores (para el bootstrap)
+N_BOOT = int(os.environ.get("STEELTRACE_KAPPA_BOOT", 200))
+METRIC = "ordinal"   # valido > revision > incorrecto
+
+def _r(x: float):
+    return None if np.isnan(x) else round(float(x), 3) + 0.0   # sin -0.0
 
 def main():
-    # El script asume que docs/hitl_reviews.csv existe
-    df = pd.read_csv("docs/hitl_reviews.csv")
-    
-    # κ par-a-par y media simple
-    pairs = [("rev1","rev2"),("rev1","rev3"),("rev2","rev3")]
-    kappas = {}
-    for a,b in pairs:
-        # cohen_kappa_score requiere que las etiquetas sean numéricas
-        ka = cohen_kappa_score(df[a].map(MAP), df[b].map(MAP))
-        kappas[f"{a}-{b}"] = round(ka, 3)
-        
-    mean_k = round(sum(kappas.values())/len(kappas), 3)
-    out = {"kappas": kappas, "kappa_mean": mean_k, "n": len(df)}
-    
+    # El script asume que docs/hitl_reviews.csv existe (dp_id + una columna por revisor; vacío = sin etiqueta)
+    # solo se leen las filas añadidas desde la última ejecución
+    stats, labels, raters = update(REVIEWS, STATE, LABELS, MAP)
+
+    # κ par-a-par (una pasada sobre el tensor de confusión) y media simple
+    kappa = stats.cohen_matrix()
+    kappas = {f"{raters[i]}-{raters[j]}": _r(kappa[i, j])
+              for i in range(len(raters)) for j in range(i + 1, len(raters))}
+    point = summary(stats, METRIC)
+    out = {"kappas": kappas, "kappa_mean": _r(point["kappa_mean"]), "n": stats.items,
+           "raters": len(raters),
+           "fleiss_kappa": _r(point["fleiss_kappa"]),
+           "krippendorff_alpha": _r(point["krippendorff_alpha"]), "alpha_metric": METRIC,
+           "ci95": bootstrap(labels, max(MAP.values()) + 1, N_BOOT, metric=METRIC), "bootstrap": N_BOOT}
+
     # Escribe el resultado como JSON válido en ops/hitl_kappa.json
     Path("ops/hitl_kappa.json").write_text(json.dumps(out, indent=2))
     print(out)
@@ -0,0 +1,181 @@
+"""
+Estado incremental de KPIs: agregados parciales fusionables con deltas por hash de registro.
+
+raga/kpi_state.json guarda, por dominio:
+  - groups: sumas y recuentos por (entidad, periodo, source_system), en Decimal exacto
+    (las retractaciones restan sin deriva de coma flotante)
+  - records: hash del registro → grupo, contribución y multiplicidad, para poder retractarlo sin el original
+  - files: sha256 del normalizado ya incorporado (si no cambia, el dominio no se toca)
+
+apply() acepta inserciones y retractaciones (una actualización = retract + insert) y
+devuelve los DP cuyo valor cambió; raga_compute los escribe en raga/dirty.json y
+explain, EEE-Gate y XBRL recalculan solo esas entradas. Los registros que entran o salen
+quedan en `changes` para el índice de linaje (lineage_index.py).
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from utils_hash import sha256_file, sha256_json
+
+STATE = Path("raga/kpi_state.json")
+DIRTY = Path("raga/dirty.json")
+
+def _d(v) -> Decimal:
+    return Decimal(str(v if v is not None else 0))
+
+def _nz(b):
+    # denominador nulo → 1 (como `or 1`); vale igual para escalares y arrays de NumPy
+    return b + (b == 0)
+
+# dominio → DP, normalizado, clave de grupo, entradas del registro, términos sumables y fórmula.
+# terms/formula son aritmética pura: kpi_state las evalúa sobre Decimal/float y
+# uncertainty.py sobre arrays de muestras Monte Carlo.
+DOMAINS = {
+    "energy": {
+        "dp": "E1-1.total_co2e_tons",
+        "normalized": "data/normalized/energy_2024-01.json",
+        "period": lambda r: str(r.get("period_start", ""))[:7],
+        "inputs": {"kwh": None, "emission_factor_co2e": 0.23},
+        "terms": lambda x: {"co2e_kg": x["kwh"] * x["emission_factor_co2e"], "kwh": x["kwh"]},
+        "formula": lambda s: s["co2e_kg"] / 1000.0,
+        "ndigits": 3,
+    },
+    "hr": {
+        "dp": "S1-1.employee_turnover",
+        "normalized": "data/normalized/hr_2024-01.json",
+        "period": lambda r: str(r.get("period", "")),
+        "inputs": {"exits": None, "employees_start": None, "employees_end": None},
+        "terms": lambda x: {"exits": x["exits"], "employees_start": x["employees_start"],
+                            "employees_end": x["employees_end"]},
+        "formula": lambda s: s["exits"] / _nz((s["employees_start"] + s["employees_end"]) / 2),
+        "ndigits": 4,
+    },
+    "ethics": {
+        "dp": "G1-1.resolution_rate_pct",
+        "normalized": "data/normalized/ethics_2024-01.json",
+        "period": lambda r: str(r.get("period", "")),
+        "inputs": {"closed_with_resolution": None, "cases_closed": None},
+        "terms": lambda x: {"closed_with_resolution": x["closed_with_resolution"], "cases_closed": x["cases_closed"]},
+        "formula": lambda s: s["closed_with_resolution"] / _nz(s["cases_closed"]) * 100,
+        "ndigits": 2,
+    },
+}
+
+def inputs(domain: str, record: dict) -> dict:
+    return {k: record.get(k, default) for k, default in DOMAINS[domain]["inputs"].items()}
+
+def contrib(domain: str, record: dict) -> dict:
+    return DOMAINS[domain]["terms"]({k: _d(v) for k, v in inputs(domain, record).items()})
+
+def kpi_value(domain: str, sums: dict) -> float:
+    spec = DOMAINS[domain]
+    names = spec["terms"]({k: 0 for k in spec["inputs"]})
+    return round(float(spec["formula"]({k: float(sums.get(k, 0)) for k in names})), spec["ndigits"])
+
+def group_key(domain: str, record: dict) -> str:
+    """Entidad|periodo|source_system: unidad de agregación parcial."""
+    return "|".join([str(record.get("company_id", "")), DOMAINS[domain]["period"](record),
+                     str(record.get("source_system", ""))])
+
+def record_hash(record: dict) -> str:
+    return sha256_json(record)
+
+class KPIState:
+    def __init__(self, path: Path = STATE):
+        self.path = Path(path)
+        data = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+        self.files: dict[str, str] = data.get("files", {})
+        self.records: dict[str, dict] = data.get("records", {})
+        self.groups: dict[str, dict] = {
+            dom: {g: {k: (v if k == "count" else Decimal(v)) for k, v in st.items()} for g, st in gs.items()}
+            for dom, gs in data.get("groups", {}).items()}
+        self.values: dict[str, float] = data.get("values", {})
+        # (±1, dominio, hash, grupo) cuando un registro entra o sale del estado (índice de linaje)
+        self.changes: list[tuple] = []
+
+    def _add(self, domain: str, group: str, terms: dict, sign: int):
+        st = self.groups.setdefault(domain, {}).setdefault(group, {"count": 0})
+        st["count"] += sign
+        for k, v in terms.items():
+            st[k] = st.get(k, Decimal(0)) + sign * v
+        if st["count"] == 0:
+            del self.groups[domain][group]
+
+    def apply(self, domain: str, inserts: list[dict] = (), retracts: list[str] = ()) -> set[str]:
+        """Aplica un delta (registros nuevos y hashes retirados) y devuelve los DP cuyo valor cambió."""
+        for h in retracts:
+            rec = self.records.get(h)
+            if rec is None:
+                continue
+            self._add(domain, rec["group"], {k: Decimal(v) for k, v in rec["contrib"].items()}, -1)
+            rec["n"] -= 1
+            if rec["n"] == 0:
+                del self.records[h]
+                self.changes.append((-1, domain, h, rec["group"]))
+        for r in inserts:
+            h = record_hash(r)
+            group, c = group_key(domain, r), contrib(domain, r)
+            # registros idénticos comparten hash: se lleva la multiplicidad
+            rec = self.records.setdefault(h, {"domain": domain, "group": group, "n": 0,
+                                              "contrib": {k: str(v) for k, v in c.items()}})
+            rec["n"] += 1
+            if rec["n"] == 1:
+                self.changes.append((+1, domain, h, group))
+            self._add(domain, group, c, +1)
+        return self._refresh(domain)
+
+    def update(self, domain: str, old_hash: str, record: dict) -> set[str]:
+        return self.apply(domain, inserts=[record], retracts=[old_hash])
+
+    def totals(self, domain: str) -> dict:
+        tot = {"count": 0}
+        for st in self.groups.get(domain, {}).values():
+            for k, v in st.items():
+                tot[k] = tot.get(k, Decimal(0) if k != "count" else 0) + v
+        return tot
+
+    def _refresh(self, domain: str) -> set[str]:
+        dp = DOMAINS[domain]["dp"]
+        value = kpi_value(domain, self.totals(domain))
+        if dp in self.values and self.values[dp] == value:
+            return set()
+        self.values[dp] = value
+        return {dp}
+
+    def sync_file(self, domain: str, path: Path | None = None) -> tuple[set[str], dict]:
+        """Incorpora el normalizado del dominio como delta (diff por hash de registro); sin cambios → no hace nada."""
+        path = Path(path or DOMAINS[domain]["normalized"])
+        digest = sha256_file(path)
+        if self.files.get(domain) == digest and DOMAINS[domain]["dp"] in self.values:
+            return set(), {"inserted": 0, "retracted": 0, "unchanged": True}
+        new: dict[str, list] = {}
+        for r in json.loads(path.read_text(encoding="utf-8")):
+            new.setdefault(record_hash(r), []).append(r)
+        old = {h: rec["n"] for h, rec in self.records.items() if rec["domain"] == domain}
+        inserts = [r for h, rs in new.items() for r in rs[old.get(h, 0):]]
+        retracts = [h for h, n in old.items() for _ in range(n - len(new.get(h, [])))]
+        dirty = self.apply(domain, inserts, retracts)
+        self.files[domain] = digest
+        return dirty, {"inserted": len(inserts), "retracted": len(retracts), "unchanged": False}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        groups = {dom: {g: {k: (v if k == "count" else str(v)) for k, v in st.items()} for g, st in gs.items()}
+                  for dom, gs in self.groups.items()}
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"files": self.files, "groups": groups, "records": self.records,
+                                   "values": self.values}))
+        tmp.replace(self.path)
+
+def write_dirty(dps: set[str], full: bool = False, path: Path = DIRTY):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"utc": datetime.utcnow().isoformat() + "Z", "full": full,
+                                "kpis": sorted(dps)}, indent=2))
+
+def dirty_dps(path: Path = DIRTY) -> set[str] | None:
+    """DP a recalcular aguas abajo; None = desconocido (recalcular todo)."""
+    if not path.exists():
+        return None
+    d = json.loads(path.read_text(encoding="utf-8"))
+    return None if d.get("full") else set(d["kpis"])
@@ -0,0 +1,138 @@
+"""
+Presupuestos de latencia: convierte tiempos medidos y p95 históricos en una entrada del EEE-Gate.
+
+- Tiempos medidos: span raíz de cada etapa en ops/traces/*.trace.json (tracing.py), solo
+  los del run actual: mismo STEELTRACE_RUN_ID y posteriores a STEELTRACE_RUN_STARTED (sin
+  orquestador, al inicio de la última ingesta: lo anterior son trazas de runs previos).
+- Proyección: etapas aún no ejecutadas en el run se estiman con su p95 del
+  almacén de SLO (STEELTRACE_SLO_STATE, por defecto ops/slo_sketch.json).
+- Degradación adaptativa: si el p95 de una etapa degradable supera su presupuesto,
+  sample_fraction() devuelve la fracción de registros a procesar para encajar en él.
+"""
+import json, math, os, time
+from pathlib import Path
+from slo_store import DDSketch
+
+CFG = Path("ops/eee_gate.yaml")
+TRACE_DIR = Path("ops/traces")
+DEGRADATION = Path("ops/degradation.json")
+STAGE_ORDER = ["MCP.ingest", "SHACL.validate", "RAGA.compute", "EEE.gate", "XBRL.generate", "EVIDENCE.build"]
+SAFETY = 0.8   # margen: la fracción muestreada apunta al 80 % del presupuesto
+
+def load_cfg(path: Path = CFG) -> dict:
+    import yaml
+    return yaml.safe_load(path.read_text(encoding="utf-8"))["eee_gate"]
+
+def _slo_state() -> dict:
+    p = Path(os.environ.get("STEELTRACE_SLO_STATE", "ops/slo_sketch.json"))
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {"stages": {}}
+
+def slo_p95(stage: str, state: dict | None = None) -> float | None:
+    st = (state or _slo_state())["stages"].get(stage)
+    return DDSketch.from_dict(st["all"]).quantile(0.95) if st else None
+
+def _traces() -> list[dict]:
+    run_id = os.environ.get("STEELTRACE_RUN_ID")
+    out = []
+    for p in TRACE_DIR.glob("*.trace.json"):
+        data = json.loads(p.read_text(encoding="utf-8"))
+        if not run_id or data.get("run_id") == run_id:
+            out.append(data)
+    return out
+
+def run_started(traces: list[dict] | None = None) -> float:
+    """Epoch (s) de inicio del run: STEELTRACE_RUN_STARTED o, si no está, el span raíz de la
+    primera etapa (STAGE_ORDER[0]) más reciente en las trazas."""
+    env = os.environ.get("STEELTRACE_RUN_STARTED")
+    if env:
+        return float(env)
+    starts = [e["ts"] / 1e6 for t in (traces if traces is not None else _traces()) for e in t["traceEvents"]
+              if e["name"] == STAGE_ORDER[0] and e["args"].get("path") == e["name"]]
+    return max(starts, default=0.0)
+
+def measured_times() -> dict[str, float]:
+    """Duración (s) del span raíz de cada etapa ya ejecutada en este run."""
+    traces = _traces()
+    started = run_started(traces) * 1e6
+    out = {}
+    for t in traces:
+        for e in t["traceEvents"]:
+            if e["args"].get("path") == e["name"] and e["ts"] >= started:
+                out[e["name"]] = round(e["dur"] / 1e6, 4)
+    return out
+
+def wilson(successes: int, n: int, z: float = 1.96) -> tuple[float, float]:
+    """Intervalo de Wilson (95 % por defecto) para una proporción."""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    den = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / den
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / den
+    return round(max(0.0, center - half), 4), round(min(1.0, center + half), 4)
+
+def sample_fraction(stage: str, cfg: dict | None = None) -> float:
+    """1.0 = procesar todo; <1.0 = modo degradado por muestreo (override: STEELTRACE_SAMPLE_FRACTION)."""
+    forced = os.environ.get("STEELTRACE_SAMPLE_FRACTION")
+    if forced:
+        return min(1.0, max(0.0, float(forced)))
+    try:
+        cfg = cfg or load_cfg()
+    except FileNotFoundError:
+        return 1.0
+    if stage not in cfg.get("degradable_stages", []):
+        return 1.0
+    budget = cfg.get("stage_budgets_sec", {}).get(stage)
+    p95 = slo_p95(stage)
+    if not budget or not p95 or p95 <= budget:
+        return 1.0
+    return max(cfg.get("min_sample_fraction", 0.05), min(1.0, SAFETY * budget / p95))
+
+def record_degradation(stage: str, info: dict | None):
+    """Las etapas degradadas lo dejan por escrito para que el gate lo refleje (None = ejecución completa)."""
+    data = json.loads(DEGRADATION.read_text(encoding="utf-8")) if DEGRADATION.exists() else {}
+    if info is None:
+        data.pop(stage, None)
+    else:
+        data[stage] = {**info, "utc_epoch": time.time()}
+    DEGRADATION.parent.mkdir(parents=True, exist_ok=True)
+    DEGRADATION.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+
+def evaluate(cfg: dict) -> dict:
+    budgets = cfg.get("stage_budgets_sec", {})
+    measured = measured_times()
+    state = _slo_state()
+    stages, breaches, total, projected = [], [], 0.0, 0.0
+    for name in STAGE_ORDER:
+        budget = budgets.get(name)
+        if name in measured:
+            sec, source = measured[name], "measured"
+            total += sec
+        else:
+            sec, source = slo_p95(name, state), "slo_p95"
+        if sec is not None:
+            projected += sec
+        breach = bool(budget and sec is not None and sec > budget)
+        row = {"stage": name, "seconds": sec, "source": source, "budget_sec": budget, "breach": breach}
+        stages.append(row)
+        if breach:
+            breaches.append(row)
+    max_tte = cfg.get("max_time_to_evidence_sec")
+    tte_breach = bool(max_tte and projected > max_tte)
+    if tte_breach:
+        breaches.append({"stage": "time_to_evidence", "seconds": round(projected, 4), "budget_sec": max_tte, "breach": True})
+    with_budget = [s for s in stages if s["budget_sec"] and s["seconds"] is not None]
+    score = sum(1 for s in with_budget if not s["breach"]) / len(with_budget) if with_budget else 1.0
+    degraded = json.loads(DEGRADATION.read_text(encoding="utf-8")) if DEGRADATION.exists() else {}
+    started = run_started()
+    degraded = {k: v for k, v in degraded.items() if v.get("utc_epoch", 0) >= started}
+    return {
+        "score": round(score * (0.0 if tte_breach else 1.0), 4),
+        "measured_time_to_evidence_sec": round(total, 4),
+        "projected_time_to_evidence_sec": round(projected, 4),
+        "max_time_to_evidence_sec": max_tte,
+        "time_to_evidence_breach": tte_breach,
+        "stages": stages,
+        "breaches": breaches,
+        "degraded": degraded,
+    }
@@ -0,0 +1,268 @@
+"""
+Índice de linaje consultable (SQLite) sobre lo que se escribe en data/lineage.jsonl y
+ontology/linaje.ttl.
+
+Nodos (kind, key) y aristas entrada → salida; cada etapa mantiene las suyas de forma incremental:
+  MCP.ingest      source_file → normalized_file
+  SHACL.validate  record → rdf_node (URI del registro en linaje.ttl)
+  RAGA.compute    normalized_file → record → kpi_group (dp|entidad|periodo|source_system) → kpi,
+                  y normalized_file → kpi_group como atajo para consultas hacia delante
+                  (solo los deltas de kpi_state: registros nuevos y retirados)
+  XBRL.generate   kpi → xbrl_fact (xbrl/informe.xbrl#dp)
+
+    idx = LineageIndex()
+    idx.upstream("kpi", "E1-1.total_co2e_tons")          # KPI → grupos → registros → archivos
+    idx.feeds("E1-1.total_co2e_tons", entity="ACME")     # lo mismo, solo para una entidad
+    idx.downstream("source_file", "data/samples/energy_2024-01.json", skip=("record",))
+
+Las consultas recorren edges en anchura (una búsqueda por nivel en la clave primaria o en el
+índice inverso) y paran en `limit` nodos: el coste depende de lo que se devuelve, no del tamaño
+del índice (milisegundos con millones de aristas). app.py abre el índice en solo lectura.
+"""
+import json, sqlite3, sys, time
+from pathlib import Path
+
+DB = Path("data/lineage.sqlite")
+MAX_DEPTH = 10
+LIMIT = 1000
+CACHE_KB = 128 * 1024   # caché de páginas del escritor: los volcados completos tocan el índice (kind, key) al azar
+KINDS = ("source_file", "normalized_file", "record", "rdf_node", "kpi_group", "kpi", "xbrl_fact")
+# el tipo de cada extremo va también en la arista: las claves (src, dst_kind, dst) y (dst, src_kind, src)
+# permiten saltarse un tipo (p.ej. los registros) con búsquedas en el índice, sin recorrer sus aristas
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id     INTEGER PRIMARY KEY,
+    kind   TEXT NOT NULL,
+    key    TEXT NOT NULL,
+    sha256 TEXT,
+    entity TEXT,
+    attrs  TEXT,
+    UNIQUE (kind, key)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    src      INTEGER NOT NULL,
+    dst      INTEGER NOT NULL,
+    src_kind TEXT NOT NULL,
+    dst_kind TEXT NOT NULL,
+    stage    TEXT NOT NULL,
+    PRIMARY KEY (src, dst_kind, dst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_dst ON edges (dst, src_kind, src);
+CREATE INDEX IF NOT EXISTS edges_stage ON edges (stage);
+"""
+
+class LineageIndex:
+    def __init__(self, path: Path | str = DB, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            self.db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self) -> "LineageIndex":
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.db.commit()
+        else:
+            self.db.rollback()
+        self.db.close()
+
+    # -------- Escritura --------
+    def upsert(self, nodes):
+        """Nodos (kind, key, sha256, entity, attrs); los campos None no pisan los existentes."""
+        self.db.executemany(
+            "INSERT INTO nodes (kind, key, sha256, entity, attrs) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, key) DO UPDATE SET sha256 = coalesce(excluded.sha256, sha256), "
+            "entity = coalesce(excluded.entity, entity), attrs = coalesce(excluded.attrs, attrs)",
+            ((k, key, sha, ent, None if attrs is None else json.dumps(attrs, sort_keys=True))
+             for k, key, sha, ent, attrs in nodes))
+
+    def link(self, stage: str, pairs):
+        """Aristas ((kind, key) origen, (kind, key) destino); crea los nodos que falten."""
+        pairs = set(pairs)
+        # en bloque y en orden de clave (inserciones secuenciales en los B-tree): nodos que falten,
+        # tabla temporal con los pares y un único INSERT … SELECT con los dos joins
+        self.db.executemany("INSERT OR IGNORE INTO nodes (kind, key) VALUES (?, ?)",
+                            sorted({n for pair in pairs for n in pair}))
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS _pairs (sk TEXT, skey TEXT, dk TEXT, dkey TEXT)")
+        self.db.execute("DELETE FROM _pairs")
+        self.db.executemany("INSERT INTO _pairs VALUES (?, ?, ?, ?)", ((*src, *dst) for src, dst in pairs))
+        self.db.execute(
+            "INSERT OR IGNORE INTO edges (src, dst, src_kind, dst_kind, stage) "
+            "SELECT s.id, d.id, p.sk, p.dk, ? FROM _pairs p "
+            "JOIN nodes s ON s.kind = p.sk AND s.key = p.skey JOIN nodes d ON d.kind = p.dk AND d.key = p.dkey "
+            "ORDER BY s.id, p.dk, d.id",
+            (stage,))
+        self.db.execute("DELETE FROM _pairs")
+
+    def drop(self, kind: str, keys):
+        """Elimina nodos y todas sus aristas."""
+        keys = [(kind, k) for k in keys]
+        sel = "(SELECT id FROM nodes WHERE kind = ? AND key = ?)"
+        self.db.executemany(f"DELETE FROM edges WHERE src = {sel}", keys)
+        self.db.executemany(f"DELETE FROM edges WHERE dst = {sel}", keys)
+        self.db.executemany("DELETE FROM nodes WHERE kind = ? AND key = ?", keys)
+
+    def sync_stage(self, stage: str, pairs, prune: bool = True) -> dict:
+        """Deja las aristas de `stage` exactamente en `pairs` (solo se escribe el diff); los nodos
+        que quedan sin ninguna arista se eliminan. prune=False solo añade (ejecuciones parciales)."""
+        new = set(pairs)
+        old = set() if not prune else {((sk, skey), (dk, dkey)) for sk, skey, dk, dkey in self.db.execute(
+            "SELECT s.kind, s.key, d.kind, d.key FROM edges e JOIN nodes s ON s.id = e.src "
+            "JOIN nodes d ON d.id = e.dst WHERE e.stage = ?", (stage,))}
+        gone = old - new
+        self.db.executemany(
+            "DELETE FROM edges WHERE src = (SELECT id FROM nodes WHERE kind = ? AND key = ?) "
+            "AND dst = (SELECT id FROM nodes WHERE kind = ? AND key = ?)", ((*s, *d) for s, d in gone))
+        self.db.executemany(
+            "DELETE FROM nodes WHERE kind = ? AND key = ? AND NOT EXISTS (SELECT 1 FROM edges WHERE src = nodes.id) "
+            "AND NOT EXISTS (SELECT 1 FROM edges WHERE dst = nodes.id)", {n for pair in gone for n in pair})
+        self.link(stage, new - old)
+        return {"added": len(new - old), "removed": len(gone)}
+
+    # -------- Consultas --------
+    def _walk(self, where: str, params: tuple, forward: bool, depth: int, skip, limit: int) -> list[dict]:
+        """Recorrido en anchura, una consulta por nivel: se detiene al llegar a `limit` nodos (una CTE
+        recursiva expande y deduplica la cola completa antes de cortar)."""
+        nxt, cur = ("dst", "src") if forward else ("src", "dst")
+        follow = tuple(k for k in KINDS if k not in set(skip or ()))
+        follow_sql = f"AND e.{nxt}_kind IN ({','.join('?' * len(follow))})" if len(follow) < len(KINDS) else ""
+        step = f"SELECT e.{nxt} FROM edges e WHERE e.{cur} IN (SELECT value FROM json_each(?)) {follow_sql}"
+        seen = {i: 0 for (i,) in self.db.execute(f"SELECT id FROM nodes WHERE {where} LIMIT ?", (*params, limit))}
+        frontier, level = list(seen), 0
+        while frontier and level < depth and len(seen) < limit:
+            level += 1
+            nodes, frontier = self.db.execute(step, (json.dumps(frontier), *(follow if follow_sql else ()))), []
+            for (i,) in nodes:
+                if i not in seen:
+                    seen[i] = level
+                    frontier.append(i)
+                    if len(seen) >= limit:
+                        break
+        rows = self.db.execute("SELECT id, kind, key, sha256, entity, attrs FROM nodes "
+                               "WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(seen)),))
+        out = [{"kind": k, "key": key, "sha256": sha, "entity": ent,
+                "attrs": json.loads(attrs) if attrs else None, "depth": seen[i]}
+               for i, k, key, sha, ent, attrs in rows]
+        return sorted(out, key=lambda r: (r["depth"], r["kind"], r["key"]))
+
+    def upstream(self, kind: str, key: str, depth: int = MAX_DEPTH, skip=(), limit: int = LIMIT) -> list[dict]:
+        """Procedencia hacia atrás: de qué nodos deriva (kind, key)."""
+        return self._walk("kind = ? AND key = ?", (kind, key), False, depth, skip, limit)
+
+    def downstream(self, kind: str, key: str, depth: int = MAX_DEPTH, skip=(), limit: int = LIMIT) -> list[dict]:
+        """Impacto hacia delante: qué salidas dependen de (kind, key)."""
+        return self._walk("kind = ? AND key = ?", (kind, key), True, depth, skip, limit)
+
+    def feeds(self, dp: str, entity: str | None = None, depth: int = MAX_DEPTH, skip=(), limit: int = LIMIT) -> list[dict]:
+        """Registros (hashes) y archivos fuente de un KPI, opcionalmente de una sola entidad."""
+        if entity is None:
+            return self.upstream("kpi", dp, depth, skip, limit)
+        # grupos "dp|entidad|periodo|source_system": rango sobre el índice (kind, key)
+        prefix = f"{dp}|{entity}|"
+        return self._walk("kind = 'kpi_group' AND key >= ? AND key < ?", (prefix, prefix + "\U0010ffff"),
+                          False, depth, skip, limit)
+
+    def keys(self, kind: str, like: str = "", limit: int = 200) -> list[str]:
+        return [k for (k,) in self.db.execute(
+            "SELECT key FROM nodes WHERE kind = ? AND key LIKE ? ORDER BY key LIMIT ?", (kind, f"%{like}%", limit))]
+
+    def stats(self) -> dict:
+        kinds = dict(self.db.execute("SELECT kind, count(*) FROM nodes GROUP BY kind").fetchall())
+        return {"nodes": sum(kinds.values()), "edges": self.db.execute("SELECT count(*) FROM edges").fetchone()[0],
+                "by_kind": kinds}
+
+    # -------- Alimentación desde las etapas --------
+    def sync_kpis(self, state, domains: dict, full: bool = False) -> dict:
+        """Aplica al índice los cambios de KPIState (registros que entran o salen en este run).
+        full (o índice sin KPIs): se vuelca el estado completo y se reconcilia con sync_stage."""
+        full = full or not self.db.execute("SELECT 1 FROM nodes WHERE kind = 'kpi' LIMIT 1").fetchone()
+        # por hash manda el último cambio (un registro puede entrar y salir en el mismo run)
+        net = {h: (sign, dom, g) for sign, dom, h, g in
+               ([(+1, rec["domain"], h, rec["group"]) for h, rec in state.records.items()] if full else state.changes)}
+        new = [(dom, h, g) for h, (sign, dom, g) in net.items() if sign > 0]
+        gone = [(dom, h, g) for h, (sign, dom, g) in net.items() if sign < 0]
+        group = lambda dom, g: f"{domains[dom]['dp']}|{g}"
+        links = []
+        for dom, h, g in new:
+            f, grp, dp = domains[dom]["normalized"], group(dom, g), domains[dom]["dp"]
+            links += [(("normalized_file", f), ("record", h)), (("record", h), ("kpi_group", grp)),
+                      (("normalized_file", f), ("kpi_group", grp)), (("kpi_group", grp), ("kpi", dp))]
+        if full:
+            delta = self.sync_stage("RAGA.compute", links)
+        else:
+            self.drop("record", [h for _, h, _ in gone])
+            # grupos que se quedaron sin registros en el estado
+            self.drop("kpi_group", {group(dom, g) for dom, _, g in gone if g not in state.groups.get(dom, {})})
+            self.link("RAGA.compute", links)
+            delta = {"added": len(set(links)), "removed": len(gone)}
+        # los registros no llevan más datos (la clave ya es su hash); la entidad va en el grupo
+        self.upsert([("kpi_group", grp, None, grp.split("|")[1], None) for grp in {group(dom, g) for dom, _, g in new}]
+                    + [("kpi", spec["dp"], None, None, {"value": state.values.get(spec["dp"])})
+                       for spec in domains.values()])
+        return {"full": full, "records_in": len(new), "records_out": len(gone), **delta}
+
+def import_files(idx: LineageIndex, lineage_jsonl: Path = Path("data/lineage.jsonl"),
+                 linaje_ttl: Path = Path("ontology/linaje.ttl")) -> dict:
+    """Carga inicial desde los artefactos planos (runs anteriores al índice) y raga/kpi_state.json."""
+    n_files = n_rdf = 0
+    if lineage_jsonl.exists():
+        for line in lineage_jsonl.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            idx.upsert([("source_file", d["src"], d["src_sha256"], None, {"source_system": d["source_system"]}),
+                        ("normalized_file", d["normalized"], d["normalized_sha256"], None, {"domain": d["domain"]})])
+            idx.link("MCP.ingest", [(("source_file", d["src"]), ("normalized_file", d["normalized"]))])
+            n_files += 1
+    if linaje_ttl.exists():
+        from rdflib import Graph, Namespace
+        ex = Namespace("http://example.com/esrs#")
+        g = Graph().parse(linaje_ttl, format="turtle")
+        pairs = []
+        for ev, path in g.subject_objects(ex.evidencePath):
+            for subj in g.subjects(ex.hasEvidence, ev):
+                pairs.append((("normalized_file", str(path)), ("rdf_node", str(subj))))
+        idx.link("SHACL.validate", pairs)
+        n_rdf = len(pairs)
+    kpis = {}
+    if Path("raga/kpi_state.json").exists():
+        from kpi_state import KPIState, DOMAINS
+        kpis = idx.sync_kpis(KPIState(), DOMAINS, full=True)
+    return {"files": n_files, "rdf_nodes": n_rdf, "kpis": kpis}
+
+def _print(rows: list[dict], elapsed_ms: float):
+    for r in rows:
+        print(f"{'  ' * r['depth']}{r['kind']:16} {r['key']}" + (f"  sha256={r['sha256'][:12]}" if r["sha256"] else ""))
+    print(f"({len(rows)} nodos, {elapsed_ms:.1f} ms)", file=sys.stderr)
+
+if __name__ == "__main__":
+    # python scripts/lineage_index.py import                      → carga lineage.jsonl + linaje.ttl
+    # python scripts/lineage_index.py up|down <kind> <key>        → procedencia / impacto
+    # python scripts/lineage_index.py feeds <dp> [entidad]        → registros y fuentes de un KPI
+    # python scripts/lineage_index.py stats
+    args = sys.argv[1:]
+    if args[:1] == ["import"]:
+        with LineageIndex() as idx:
+            print(import_files(idx))
+    elif len(args) == 3 and args[0] in ("up", "down"):
+        with LineageIndex(readonly=True) as idx:
+            t0 = time.perf_counter()
+            rows = (idx.upstream if args[0] == "up" else idx.downstream)(args[1], args[2])
+            _print(rows, (time.perf_counter() - t0) * 1000)
+    elif len(args) in (2, 3) and args[0] == "feeds":
+        with LineageIndex(readonly=True) as idx:
+            t0 = time.perf_counter()
+            rows = idx.feeds(args[1], args[2] if len(args) == 3 else None)
+            _print(rows, (time.perf_counter() - t0) * 1000)
+    elif args[:1] == ["stats"]:
+        with LineageIndex(readonly=True) as idx:
+            print(json.dumps(idx.stats(), indent=2))
+    else:
+        print("Uso: python scripts/lineage_index.py import | up|down <kind> <key> | feeds <dp> [entidad] | stats")
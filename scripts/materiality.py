@@ -0,0 +1,155 @@
+"""
+Doble materialidad por lotes (ESRS 1) a partir de raga/rules.yaml → materiality.
+
+- Catálogo de temas/subtemas en rules.yaml; valoraciones 1–5 por entidad y subtema en el
+  CSV de `assessment` (scale, scope, irremediability, likelihood, financial_magnitude,
+  financial_likelihood).
+- Una pasada vectorizada sobre el tensor subtemas × entidades × criterios:
+    impacto    = media(scale, scope, irremediability) · likelihood
+    financiero = financial_magnitude · financial_likelihood        (normalizados a [0,1])
+  material si impacto ≥ impact_threshold o financiero ≥ financial_threshold (umbral del
+  tema o el de por defecto). Sin valorar → material (no hay base para omitirlo).
+- Tema material para una entidad si lo es alguno de sus subtemas (reduceat sobre los temas
+  con subtemas; un tema sin subtemas en el catálogo es material); para el grupo, si lo es
+  en alguna entidad.
+- Scores intermedios cacheados por hash de las filas de cada entidad (raga/materiality_cache.json):
+  solo se puntúan las entidades cuya valoración cambió. Si no cambia nada (hash de
+  entrada), el mapa se reutiliza tal cual.
+- raga/materiality.json: mapa por tema/entidad/subtema y DP materiales; EEE-Gate y
+  XBRL omiten los DP de temas no materiales (sin mapa → todo material).
+"""
+import csv, json, sys
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from utils_hash import sha256_file, sha256_json
+
+RULES = Path("raga/rules.yaml")
+MAP = Path("raga/materiality.json")
+CACHE = Path("raga/materiality_cache.json")
+CRITERIA = ["scale", "scope", "irremediability", "likelihood", "financial_magnitude", "financial_likelihood"]
+SCALE_MIN, SCALE_MAX = 1.0, 5.0
+
+def load_rules(path: Path = RULES) -> dict:
+    import yaml
+    return (yaml.safe_load(path.read_text(encoding="utf-8")) or {}).get("materiality") or {}
+
+def dp_topic(dp: str) -> str:
+    # "E1-1.total_co2e_tons" → "E1"
+    return dp.split(".")[0].split("-")[0]
+
+def scores(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """… × CRITERIA en escala 1–5 (NaN = sin valorar) → (impacto, financiero) en [0,1]."""
+    v = (values - SCALE_MIN) / (SCALE_MAX - SCALE_MIN)
+    return v[..., :3].mean(axis=-1) * v[..., 3], v[..., 4] * v[..., 5]
+
+def read_assessment(path: Path, subtopics: dict[str, int]) -> dict[str, list[dict]]:
+    by_entity: dict[str, list[dict]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["subtopic"] not in subtopics:
+                raise ValueError(f"Subtema fuera del catálogo de rules.yaml: {row['subtopic']}")
+            by_entity.setdefault(row["entity"], []).append({k: row[k] for k in ["subtopic", *CRITERIA]})
+    return by_entity
+
+def _col(x: np.ndarray) -> list:
+    return [None if np.isnan(v) else round(float(v), 4) for v in x]
+
+def assess(rules: dict | None = None, cache_path: Path = CACHE, map_path: Path = MAP) -> dict:
+    rules = rules if rules is not None else load_rules()
+    topics = list(rules.get("topics", {}))
+    sizes = [len(rules["topics"][t] or []) for t in topics]
+    subs = [s for t in topics for s in rules["topics"][t] or []]
+    sub_idx = {s: i for i, s in enumerate(subs)}
+    # reduceat con un tramo vacío devolvería el primer subtema del tema siguiente: solo temas con subtemas
+    nonempty = [i for i, n in enumerate(sizes) if n]
+    starts = np.cumsum([0] + [sizes[i] for i in nonempty[:-1]]).astype(int)
+    src = Path(rules.get("assessment", ""))
+    input_hash = sha256_json({"rules": rules, "assessment": sha256_file(src) if src.is_file() else None})
+    if map_path.exists():
+        prev = json.loads(map_path.read_text(encoding="utf-8"))
+        if prev.get("input_hash") == input_hash:
+            return prev | {"cache": {"reused_map": True}}
+
+    by_entity = read_assessment(src, sub_idx) if src.is_file() else {}
+    entities = sorted(by_entity)
+    cache = json.loads(cache_path.read_text(encoding="utf-8")) if cache_path.exists() else {}
+    keys = {e: sha256_json({"subtopics": subs, "rows": by_entity[e]}) for e in entities}
+    todo = [e for e in entities if keys[e] not in cache]
+    if todo and subs:
+        # una pasada: subtemas × entidades pendientes × criterios
+        x = np.full((len(subs), len(todo), len(CRITERIA)), np.nan)
+        for j, e in enumerate(todo):
+            for row in by_entity[e]:
+                x[sub_idx[row["subtopic"]], j] = [float(row[c]) if row[c] != "" else np.nan for c in CRITERIA]
+        impact, financial = scores(x)
+        for j, e in enumerate(todo):
+            cache[keys[e]] = {"impact": _col(impact[:, j]), "financial": _col(financial[:, j])}
+
+    shape = (len(subs), len(entities))
+    imp = np.array([cache[keys[e]]["impact"] for e in entities], dtype=float).T.reshape(shape)
+    fin = np.array([cache[keys[e]]["financial"] for e in entities], dtype=float).T.reshape(shape)
+    th = {t: (float(rules.get(t, {}).get("impact_threshold", rules.get("impact_threshold", 0.5))),
+              float(rules.get(t, {}).get("financial_threshold", rules.get("financial_threshold", 0.5))))
+          for t in topics}
+    th_i = np.repeat([th[t][0] for t in topics], sizes)
+    th_f = np.repeat([th[t][1] for t in topics], sizes)
+    assessed = ~(np.isnan(imp) & np.isnan(fin))
+    with np.errstate(invalid="ignore"):
+        material = (imp >= th_i[:, None]) | (fin >= th_f[:, None]) | ~assessed
+    t_material = np.ones((len(topics), len(entities)), dtype=bool)
+    t_imp, t_fin = np.full((len(topics), len(entities)), np.nan), np.full((len(topics), len(entities)), np.nan)
+    if subs and entities:
+        t_material[nonempty] = np.logical_or.reduceat(material, starts, axis=0)
+        with np.errstate(invalid="ignore"):
+            t_imp[nonempty], t_fin[nonempty] = np.fmax.reduceat(imp, starts, axis=0), np.fmax.reduceat(fin, starts, axis=0)
+    group = t_material.any(axis=1) if entities else np.ones(len(topics), dtype=bool)
+    g_imp, g_fin = ((np.fmax.reduce(a, axis=1) if entities else np.full(len(topics), np.nan)) for a in (t_imp, t_fin))
+    ti, tf, gi, gf = [_col(r) for r in t_imp], [_col(r) for r in t_fin], _col(g_imp), _col(g_fin)
+
+    # la caché solo guarda las entradas vigentes
+    cache = {keys[e]: cache[keys[e]] for e in entities}
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(json.dumps(cache))
+    out = {
+        "utc": datetime.utcnow().isoformat() + "Z",
+        "input_hash": input_hash,
+        "assessment": str(src) if src.is_file() else None,
+        "entities": entities,
+        "topics": {t: {"material": bool(group[i]),
+                       "thresholds": {"impact": th[t][0], "financial": th[t][1]},
+                       "impact": gi[i], "financial": gf[i],
+                       "entities": {e: {"material": bool(t_material[i, j]), "impact": ti[i][j], "financial": tf[i][j]}
+                                    for j, e in enumerate(entities)}}
+                   for i, t in enumerate(topics)},
+        "subtopics": {s: {"material": [e for j, e in enumerate(entities) if material[i, j]],
+                          "unassessed": [e for j, e in enumerate(entities) if not assessed[i, j]]}
+                      for i, s in enumerate(subs)},
+        "cache": {"reused_map": False, "entities_scored": len(todo), "entities_cached": len(entities) - len(todo)},
+    }
+    map_path.parent.mkdir(parents=True, exist_ok=True)
+    map_path.write_text(json.dumps(out, indent=2, ensure_ascii=False))
+    return out
+
+def load_map(path: Path = MAP) -> dict | None:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+def is_material(dp: str, mmap: dict | None) -> bool:
+    # sin mapa, o tema fuera del catálogo → material
+    if mmap is None:
+        return True
+    return mmap["topics"].get(dp_topic(dp), {}).get("material", True)
+
+def split(dps, mmap: dict | None) -> tuple[list[str], list[str]]:
+    """(DP materiales, DP omitidos por no materiales)."""
+    material = [dp for dp in dps if is_material(dp, mmap)]
+    return material, [dp for dp in dps if dp not in material]
+
+if __name__ == "__main__":
+    # python scripts/materiality.py  → evalúa y muestra la matriz tema × entidad
+    m = assess()
+    print(f"{'':6}" + "".join(f"{e:>10}" for e in m["entities"]) + f"{'grupo':>8}")
+    for t, info in m["topics"].items():
+        print(f"{t:6}" + "".join(f"{('X' if v['material'] else '·'):>10}" for v in info["entities"].values())
+              + f"{('X' if info['material'] else '·'):>8}")
+    print("→", MAP, m["cache"], file=sys.stderr)
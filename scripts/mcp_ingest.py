@@ -1,10 +1,13 @@
-import json, re
+import asyncio, json, os
 from pathlib import Path
 from datetime import datetime
-import pandas as pd
 from jsonschema import Draft202012Validator
 from utils_hash import sha256_file, sha256_json, write_json
-import yaml # pyyaml es necesario para load_yaml
+from tracing import stage, span
+from dq_service import DQService, DQ_THRESHOLD
+from kpi_state import group_key
+from connectors import SOURCES_FILE, FileConnector, load_sources, extract
+from lineage_index import LineageIndex
 
 # -------- Config --------
 SAMPLES = {
@@ -26,164 +29,212 @@ SAMPLES = {
 }
 DQ_RULES_FILE = "contracts/dq_rules.yaml"
 
-# -------- Helpers DQ --------
-def is_date_iso(s: str) -> bool:
-    try:
-        datetime.strptime(s, "%Y-%m-%d")
-        return True
-    except Exception:
-        return False
-
-def is_yyyy_mm(s: str) -> bool:
-    return bool(re.fullmatch(r"\d{4}-\d{2}", s))
-
-def within_month(date_str: str, month: str) -> bool:
-    # month = 'YYYY-MM'
-    return date_str.startswith(month)
-
-def apply_rule(row: dict, rule: dict, domain: str) -> bool:
-    # Supports simple predicates used in dq_rules.yaml
-    name = rule.get("rule")
-    field = rule.get("field")
-    if name == "not_null":
-        return row.get(field) is not None
-    if name == "is_date":
-        return is_date_iso(str(row.get(field, "")))
-    if name == "is_yyyy_mm":
-        return is_yyyy_mm(str(row.get(field, "")))
-    if name == ">=0":
-        try:
-            val = row.get(field)
-            if val is None: return False
-            return float(val) >= 0
-        except Exception:
-            return False
-    if name and name.startswith("within_month("):
-        m = re.search(r"within_month\('([^']+)'\)", name)
-        month = m.group(1) if m else ""
-        return within_month(str(row.get(field, "")), month)
-    if name and name.startswith("equals("):
-        m = re.search(r"equals\('([^']+)'\)", name)
-        ref = m.group(1) if m else ""
-        return str(row.get(field, "")) == ref
-    if name == "period_start <= period_end":
-        try:
-            ps = datetime.strptime(row.get("period_start"), "%Y-%m-%d")
-            pe = datetime.strptime(row.get("period_end"), "%Y-%m-%d")
-            return ps <= pe
-        except Exception:
-            return False
-    if name == "employees_end <= employees_start + 1000":
-        try:
-            return int(row.get("employees_end", 0)) <= int(row.get("employees_start", 0)) + 1000
-        except Exception:
-            return False
-    if name == "closed_with_resolution <= cases_closed":
-        try:
-            return int(row.get("closed_with_resolution", 0)) <= int(row.get("cases_closed", 0))
-        except Exception:
-            return False
-    return True
-
-def evaluate_dq(records: list[dict], rules: dict, domain: str) -> dict:
-    res = {"completeness": [], "validity": [], "consistency": [], "timeliness": []}
-    for cat in res.keys():
-        for r in rules.get(cat, []):
-            passed = sum(1 for row in records if apply_rule(row, r, domain))
-            total = max(1, len(records))
-            res[cat].append({"rule": r, "pass_rate": passed / total})
-    # Aggregate
-    agg = {k: (sum(x["pass_rate"] for x in v) / max(1, len(v))) if v else 1.0 for k, v in res.items()}
-    agg["dq_pass"] = all(v >= 0.95 for v in agg.values())
-    return {"by_rule": res, "aggregate": agg}
-
-# -------- Load DQ rules --------
-def load_yaml(path: str) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
-
+# -------- Helpers --------
 def json_load(path: str) -> dict | list:
     return json.loads(Path(path).read_text(encoding="utf-8"))
 
+def get_sources() -> dict:
+    # ops/sources.yaml define los conectores por source_system; sin él, los JSON de SAMPLES
+    if SOURCES_FILE.exists():
+        return load_sources(SOURCES_FILE)
+    return {"samples": FileConnector("samples", {"entities": {d: c["input"] for d, c in SAMPLES.items()}})}
+
+def validators() -> dict:
+    return {d: Draft202012Validator(json_load(c["schema"])) for d, c in SAMPLES.items()}
+
+def schema_validate(validator, records: list) -> tuple[list, list]:
+    valid, errors = [], []
+    for i, rec in enumerate(records):
+        errs = sorted(validator.iter_errors(rec), key=lambda e: e.path)
+        if errs:
+            errors.append({"index": i, "errors": [e.message for e in errs]})
+        else:
+            valid.append(rec)
+    return valid, errors
+
+def extract_validate(sources: dict, validate: bool = True) -> tuple[dict, dict]:
+    """
+    Extracción concurrente de todas las fuentes con validación JSON Schema página a página
+    mientras llegan las demás. Devuelve, por dominio, los flujos en orden de configuración.
+    validate=False (vista previa): solo extrae; se valida después la muestra.
+    """
+    schemas = validators()
+    pages: dict[tuple, dict[int, tuple]] = {}
+
+    def on_page(system, entity, page_no, records):
+        if entity not in schemas:
+            raise ValueError(f"{system}: entidad sin contrato en SAMPLES: {entity}")
+        if not validate:
+            pages.setdefault((system, entity), {})[page_no] = (records, [], [])
+            return
+        with span("schema_validate", domain=entity, source=system, page=page_no) as sp:
+            valid, errors = schema_validate(schemas[entity], records)
+            pages.setdefault((system, entity), {})[page_no] = (records, valid, errors)
+            sp.set(records=len(records), invalid=len(errors))
+
+    stats = asyncio.run(extract(sources, on_page))
+    streams: dict[str, list] = {d: [] for d in SAMPLES}
+    for system, conn in sources.items():
+        for entity in conn.cfg["entities"]:
+            records, valid, errors = [], [], []
+            for n in sorted(pages.get((system, entity), {})):
+                recs, ok, errs = pages[(system, entity)][n]
+                errors += [{**e, "index": e["index"] + len(records)} for e in errs]
+                records += recs
+                valid += ok
+            streams[entity].append({"system": system, "connector": conn, "uri": conn.uri(entity),
+                                    "records": records, "valid": valid, "errors": errors})
+    return streams, stats
+
+def preview_sample(streams: dict, n: int) -> dict:
+    """Vista previa: cada flujo se queda con su parte de la muestra estratificada del dominio
+    (estratos sobre todos los flujos) y solo esa parte se valida. Devuelve los estratos."""
+    import preview
+    schemas, out = validators(), {}
+    for domain, sts in streams.items():
+        with span("preview_sample", domain=domain) as sp:
+            idx, out[domain] = preview.sample(domain, [r for st in sts for r in st["records"]], n)
+            picked, offset = set(idx), 0
+            for st in sts:
+                total = len(st["records"])
+                st["records"] = [r for i, r in enumerate(st["records"], offset) if i in picked]
+                offset += total
+                st["valid"], st["errors"] = schema_validate(schemas[domain], st["records"])
+            sp.set(records=offset, sampled=len(idx), strata=len(out[domain]))
+    return out
+
+def preview_report(dq: DQService, streams: dict, strata: dict) -> dict:
+    """Tasas de validez de schema y de DQ por categoría estimadas para la población, con IC."""
+    import preview
+    out = {}
+    for domain, sts in streams.items():
+        records = [r for st in sts for r in st["records"]]
+        valid = [r for st in sts for r in st["valid"]]
+        ok = {id(r) for r in valid}
+        s = strata[domain]
+        schema = preview.rate(s, [group_key(domain, r) for r in records], [id(r) in ok for r in records])
+        keys = [group_key(domain, r) for r in valid]
+        cats = {c: preview.rate(s, keys, scores) for c, scores in dq.record_scores(valid, domain).items()}
+        out[domain] = {
+            "records_total": sum(v["N"] for v in s.values()),
+            "records_sampled": len(records),
+            "strata": len(s),
+            "schema_validity": schema,
+            "dq": cats,
+            "dq_decision": {c: preview.decide(e, DQ_THRESHOLD) for c, e in cats.items()},
+        }
+    decisions = {d for v in out.values() for d in v["dq_decision"].values()}
+    return {"domains": out, "dq_pass": "fail" if "fail" in decisions else "uncertain" if "uncertain" in decisions else "pass"}
+
 # -------- Main --------
 def main():
-    dq_rules = load_yaml(DQ_RULES_FILE)
+    # reglas DQ cargadas y compiladas una vez (mismo motor que el servicio en streaming)
+    dq = DQService(DQ_RULES_FILE)
+    # vista previa (preview.py): se importa solo si se pide, arrastra numpy
+    preview_n = None
+    if os.environ.get("STEELTRACE_PREVIEW"):
+        import preview
+        preview_n = preview.sample_size()
 
     normalized_paths = []
     dq_summary = {}
 
+    # 1-2) Extraer (todas las fuentes en paralelo) y validar JSON Schema según llegan las páginas:
+    #      la latencia queda acotada por la fuente más lenta, no por la suma
+    with span("extract_validate") as sp:
+        streams, extract_stats = extract_validate(get_sources(), validate=preview_n is None)
+        sp.set(records=sum(len(st["records"]) for v in streams.values() for st in v),
+               wall_sec=extract_stats["wall_sec"], sum_stream_sec=extract_stats["sum_stream_sec"])
+    if preview_n:
+        strata = preview_sample(streams, preview_n)
+        preview.save_strata(strata, preview_n)
+
     for domain, cfg in SAMPLES.items():
-        src = Path(cfg["input"])
         sch = Path(cfg["schema"])
         dst = Path(cfg["normalized"])
         dst.parent.mkdir(parents=True, exist_ok=True)
-
-        # 1) Cargar datos
-        records = json_load(src)
-        if not isinstance(records, list):
-            raise ValueError(f"{src} debe ser una lista de objetos JSON")
-
-        # 2) Validar JSON Schema
-        schema = json_load(sch)
-        validator = Draft202012Validator(schema)
-        valid_records, errors = [], []
-        for i, rec in enumerate(records):
-            errs = sorted(validator.iter_errors(rec), key=lambda e: e.path)
-            if errs:
-                errors.append({"index": i, "errors": [e.message for e in errs]})
-            else:
-                valid_records.append(rec)
+        records, valid_records, errors = [], [], []
+        for st in streams[domain]:
+            errors += [{**e, "index": e["index"] + len(records)} for e in st["errors"]]
+            records += st["records"]
+            valid_records += st["valid"]
+        uris = [st["uri"] for st in streams[domain]]
 
         # 3) Escribir normalizados (solo válidos)
-        write_json(dst, valid_records)
-        normalized_paths.append(str(dst))
+        with span("write_normalized", domain=domain) as sp:
+            write_json(dst, valid_records)
+            normalized_paths.append(str(dst))
+            sp.set(records=len(valid_records), bytes=dst.stat().st_size)
 
         # 4) DQ por reglas
-        rules = dq_rules.get(domain, {})
-        dq = evaluate_dq(valid_records, rules, domain)
-        dq_summary[domain] = {
-            "source": str(src),
-            "schema": str(sch),
-            "records_total": len(records),
-            "records_valid": len(valid_records),
-            "schema_errors": errors,
-            "dq": dq
-        }
+        with span("dq_rules", domain=domain) as sp:
+            result = dq.evaluate(valid_records, domain)
+            dq_summary[domain] = {
+                "source": uris[0] if len(uris) == 1 else uris,
+                "schema": str(sch),
+                "records_total": len(records),
+                "records_valid": len(valid_records),
+                "schema_errors": errors,
+                "dq": result
+            }
+            sp.set(records=len(valid_records), rules=len(dq.rules.get(domain, [])))
 
     # 5) Linaje y hashes
-    lineage_path = Path("data/lineage.jsonl")
-    lineage_path.parent.mkdir(parents=True, exist_ok=True)
-    lines = []
-    for domain, cfg in SAMPLES.items():
-        src = Path(cfg["input"])
-        dst = Path(cfg["normalized"])
-        lines.append(json.dumps({
-            "domain": domain,
-            "src": str(src),
-            "src_sha256": sha256_file(src),
-            "normalized": str(dst),
-            "normalized_sha256": sha256_file(dst),
-            "utc": datetime.utcnow().isoformat() + "Z"
-        }))
-
-    lineage_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    with span("lineage") as sp:
+        lineage_path = Path("data/lineage.jsonl")
+        lineage_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = []
+        for domain, cfg in SAMPLES.items():
+            dst = Path(cfg["normalized"])
+            for st in streams[domain]:
+                # fuentes de archivo: hash del archivo; remotas: hash canónico de lo extraído
+                file_src = isinstance(st["connector"], FileConnector)
+                lines.append(json.dumps({
+                    "domain": domain,
+                    "source_system": st["system"],
+                    "src": st["uri"],
+                    "src_sha256": sha256_file(st["uri"]) if file_src else sha256_json(st["records"]),
+                    "normalized": str(dst),
+                    "normalized_sha256": sha256_file(dst),
+                    "utc": datetime.utcnow().isoformat() + "Z"
+                }))
+
+        lineage_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        sp.set(records=len(lines))
+
+    # 5b) Índice de linaje consultable (lineage_index.py): fuente → normalizado
+    with span("lineage_index") as sp, LineageIndex() as idx:
+        entries = [json.loads(l) for l in lines]
+        sp.set(**idx.sync_stage("MCP.ingest", [(("source_file", d["src"]), ("normalized_file", d["normalized"]))
+                                               for d in entries]))
+        idx.upsert([("source_file", d["src"], d["src_sha256"], None, {"source_system": d["source_system"]})
+                    for d in entries]
+                   + [("normalized_file", d["normalized"], d["normalized_sha256"], None, {"domain": d["domain"]})
+                      for d in entries])
 
     # 6) Reporte DQ agregado
-    def ok(dom):
-        agg = dq_summary[dom]["dq"]["aggregate"]
-        return all(agg[k] >= 0.95 for k in ["completeness","validity","consistency","timeliness"])
-
-    dq_report = {
-        "domains": dq_summary,
-        "dq_pass": all(ok(dom) for dom in dq_summary.keys())
-    }
-    write_json("data/dq_report.json", dq_report)
+    with span("dq_report"):
+        def ok(dom):
+            agg = dq_summary[dom]["dq"]["aggregate"]
+            return all(agg[k] >= 0.95 for k in ["completeness","validity","consistency","timeliness"])
+
+        dq_report = {
+            "domains": dq_summary,
+            "extract": extract_stats,
+            "dq_pass": all(ok(dom) for dom in dq_summary.keys())
+        }
+        if preview_n:
+            # en vista previa las tasas anteriores son de la muestra; estas, de la población con IC
+            dq_report["preview"] = preview_report(dq, streams, strata)
+            preview.record("MCP.ingest", dq_report["preview"])
+        write_json("data/dq_report.json", dq_report)
 
-    print("Ingesta/DQ completada.")
+    print("Ingesta/DQ completada." + (f" (vista previa: muestra de {preview_n} por dominio → {preview.REPORT})" if preview_n else ""))
     print("data/dq_report.json escrito.")
     print("data/lineage.jsonl escrito.")
     for p in normalized_paths:
         print("OK →", p)
 
 if __name__ == "__main__":
-    main()
+    with stage("MCP.ingest"):
+        main()
@@ -17,6 +17,29 @@ def merkle_root_from_hashes(hashes: list[str]) -> str:
         level = nxt
     return hashlib.sha256(level[0]).hexdigest()
 
+def merkle_proof(hashes: list[str], index: int) -> list[dict]:
+    # camino de hermanos desde la hoja `index` hasta la raíz (mismo esquema que merkle_root_from_hashes)
+    level = [h.encode("utf-8") for h in hashes]
+    proof = []
+    while len(level) > 1:
+        sib = index ^ 1
+        b = level[sib] if sib < len(level) else level[index]
+        proof.append({"sibling": b.hex(), "side": "right" if index % 2 == 0 else "left"})
+        nxt = []
+        for i in range(0, len(level), 2):
+            a = level[i]
+            c = level[i+1] if i+1 < len(level) else a
+            nxt.append(hashlib.sha256(a + c).digest())
+        level, index = nxt, index // 2
+    return proof
+
+def verify_proof(leaf: str, proof: list[dict], root: str) -> bool:
+    cur = leaf.encode("utf-8")
+    for step in proof:
+        sib = bytes.fromhex(step["sibling"])
+        cur = hashlib.sha256(cur + sib if step["side"] == "right" else sib + cur).digest()
+    return hashlib.sha256(cur).hexdigest() == root.removeprefix("SHA256:")
+
 def build_manifest(artifacts: list[str], run_id: str) -> dict:
     rows = []
     for a in artifacts:
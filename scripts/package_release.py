@@ -1,4 +1,18 @@
-import zipfile
+"""
+Empaquetado del paquete de auditoría.
+
+- Los miembros se comprimen en paralelo (zlib libera el GIL) a un almacén
+  direccionado por contenido: release/cas/objects/<sha[:2]>/<sha256>.
+- Un miembro cuyo sha256 ya está en el almacén no se vuelve a comprimir.
+- Formatos ya comprimidos (o que no ganan al deflactar) se guardan STORED.
+- Cada ejecución deja su manifiesto en release/cas/runs/<run_id>.json: el
+  bundle deduplicado entre ejecuciones es {manifiestos + objetos compartidos}.
+- El ZIP se materializa copiando los objetos por bloques (sin cargarlo en RAM)
+  a un .part que se renombra al terminar; si se interrumpe, la siguiente
+  ejecución reutiliza los objetos ya escritos.
+"""
+import hashlib, json, os, struct, sys, time, uuid, zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
@@ -14,15 +28,140 @@ ARTS = [
     "ops/slo_report.json","ops/hitl_kappa.json"
 ]
 
+CAS = Path(os.environ.get("STEELTRACE_CAS", "release/cas"))  # compartido entre runs
+AUDIT_DIR = Path("release/audit")
+CHUNK = 1 << 20
+LEVEL = 6
+WORKERS = int(os.environ.get("STEELTRACE_ZIP_WORKERS", os.cpu_count() or 4))
+# extensiones que ya vienen comprimidas: se guardan tal cual
+STORE_EXT = {".zip", ".gz", ".bz2", ".xz", ".7z", ".png", ".jpg", ".jpeg", ".pdf", ".xlsx", ".docx", ".parquet"}
+
+ZIP_STORED, ZIP_DEFLATED = 0, 8
+ZIP32_MAX = 0xFFFFFFFF
+
+def _object_path(sha: str) -> Path:
+    return CAS / "objects" / sha[:2] / sha
+
+def _hash_file(path: Path) -> tuple[str, int, int]:
+    h, crc, size = hashlib.sha256(), 0, 0
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK):
+            h.update(chunk); crc = zlib.crc32(chunk, crc); size += len(chunk)
+    return h.hexdigest(), crc, size
+
+def _inflate(src: Path, dst: Path):
+    with src.open("rb") as a, dst.open("wb") as b:
+        d = zlib.decompressobj(-15)
+        while chunk := a.read(CHUNK):
+            b.write(d.decompress(chunk))
+        b.write(d.flush())
+
+def _load_meta(sha: str) -> dict | None:
+    obj = _object_path(sha)
+    meta_path = obj.with_suffix(".json")
+    if obj.exists() and meta_path.exists():
+        return json.loads(meta_path.read_text(encoding="utf-8"))
+    return None
+
+def _store_object(path: Path) -> tuple[dict, int]:
+    """Escribe el objeto (deflate crudo o copia) y devuelve (metadatos, crc32).
+
+    sha256/crc32/tamaño salen de la misma lectura que produce el objeto: si el archivo
+    cambia durante el empaquetado, el objeto queda bajo el hash de lo que se escribió.
+    """
+    tmp_dir = CAS / "objects" / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f"{uuid.uuid4().hex}.tmp"
+    method = ZIP_STORED if path.suffix.lower() in STORE_EXT else ZIP_DEFLATED
+    h, crc, size = hashlib.sha256(), 0, 0
+    with path.open("rb") as src, tmp.open("wb") as dst:
+        comp = zlib.compressobj(LEVEL, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+        while chunk := src.read(CHUNK):
+            h.update(chunk); crc = zlib.crc32(chunk, crc); size += len(chunk)
+            dst.write(comp.compress(chunk) if comp else chunk)
+        if comp:
+            dst.write(comp.flush())
+    sha, csize = h.hexdigest(), tmp.stat().st_size
+    if method == ZIP_DEFLATED and csize >= size:
+        # no compensa: guardar sin comprimir (se infla el temporal, no se relee el origen)
+        raw = tmp.with_suffix(".raw")
+        _inflate(tmp, raw)
+        os.replace(raw, tmp)
+        method, csize = ZIP_STORED, size
+    obj = _object_path(sha)
+    meta_path = obj.with_suffix(".json")
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, obj)
+    meta = {"sha256": sha, "method": method, "size": size, "csize": csize}
+    tmp_meta = meta_path.with_name(f"{meta_path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_meta.write_text(json.dumps(meta))
+    os.replace(tmp_meta, meta_path)
+    return meta, crc
+
+def prepare_member(p: str) -> dict:
+    path = Path(p)
+    mtime = path.stat().st_mtime
+    # primera lectura solo para deduplicar; si el objeto no existe, el que se escribe
+    # fija sha/crc/tamaño (el contenido de esta lectura puede haber cambiado)
+    sha, crc, _ = _hash_file(path)
+    meta = _load_meta(sha)
+    if meta is None:
+        meta, crc = _store_object(path)
+    return {"path": p, "crc32": crc, "mtime": mtime, **meta}
+
+def _dos_time(ts: float) -> tuple[int, int]:
+    t = time.localtime(ts)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def write_zip(members: list[dict], out: Path) -> Path:
+    """Materializa un ZIP a partir de objetos del almacén (copia por bloques, sin recomprimir)."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    part = out.with_name(out.name + ".part")
+    central = []
+    with part.open("wb") as z:
+        for m in members:
+            name = m["path"].encode("utf-8")
+            dtime, ddate = _dos_time(m["mtime"])
+            offset = z.tell()
+            if max(m["size"], m["csize"], offset) >= ZIP32_MAX:
+                raise ValueError(f"{m['path']}: ZIP64 no soportado por este empaquetador")
+            fields = (20, 0x0800, m["method"], dtime, ddate, m["crc32"], m["csize"], m["size"], len(name))
+            z.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, *fields, 0) + name)
+            with _object_path(m["sha256"]).open("rb") as f:
+                while chunk := f.read(CHUNK):
+                    z.write(chunk)
+            central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 20, *fields, 0, 0, 0, 0, 0o644 << 16, offset) + name)
+        cd_offset = z.tell()
+        cd = b"".join(central)
+        z.write(cd)
+        z.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(central), len(central), len(cd), cd_offset, 0))
+    os.replace(part, out)
+    return out
+
+def build_members(paths: list[str], workers: int = WORKERS) -> list[dict]:
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        return list(ex.map(prepare_member, paths))
+
+def rebuild_zip(run_id: str, out: Path | None = None) -> Path:
+    """Reconstruye el ZIP de una ejecución anterior desde su manifiesto deduplicado."""
+    man = json.loads((CAS / "runs" / f"{run_id}.json").read_text(encoding="utf-8"))
+    return write_zip(man["members"], out or AUDIT_DIR / f"STEELTRACE_LAB_{run_id}.zip")
+
 def main():
     run_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}"
-    out = Path(f"release/audit/STEELTRACE_LAB_{run_id}.zip")
-    out.parent.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in ARTS:
-            if Path(p).exists():
-                z.write(p)
+    paths = [p for p in ARTS if Path(p).exists()]
+    members = build_members(paths)
+
+    (CAS / "runs").mkdir(parents=True, exist_ok=True)
+    (CAS / "runs" / f"{run_id}.json").write_text(json.dumps({"run_id": run_id, "members": members}, indent=2))
+
+    out = write_zip(members, AUDIT_DIR / f"STEELTRACE_LAB_{run_id}.zip")
     print("ZIP listo:", out)
+    print("Bundle deduplicado →", CAS / "runs" / f"{run_id}.json")
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 2 and sys.argv[1] == "rebuild":
+        print("ZIP reconstruido:", rebuild_zip(sys.argv[2]))
+    else:
+        main()
@@ -1,61 +1,85 @@
-import json, subprocess, time
+import json, os, sys, time
 from pathlib import Path
-from statistics import quantiles
 from datetime import datetime
+from runs import ROOT, new_run, finalize, current, partition_dir
+from slo_store import SLOStore
+from forkserver import spawn, ensure_server, available
+from tracing import root_attrs
 
+SCRIPTS = ROOT / "scripts"
 STEPS = [
-    ("MCP.ingest",      ["python","scripts/mcp_ingest.py"]),
-    ("SHACL.validate",  ["python","scripts/shacl_validate.py"]),
-    ("RAGA.compute",    ["python","scripts/raga_compute.py"]),
-    ("EEE.gate",        ["python","scripts/eee_gate.py"]),
-    ("XBRL.generate",   ["python","scripts/xbrl_generate.py"]),
-    ("EVIDENCE.build",  ["python","scripts/evidence_build.py"])
+    ("MCP.ingest",      SCRIPTS / "mcp_ingest.py"),
+    ("SHACL.validate",  SCRIPTS / "shacl_validate.py"),
+    ("RAGA.compute",    SCRIPTS / "raga_compute.py"),
+    ("EEE.gate",        SCRIPTS / "eee_gate.py"),
+    ("XBRL.generate",   SCRIPTS / "xbrl_generate.py"),
+    ("EVIDENCE.build",  SCRIPTS / "evidence_build.py")
 ]
 
 SLO_FILE = Path("ops/slo_report.json")
-HISTORY  = Path("ops/slo_history.jsonl")
 
-def run_step(name, cmd):
+# arranque en frío (intérprete + imports hasta entrar en la etapa) de las etapas ligeras
+STARTUP_TARGET_MS = 200
+LIGHT_STAGES = {"MCP.ingest", "RAGA.compute", "EEE.gate", "XBRL.generate", "EVIDENCE.build"}
+
+def run_step(name, script, cwd=None, env=None):
+    env = {**(env or os.environ), "STEELTRACE_SPAWN_TS": str(time.time())}
     t0 = time.perf_counter()
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+    proc = spawn(script, cwd, env)
+    out, err = proc.communicate()
     t1 = time.perf_counter()
     dur = t1 - t0
     ok  = proc.returncode == 0
-    return {"name": name, "ok": ok, "duration_sec": dur, "stdout": proc.stdout[-4000:], "stderr": proc.stderr[-4000:]}
-
-def p95(values):
-    if not values:
-        return None
-    if len(values) < 20:
-        # con pocas muestras usamos el max como aproximación
-        return max(values)
-    return quantiles(values, n=100)[94]
-
-def aggregate(history):
-    # history: lista de runs con pasos y duraciones
-    agg = {}
-    for run in history:
-        for s in run["steps"]:
-            agg.setdefault(s["name"], []).append(s["duration_sec"])
-    return {k: {"count": len(v), "p95_sec": round(p95(v), 4), "mean_sec": round(sum(v)/len(v), 4)} for k,v in agg.items()}
-
-def main():
+    startup = root_attrs(name, Path(cwd or "."), env.get("STEELTRACE_RUN_ID")).get("startup_ms")
+    return {"name": name, "ok": ok, "duration_sec": dur, "startup_ms": startup,
+            "stdout": out[-4000:], "stderr": err[-4000:]}
+
+def startup_report(steps: list[dict]) -> dict:
+    out = {}
+    for st in steps:
+        target = STARTUP_TARGET_MS if st["name"] in LIGHT_STAGES else None
+        ms = st.get("startup_ms")
+        out[st["name"]] = {"startup_ms": ms, "target_ms": target,
+                           "ok": None if target is None or ms is None else ms <= target}
+    return out
+
+def main(partition: str | None = None):
     Path("ops").mkdir(exist_ok=True)
-    steps = [run_step(n,c) for n,c in STEPS]
-    run = {"utc": datetime.utcnow().isoformat()+"Z", "steps": steps}
-    HISTORY.write_text((HISTORY.read_text() if HISTORY.exists() else "") + json.dumps(run)+"\n")
-
-    # reconstruir historia
-    hist = []
-    for line in HISTORY.read_text().splitlines():
-        try:
-            hist.append(json.loads(line))
-        except Exception:
-            pass
-
-    agg = aggregate(hist)
-    SLO_FILE.write_text(json.dumps({"utc": run["utc"], "agg": agg, "last_run": steps}, indent=2, ensure_ascii=False))
+
+    # cada ejecución trabaja en su propio directorio (runs/<partición>/...) y solo
+    # al terminar bien se publica de forma atómica como "current" de la partición
+    # se parte de las salidas del current: los estados incrementales (KPIs, acuerdo HITL...) continúan
+    run_id, run_dir = new_run(partition, base=current(partition))
+    # STEELTRACE_FORKSERVER: las etapas se despachan al worker precalentado (se arranca si no está)
+    ensure_server()
+    env = {**os.environ, "STEELTRACE_CAS": str(ROOT / "release" / "cas"),
+           "STEELTRACE_SLO_STATE": str(ROOT / "ops" / "slo_sketch.json"),
+           "STEELTRACE_RUN_STARTED": str(time.time())}
+    env.setdefault("STEELTRACE_RUN_ID", run_id)
+    steps = []
+    for n, c in STEPS:
+        steps.append(run_step(n, c, cwd=run_dir, env=env))
+        if not steps[-1]["ok"]:
+            break
+    run = {"utc": datetime.utcnow().isoformat()+"Z", "run_id": run_id,
+           "partition": partition_dir(partition).name, "steps": steps}
+    # append + sketches por etapa: coste constante, independiente del tamaño del historial
+    slim = {**run, "steps": [{k: st[k] for k in ("name", "ok", "duration_sec")} for st in steps]}
+    windows = SLOStore().record(slim)
+    agg = {name: w["all"] for name, w in windows.items()}
+    startup = {"forkserver": available(), "stages": startup_report(steps)}
+    report = json.dumps({"utc": run["utc"], "agg": agg, "windows": windows, "startup": startup,
+                         "last_run": steps}, indent=2, ensure_ascii=False)
+    SLO_FILE.write_text(report)
+    (run_dir / "ops").mkdir(exist_ok=True)
+    (run_dir / SLO_FILE).write_text(report)
     print("SLO report →", SLO_FILE)
 
+    ok = all(s["ok"] for s in steps) and len(steps) == len(STEPS)
+    final = finalize(run_dir, ok=ok)
+    print("Run", "OK" if ok else "FALLIDO", "→", final)
+    if ok:
+        print("current →", current(partition))
+
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,134 @@
+"""
+Vista previa por muestreo estratificado (STEELTRACE_PREVIEW): mcp_ingest, shacl_validate y
+raga_compute sobre una muestra, con estimaciones e intervalos de confianza.
+
+- Estratos = entidad|periodo|source_system (kpi_state.group_key). mcp_ingest extrae todo
+  (hace falta N por estrato), pero valida, normaliza y puntúa DQ solo la muestra: asignación
+  proporcional a un tamaño objetivo por dominio, con al menos MIN_PER_STRATUM por estrato
+  (varianza estimable) y selección aleatoria reproducible (SEED + estrato).
+- Estimadores de Horvitz-Thompson por estrato (peso N_h/n_h): totales de las columnas y
+  f(totales) — tasas DQ y de conformidad SHACL como razones, KPIs con la fórmula de
+  kpi_state.DOMAINS. IC por linealización (método delta) con la varianza del total
+  estratificado y corrección por población finita; los registros muestreados que no llegan
+  al normalizado (inválidos por schema) cuentan como ceros (estimación en dominios).
+- data/preview.json: estratos (N, n) y el resultado de cada etapa. La app lanza la vista
+  previa en la partición "<partición>-preview" (no toca el current de la partición real) y,
+  si se pide, la ejecución completa a continuación.
+- numpy se importa al estimar (import diferido: la app importa este módulo al pintar).
+"""
+import json, math, os, random, time
+from pathlib import Path
+from statistics import NormalDist
+from kpi_state import DOMAINS, group_key, inputs
+from latency import wilson
+
+REPORT = Path("data/preview.json")
+SAMPLE_SIZE = 2000      # registros objetivo por dominio
+MIN_PER_STRATUM = 2
+LEVEL = 0.95
+SEED = 20240101
+PARTITION_SUFFIX = "-preview"
+
+def sample_size() -> int | None:
+    """None = ejecución completa; STEELTRACE_PREVIEW=1 → SAMPLE_SIZE, =N → N registros por dominio."""
+    v = os.environ.get("STEELTRACE_PREVIEW", "").strip().lower()
+    if v in ("", "0", "false", "no"):
+        return None
+    if v in ("1", "true", "yes"):
+        return SAMPLE_SIZE
+    try:
+        return max(1, int(v))
+    except ValueError:
+        raise SystemExit(f"STEELTRACE_PREVIEW={v!r} no válido: usa 1/true o un número de registros por dominio")
+
+def allocate(sizes: dict[str, int], n: int) -> dict[str, int]:
+    """Asignación proporcional n_h ≈ n·N_h/N, acotada a [min(N_h, MIN_PER_STRATUM), N_h]."""
+    total = sum(sizes.values())
+    return {h: min(N, max(MIN_PER_STRATUM, round(n * N / max(1, total)))) for h, N in sizes.items()}
+
+def sample(domain: str, records: list[dict], n: int, seed: int = SEED) -> tuple[list[int], dict]:
+    """Índices (ordenados) de la muestra estratificada y {estrato: {"N", "n"}}."""
+    by_stratum: dict[str, list[int]] = {}
+    for i, r in enumerate(records):
+        by_stratum.setdefault(group_key(domain, r), []).append(i)
+    alloc = allocate({h: len(ix) for h, ix in by_stratum.items()}, n)
+    picked = []
+    for h, ix in by_stratum.items():
+        picked += ix if alloc[h] == len(ix) else random.Random(f"{seed}|{domain}|{h}").sample(ix, alloc[h])
+    return sorted(picked), {h: {"N": len(ix), "n": alloc[h]} for h, ix in sorted(by_stratum.items())}
+
+def _deriv(f, totals: dict, k: str) -> float:
+    h = max(abs(totals[k]) * 1e-6, 1e-9)
+    return (f({**totals, k: totals[k] + h}) - f({**totals, k: totals[k] - h})) / (2 * h)
+
+def estimate(strata: dict, keys: list[str], cols: dict, f, level: float = LEVEL) -> dict:
+    """f(totales estimados de `cols` (arrays por fila)) con su IC. keys: estrato de cada fila."""
+    import numpy as np
+    hs = sorted(strata)
+    pos = {h: i for i, h in enumerate(hs)}
+    g = np.array([pos[k] for k in keys], dtype=np.int64)
+    N = np.array([strata[h]["N"] for h in hs], dtype=float)
+    n = np.array([strata[h]["n"] for h in hs], dtype=float)
+    w = (N / n)[g]
+    totals = {k: float(np.dot(w, v)) for k, v in cols.items()}
+    value = float(f(totals))
+    # variable linealizada z = Σ ∂f/∂T_k · y_k; Var(Σ_h N_h·z̄_h) con FPC, ceros para los no observados
+    z = sum(_deriv(f, totals, k) * np.asarray(v, dtype=float) for k, v in cols.items()) if cols else np.zeros(0)
+    s1, s2 = np.bincount(g, z, len(hs)), np.bincount(g, z * z, len(hs))
+    s2_h = np.where(n > 1, (s2 - s1 * s1 / n) / np.maximum(n - 1, 1), 0.0)
+    var = float(np.sum(N * N * (1 - n / N) * np.maximum(s2_h, 0) / n))
+    half = NormalDist().inv_cdf(0.5 + level / 2) * math.sqrt(var)
+    return {"estimate": value, "ci": [value - half, value + half], "level": level, "se": math.sqrt(var)}
+
+def rate(strata: dict, keys: list[str], passed, level: float = LEVEL) -> dict:
+    """Proporción sobre los registros observados (razón de totales). IC de Wilson con el tamaño
+    efectivo de Korn-Graubard, n_eff = p(1-p)/Var ≤ n: con 2-3 registros por estrato los fallos
+    raros dejan varianza intra-estrato nula y el IC normal saldría de ancho cero.
+    Si todos los estratos son censo (n_h = N_h, FPC = 0) no hay error de muestreo: IC de ancho cero."""
+    import numpy as np
+    passed = np.asarray(passed, dtype=float)
+    est = estimate(strata, keys, {"passed": passed, "n": np.ones_like(passed)},
+                   lambda t: t["passed"] / t["n"] if t["n"] else 1.0, level)
+    p, n = min(1.0, max(0.0, est["estimate"])), len(passed)
+    if all(s["n"] >= s["N"] for s in strata.values()):
+        return {"estimate": round(p, 4), "ci": [round(p, 4), round(p, 4)], "level": level, "n_eff": n}
+    n_eff = min(n, p * (1 - p) / est["se"] ** 2) if est["se"] > 0 and 0 < p < 1 else n
+    lo, hi = wilson(p * n_eff, n_eff, NormalDist().inv_cdf(0.5 + level / 2))
+    return {"estimate": round(p, 4), "ci": [lo, hi], "level": level, "n_eff": round(n_eff, 1)}
+
+def kpi(domain: str, records: list[dict], strata: dict, level: float = LEVEL) -> dict:
+    """KPI del dominio estimado desde la muestra: fórmula de kpi_state sobre los totales estimados."""
+    import numpy as np
+    spec = DOMAINS[domain]
+    rows = [inputs(domain, r) for r in records]
+    x = {k: np.array([float(row[k]) if row[k] is not None else 0.0 for row in rows]) for k in spec["inputs"]}
+    est = estimate(strata, [group_key(domain, r) for r in records], spec["terms"](x), spec["formula"], level)
+    nd = spec["ndigits"]
+    return {"estimate": round(est["estimate"], nd), "ci": [round(v, nd) for v in est["ci"]],
+            "level": level, "se": round(est["se"], nd + 2), "records_sampled": len(records),
+            "records_total": sum(v["N"] for v in strata.values())}
+
+def decide(est: dict, threshold: float) -> str:
+    """pass/fail si todo el IC queda a un lado del umbral; si no, uncertain."""
+    lo, hi = est["ci"]
+    return "pass" if lo >= threshold else "fail" if hi < threshold else "uncertain"
+
+def load() -> dict:
+    return json.loads(REPORT.read_text(encoding="utf-8")) if REPORT.exists() else {}
+
+def strata(domain: str) -> dict:
+    s = load().get("strata", {}).get(domain)
+    if s is None:
+        raise SystemExit(f"Sin estratos de vista previa para {domain}: ejecuta mcp_ingest.py con STEELTRACE_PREVIEW")
+    return s
+
+def save_strata(all_strata: dict, n: int):
+    """mcp_ingest: empieza un informe nuevo (descarta resultados de una vista previa anterior)."""
+    REPORT.parent.mkdir(parents=True, exist_ok=True)
+    REPORT.write_text(json.dumps({"utc_epoch": time.time(), "sample_size": n, "seed": SEED, "level": LEVEL,
+                                  "strata": all_strata, "stages": {}}, indent=2, ensure_ascii=False))
+
+def record(stage: str, info: dict):
+    data = load()
+    data.setdefault("stages", {})[stage] = info
+    REPORT.write_text(json.dumps(data, indent=2, ensure_ascii=False))
@@ -1,5 +1,9 @@
-import json, pathlib, statistics
+import json, os, pathlib, statistics
 from pathlib import Path
+from tracing import stage, span
+from kpi_state import KPIState, DOMAINS, write_dirty
+from lineage_index import LineageIndex
+import materiality, uncertainty
 
 def load_json(p): return json.loads(Path(p).read_text(encoding="utf-8"))
 
@@ -9,56 +13,131 @@ def cite(ids: list[str]):
     by_id = {x["id"]: x for x in idx}
     return [by_id[i] for i in ids if i in by_id]
 
-def compute_kpis():
-    # E1
-    e1 = load_json("data/normalized/energy_2024-01.json")
-    total_co2e = round(sum(r["kwh"]*r.get("emission_factor_co2e",0.23) for r in e1)/1000.0, 3)
+KPI_BLOCKS = {"energy": "kpi.E1", "hr": "kpi.S1", "ethics": "kpi.G1"}
 
-    # S1
-    s1 = load_json("data/normalized/hr_2024-01.json")
-    s1r = s1[0] if s1 else {"employees_start":0,"employees_end":0,"exits":0}
-    avg_emp = (s1r["employees_start"] + s1r["employees_end"])/2 or 1
-    turnover = round(s1r["exits"]/avg_emp, 4)
+def compute_kpis() -> tuple[dict, set[str]]:
+    """
+    KPIs desde el estado incremental (kpi_state.py): cada normalizado se incorpora como
+    delta por hash de registro; solo se recalculan los dominios cuyo archivo cambió.
+    Devuelve los KPIs y los DP cuyo valor cambió (dirty).
+    """
+    state = KPIState()
+    full = not state.records
+    dirty = set()
+    for domain, name in KPI_BLOCKS.items():
+        with span(name) as sp:
+            changed, delta = state.sync_file(domain)
+            dirty |= changed
+            sp.set(**delta, dirty=bool(changed))
+    state.save()
+    # linaje registro → grupo → KPI: solo los registros que entraron o salieron en este run
+    with span("lineage_index") as sp, LineageIndex() as idx:
+        sp.set(**idx.sync_kpis(state, {d: DOMAINS[d] for d in KPI_BLOCKS}, full=full))
+    return {DOMAINS[d]["dp"]: state.values[DOMAINS[d]["dp"]] for d in KPI_BLOCKS}, dirty
 
-    # G1
-    g1 = load_json("data/normalized/ethics_2024-01.json")
-    g1r = g1[0] if g1 else {"cases_closed":0,"closed_with_resolution":0}
-    pct_resolution = round((g1r["closed_with_resolution"]/(g1r["cases_closed"] or 1))*100, 2)
-
-    return {
-        "E1-1.total_co2e_tons": total_co2e,
-        "S1-1.employee_turnover": turnover,
-        "G1-1.resolution_rate_pct": pct_resolution
-    }
-
-def explain(kpis: dict):
-    return {
-      "E1-1.total_co2e_tons": {
+EXPLAIN = {
+    "E1-1.total_co2e_tons": {
         "hypothesis": "Σ(kWh_i * emission_factor_i)/1000",
         "evidence": ["data/normalized/energy_2024-01.json","ontology/validation.log"],
-        "citations": cite(["ESRS_E1_DR1"]),
-        "residual": 0.0
-      },
-      "S1-1.employee_turnover": {
+        "citations": ["ESRS_E1_DR1"],
+    },
+    "S1-1.employee_turnover": {
         "hypothesis": "exits / mean(employees_start, employees_end)",
         "evidence": ["data/normalized/hr_2024-01.json","ontology/validation.log"],
-        "citations": cite(["ESRS_S1_DR1"]),
-        "residual": 0.0
-      },
-      "G1-1.resolution_rate_pct": {
+        "citations": ["ESRS_S1_DR1"],
+    },
+    "G1-1.resolution_rate_pct": {
         "hypothesis": "closed_with_resolution / cases_closed * 100",
         "evidence": ["data/normalized/ethics_2024-01.json","ontology/validation.log"],
-        "citations": cite(["ESRS_G1_DR1"]),
-        "residual": 0.0
-      }
-    }
+        "citations": ["ESRS_G1_DR1"],
+    },
+}
+
+DP_DOMAIN = {spec["dp"]: d for d, spec in DOMAINS.items()}
+
+def stale(kpis: dict, dirty: set[str], previous: dict | None, cfg: dict) -> set[str] | None:
+    """DP cuya explicación hay que reconstruir: sucios o con incertidumbre calculada con otra
+    configuración (rules.yaml); None = todos (no hay explicación previa)."""
+    if previous is None:
+        return None
+    return dirty | {dp for dp in kpis if previous.get(dp, {}).get("uncertainty", {}).get("config")
+                    != uncertainty.config_hash(cfg, DP_DOMAIN[dp])}
+
+def explain(kpis: dict, rebuild: set[str] | None = None, previous: dict | None = None, cfg: dict | None = None):
+    # solo se reconstruyen las entradas de `rebuild` (o todas si no hay explicación previa)
+    previous = previous or {}
+    cfg = cfg or uncertainty.load_config()
+    out = {}
+    for dp in kpis:
+        if rebuild is not None and dp not in rebuild and dp in previous:
+            out[dp] = previous[dp]
+            continue
+        spec = EXPLAIN[dp]
+        with span("uncertainty") as sp:
+            unc = uncertainty.propagate_file(DP_DOMAIN[dp], cfg)
+            sp.set(dp=dp, method=unc["method"], groups=len(unc["by_group"]), residual=unc["residual"])
+        out[dp] = {
+            "hypothesis": spec["hypothesis"],
+            "evidence": spec["evidence"],
+            "citations": cite(spec["citations"]),
+            # residual = semiamplitud relativa del IC del KPI (uncertainty.py)
+            "residual": unc.pop("residual"),
+            "uncertainty": unc
+        }
+    return out
+
+def preview_kpis() -> dict:
+    """Vista previa: KPIs estimados desde los normalizados muestreados, con IC; no toca kpi_state
+    ni el linaje (los totales de la muestra no son los del periodo)."""
+    import preview
+    out = {}
+    for domain, name in KPI_BLOCKS.items():
+        with span(name, preview=True) as sp:
+            dp = DOMAINS[domain]["dp"]
+            out[dp] = preview.kpi(domain, load_json(DOMAINS[domain]["normalized"]), preview.strata(domain))
+            sp.set(records=out[dp]["records_sampled"], strata=len(preview.strata(domain)))
+    return out
 
 def main():
-    kpis = compute_kpis()
-    Path("raga").mkdir(exist_ok=True)
-    Path("raga/kpis.json").write_text(json.dumps(kpis, indent=2, ensure_ascii=False))
-    Path("raga/explain.json").write_text(json.dumps(explain(kpis), indent=2, ensure_ascii=False))
-    print("RAGA OK → raga/kpis.json, raga/explain.json")
+    preview_n = None
+    if os.environ.get("STEELTRACE_PREVIEW"):
+        import preview
+        preview_n = preview.sample_size()
+    if preview_n:
+        est = preview_kpis()
+        Path("raga").mkdir(exist_ok=True)
+        Path("raga/kpis.json").write_text(json.dumps({dp: e["estimate"] for dp, e in est.items()}, indent=2))
+        preview.record("RAGA.compute", est)
+        print("RAGA (vista previa) →", preview.REPORT)
+        for dp, e in est.items():
+            print(f"  {dp}: {e['estimate']}  IC{int(e['level'] * 100)} [{e['ci'][0]}, {e['ci'][1]}]")
+        return
+    with span("compute_kpis") as sp:
+        kpis, dirty = compute_kpis()
+        sp.set(kpis=len(kpis), dirty=len(dirty))
+    with span("materiality") as sp:
+        before = materiality.load_map()
+        mmap = materiality.assess()
+        # un DP que entra o sale del mapa de materialidad se trata como sucio aguas abajo
+        # (sin mapa previo todo era material: el primer mapa marca los que dejan de serlo)
+        flipped = {dp for dp in kpis if materiality.is_material(dp, before) != materiality.is_material(dp, mmap)}
+        sp.set(entities=len(mmap["entities"]), flipped=len(flipped), **mmap["cache"])
+    exp_path = Path("raga/explain.json")
+    with span("explain") as sp:
+        previous = json.loads(exp_path.read_text(encoding="utf-8")) if exp_path.exists() else None
+        cfg = uncertainty.load_config()
+        rebuild = stale(kpis, dirty, previous, cfg)
+        ex = explain(kpis, rebuild, previous, cfg)
+        sp.set(rebuilt=len(kpis) if rebuild is None else len(rebuild))
+    with span("write"):
+        Path("raga").mkdir(exist_ok=True)
+        Path("raga/kpis.json").write_text(json.dumps(kpis, indent=2, ensure_ascii=False))
+        if rebuild is None or rebuild:
+            exp_path.write_text(json.dumps(ex, indent=2, ensure_ascii=False))
+        # EEE-Gate y XBRL recalculan solo estos DP (incluye explicaciones reconstruidas)
+        write_dirty((rebuild or set()) | flipped, full=rebuild is None)
+    print("RAGA OK → raga/kpis.json, raga/explain.json, raga/materiality.json", f"(dirty: {sorted(dirty) or '—'})")
 
 if __name__ == "__main__":
-    main()
+    with stage("RAGA.compute"):
+        main()
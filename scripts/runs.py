@@ -0,0 +1,117 @@
+"""
+Aislamiento de ejecuciones: cada run trabaja en su propio directorio.
+
+runs/<partición>/.<run_id>.tmp/   → directorio de trabajo mientras corre (cwd de las etapas)
+runs/<partición>/<run_id>/        → rename atómico al terminar bien
+runs/<partición>/<run_id>.failed/ → si alguna etapa falla (se conserva para depurar)
+runs/<partición>/current          → symlink al último run completado (se reemplaza atómicamente)
+
+Las entradas de solo lectura se enlazan archivo a archivo (nunca directorios, para que
+las salidas caigan en directorios propios del run). Del run base solo se copian (no se
+enlazan: las etapas sobrescriben con write_text) los archivos de CARRY_GLOBS; los ZIP de
+release/audit y las trazas son de cada run. Al publicar un run se conservan los
+KEEP_RUNS más recientes de la partición (y otros tantos fallidos); el resto se borra.
+"""
+import os, re, shutil, sys, uuid
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = ROOT / "runs"
+DEFAULT_PARTITION = "default"
+KEEP_RUNS = int(os.environ.get("STEELTRACE_KEEP_RUNS", 10))
+
+# entradas compartidas (solo lectura) que cada run ve en su árbol
+INPUT_GLOBS = [
+    "data/samples/*.json", "data/samples/*.csv", "data/sources/*", "contracts/*", "ontology/esrs.owl", "rag/index.jsonl",
+    "raga/rules.yaml", "ops/eee_gate.yaml", "ops/sources.yaml", "docs/hitl_reviews.csv", "xbrl/schema/*",
+]
+
+# salidas del run base que se copian al nuevo run
+CARRY_GLOBS = [
+    # estado incremental: deltas de KPI, materialidad, acuerdo HITL e índice de linaje
+    "raga/kpi_state.json", "raga/materiality.json", "raga/materiality_cache.json",
+    "ops/hitl_agreement_state.json", "ops/hitl_labels.npy", "data/lineage.sqlite",
+    # salidas que se reutilizan si nada está sucio o que lee una etapa relanzada sola
+    "data/normalized/*.json", "data/lineage.jsonl", "data/dq_report.json",
+    "ontology/validation.log", "ontology/linaje.ttl", "ops/degradation.json",
+    "raga/kpis.json", "raga/explain.json", "raga/dirty.json", "ops/gate_report.json", "eee/eee_report.json",
+    "xbrl/informe.xbrl", "xbrl/validation.log", "evidence/evidence_manifest.json", "evidence/tokens/*.tsr",
+    "evidence/verify/*.txt", "ops/hitl_kappa.json", "ops/slo_report.json",
+]
+
+def partition_dir(partition: str | None = None) -> Path:
+    """runs/<partición>; el nombre llega de la app (texto libre): solo [A-Za-z0-9_-], nunca una ruta."""
+    name = partition or os.environ.get("STEELTRACE_PARTITION", DEFAULT_PARTITION)
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise ValueError(f"Nombre de partición no válido: {name!r} (solo letras, dígitos, '_' y '-')")
+    return RUNS / name
+
+def current(partition: str | None = None) -> Path | None:
+    link = partition_dir(partition) / "current"
+    return link.resolve() if link.exists() else None
+
+def _link_inputs(run_dir: Path) -> set[str]:
+    linked = set()
+    for pattern in INPUT_GLOBS:
+        for src in ROOT.glob(pattern):
+            if not src.is_file():
+                continue
+            rel = src.relative_to(ROOT)
+            dst = run_dir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            os.symlink(src, dst)
+            linked.add(str(rel))
+    return linked
+
+def _copy_outputs(base: Path, run_dir: Path):
+    for src in (p for pattern in CARRY_GLOBS for p in base.glob(pattern)):
+        if src.is_symlink() or not src.is_file():
+            continue
+        dst = run_dir / src.relative_to(base)
+        if dst.exists():
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, dst)
+
+def new_run(partition: str | None = None, base: Path | None = None) -> tuple[str, Path]:
+    """Crea el directorio de trabajo de un run nuevo; `base` aporta salidas previas (p.ej. current)."""
+    run_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:6]}"
+    run_dir = partition_dir(partition) / f".{run_id}.tmp"
+    run_dir.mkdir(parents=True)
+    _link_inputs(run_dir)
+    if base is not None and base.is_dir():
+        _copy_outputs(base, run_dir)
+    return run_id, run_dir
+
+def finalize(run_dir: Path, ok: bool = True) -> Path:
+    """Rename atómico del directorio de trabajo y, si ok, actualización del puntero current."""
+    run_id = run_dir.name.removeprefix(".").removesuffix(".tmp")
+    final = run_dir.with_name(run_id if ok else f"{run_id}.failed")
+    os.replace(run_dir, final)
+    if ok:
+        link = final.parent / "current"
+        tmp = final.parent / f".current.{uuid.uuid4().hex[:6]}"
+        os.symlink(final.name, tmp)
+        os.replace(tmp, link)
+    prune(final.parent)
+    return final
+
+def prune(part: Path, keep: int = KEEP_RUNS):
+    """Borra los runs terminados más antiguos (completados y fallidos por separado) salvo el current;
+    los .tmp son runs en curso y no se tocan."""
+    if keep <= 0:
+        return
+    # rmtree sobre hermanos: solo dentro de una partición de runs/, nunca en otro sitio
+    if part.resolve().parent != RUNS.resolve():
+        raise ValueError(f"{part} no es una partición de {RUNS}")
+    live = (part / "current").resolve() if (part / "current").exists() else None
+    done = sorted(p for p in part.iterdir() if p.is_dir() and not p.is_symlink() and not p.name.startswith("."))
+    for group in ([p for p in done if not p.name.endswith(".failed")], [p for p in done if p.name.endswith(".failed")]):
+        for old in group[:-keep]:
+            if old != live:
+                shutil.rmtree(old, ignore_errors=True)
+
+if __name__ == "__main__":
+    # python scripts/runs.py [partición]  → muestra el run actual
+    print(current(sys.argv[1] if len(sys.argv) > 1 else None) or "Sin runs completados")
@@ -1,8 +1,13 @@
-import json
+import json, os, random
 from pathlib import Path
 from datetime import datetime
 from rdflib import Graph, Namespace, Literal, RDF, XSD, URIRef
-from pyshacl import validate
+from rdflib.namespace import SH
+from tracing import stage, span
+from latency import sample_fraction, record_degradation, wilson
+from graph_cache import load_graph, load_closure, entail
+from kpi_state import record_hash, group_key
+from lineage_index import LineageIndex
 
 ROOT = Path(".")
 ONTOLOGY_FILE = ROOT / "ontology" / "esrs.owl"
@@ -13,6 +18,17 @@ OUT_VALIDATION = ROOT / "ontology" / "validation.log"
 OUT_LINEAGE    = ROOT / "ontology" / "linaje.ttl"
 
 EX = Namespace("http://example.com/esrs#")
+STAGE = "SHACL.validate"
+SAMPLE_SEED = 20240101
+
+def _sampled(records: list, fraction: float):
+    # conserva el índice original (1-based) para que los URIs coincidan con la ejecución completa
+    if fraction >= 1.0:
+        return list(enumerate(records, start=1))
+    # muestreo sin reemplazo de tamaño fijo (mínimo 1) para que el IC tenga al menos una observación
+    k = min(len(records), max(1, round(fraction * len(records))))
+    idx = sorted(random.Random(SAMPLE_SEED).sample(range(len(records)), k))
+    return [(i + 1, records[i]) for i in idx]
 
 def _load_json(path: Path):
     return json.loads(path.read_text(encoding="utf-8"))
@@ -23,9 +39,10 @@ def _add_evidence(g: Graph, subj: URIRef, ev_path: str):
     g.add((ev, RDF.type, EX.Evidencia))
     g.add((ev, EX.evidencePath, Literal(ev_path, datatype=XSD.string)))
 
-def materialize_e1(g: Graph, data_path: Path):
+def materialize_e1(g: Graph, data_path: Path, fraction: float = 1.0, links: list | None = None) -> tuple[int, int]:
     records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
+    sample = _sampled(records, fraction)
+    for i, r in sample:
         subj = URIRef(f"http://example.com/esrs#E1Record/{i}")
         g.add((subj, RDF.type, EX.E1Record))
         if "company_id" in r: g.add((subj, EX.companyId, Literal(r["company_id"], datatype=XSD.string)))
@@ -34,10 +51,14 @@ def materialize_e1(g: Graph, data_path: Path):
         if "kwh" in r: g.add((subj, EX.kwh, Literal(r["kwh"], datatype=XSD.decimal)))
         if "emission_factor_co2e" in r: g.add((subj, EX.emissionFactor, Literal(r["emission_factor_co2e"], datatype=XSD.decimal)))
         _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
+        if links is not None:
+            links.append((record_hash(r), str(subj)))
+    return len(sample), len(records)
 
-def materialize_s1(g: Graph, data_path: Path):
+def materialize_s1(g: Graph, data_path: Path, fraction: float = 1.0, links: list | None = None) -> tuple[int, int]:
     records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
+    sample = _sampled(records, fraction)
+    for i, r in sample:
         subj = URIRef(f"http://example.com/esrs#S1Record/{i}")
         g.add((subj, RDF.type, EX.S1Record))
         for k, prop, dtype in [
@@ -49,10 +70,14 @@ def materialize_s1(g: Graph, data_path: Path):
         ]:
             if k in r: g.add((subj, prop, Literal(r[k], datatype=dtype)))
         _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
+        if links is not None:
+            links.append((record_hash(r), str(subj)))
+    return len(sample), len(records)
 
-def materialize_g1(g: Graph, data_path: Path):
+def materialize_g1(g: Graph, data_path: Path, fraction: float = 1.0, links: list | None = None) -> tuple[int, int]:
     records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
+    sample = _sampled(records, fraction)
+    for i, r in sample:
         subj = URIRef(f"http://example.com/esrs#G1Record/{i}")
         g.add((subj, RDF.type, EX.G1Record))
         for k, prop, dtype in [
@@ -64,23 +89,49 @@ def materialize_g1(g: Graph, data_path: Path):
         ]:
             if k in r: g.add((subj, prop, Literal(r[k], datatype=dtype)))
         _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
-
-def run_shacl(data_graph: Graph, shape_path: Path, title: str) -> tuple[bool, str]:
-    sh = Graph(); sh.parse(shape_path, format="turtle")
-    conforms, _, results_text = validate(
-        data_graph=data_graph, shacl_graph=sh,
-        inference="rdfs", abort_on_first=False,
-        allow_infos=True, allow_warnings=True
-    )
+        if links is not None:
+            links.append((record_hash(r), str(subj)))
+    return len(sample), len(records)
+
+def run_shacl(data_graph: Graph, shape_path: Path, title: str, cache: dict) -> tuple[bool, str, set]:
+    with span("load_shapes", shapes=shape_path.name) as sp:
+        sh = load_graph(shape_path, cache)
+        sp.set(triples=len(sh), bytes=shape_path.stat().st_size, cache=cache[shape_path.name])
+    from pyshacl import validate  # import diferido: es la dependencia más pesada de la etapa
+    with span("pyshacl.validate", shapes=shape_path.name) as sp:
+        # el grafo ya lleva el cierre RDFS (ontología precalculada + inferencias de los datos)
+        conforms, results_graph, results_text = validate(
+            data_graph=data_graph, shacl_graph=sh,
+            inference="none", abort_on_first=False,
+            allow_infos=True, allow_warnings=True
+        )
+        sp.set(triples=len(data_graph), conforms=bool(conforms))
     header = f"=== {title} ===\nconforms = {conforms}\n"
-    return conforms, header + results_text + "\n"
+    failing = {results_graph.value(r, SH.focusNode) for r in results_graph.subjects(SH.resultSeverity, SH.Violation)}
+    return conforms, header + results_text + "\n", failing
+
+def preview_conformance(domains: list[tuple], failing: set) -> dict:
+    """Vista previa: tasa de conformidad SHACL por dominio estimada para la población (IC estratificado)."""
+    import preview
+    out = {}
+    for domain, cls, path in domains:
+        records = _load_json(path)
+        ok = [EX[f"{cls}/{i}"] not in failing for i in range(1, len(records) + 1)]
+        est = preview.rate(preview.strata(domain), [group_key(domain, r) for r in records], ok)
+        out[domain] = {**est, "records_sampled": len(records), "violations_in_sample": ok.count(False)}
+    return out
 
 def main():
     OUT_VALIDATION.parent.mkdir(parents=True, exist_ok=True)
 
-    g = Graph()
+    # ontología y shapes precompilados (graph_cache.py): se reparsean solo si cambia el archivo
+    cache = {}
+    tbox = None
     if ONTOLOGY_FILE.exists():
-        g.parse(ONTOLOGY_FILE, format="turtle")
+        with span("load_ontology") as sp:
+            tbox = load_closure(ONTOLOGY_FILE, cache)
+            sp.set(triples=len(tbox["graph"]), bytes=ONTOLOGY_FILE.stat().st_size, cache=cache[ONTOLOGY_FILE.name])
+    g = Graph()   # solo datos; la ontología se añade al validar y al serializar el linaje
 
     e1 = ROOT / "data" / "normalized" / "energy_2024-01.json"
     s1 = ROOT / "data" / "normalized" / "hr_2024-01.json"
@@ -89,23 +140,77 @@ def main():
         if not p.exists():
             raise SystemExit(f"No existe {p}. Ejecuta primero mcp_ingest.py")
 
-    materialize_e1(g, e1)
-    materialize_s1(g, s1)
-    materialize_g1(g, g1)
-
-    results = []
-    c1, t1 = run_shacl(g, SHACL_E1, "SHACL E1")
-    c2, t2 = run_shacl(g, SHACL_S1, "SHACL S1")
-    c3, t3 = run_shacl(g, SHACL_G1, "SHACL G1")
+    # degradación adaptativa: si el p95 histórico supera el presupuesto, se valida una muestra
+    # (en vista previa los normalizados ya son la muestra estratificada: se valida entera)
+    preview_n = None
+    if os.environ.get("STEELTRACE_PREVIEW"):
+        import preview   # solo en vista previa: arrastra numpy
+        preview_n = preview.sample_size()
+    fraction = 1.0 if preview_n else sample_fraction(STAGE)
+    sampled, total = 0, 0
+    links = []   # (hash del registro, URI) para el índice de linaje
+    for name, fn, path in [("materialize_e1", materialize_e1, e1),
+                           ("materialize_s1", materialize_s1, s1),
+                           ("materialize_g1", materialize_g1, g1)]:
+        with span(name, fraction=fraction) as sp:
+            before = len(g)
+            n, N = fn(g, path, fraction, links)
+            sampled, total = sampled + n, total + N
+            sp.set(records=n, triples=len(g) - before, bytes=path.stat().st_size)
+
+    with span("rdfs_entail") as sp:
+        vg = tbox["graph"] if tbox else Graph()   # copia propia: viene recién cargada de la caché
+        vg += g
+        inferred = entail(g, tbox) if tbox else set()
+        vg.addN((s, p, o, vg) for s, p, o in inferred)
+        sp.set(inferred=len(inferred), triples=len(vg))
+
+    c1, t1, f1 = run_shacl(vg, SHACL_E1, "SHACL E1", cache)
+    c2, t2, f2 = run_shacl(vg, SHACL_S1, "SHACL S1", cache)
+    c3, t3, f3 = run_shacl(vg, SHACL_G1, "SHACL G1", cache)
 
     ts = datetime.utcnow().isoformat() + "Z"
-    report = f"[{ts}] GLOBAL_CONFORMS = {all([c1,c2,c3])}\n\n" + t1 + "\n" + t2 + "\n" + t3
+    report = f"[{ts}] GLOBAL_CONFORMS = {all([c1,c2,c3])}\n"
+    if fraction < 1.0:
+        records = {s for cls in (EX.E1Record, EX.S1Record, EX.G1Record) for s in g.subjects(RDF.type, cls)}
+        ok = len(records - (f1 | f2 | f3))
+        lo, hi = wilson(ok, len(records))
+        info = {"mode": "sampled", "fraction": round(fraction, 4), "records_sampled": sampled,
+                "records_total": total, "conformance_rate": round(ok / max(1, len(records)), 4),
+                "conformance_ci95": [lo, hi], "lineage_ttl": "previous" if OUT_LINEAGE.exists() else "missing"}
+        report += f"SAMPLED_VALIDATION = {json.dumps(info)}\n"
+        record_degradation(STAGE, info)
+    else:
+        record_degradation(STAGE, None)
+    if preview_n:
+        info = preview_conformance([("energy", "E1Record", e1), ("hr", "S1Record", s1), ("ethics", "G1Record", g1)],
+                                   f1 | f2 | f3)
+        report += f"PREVIEW_VALIDATION = {json.dumps(info)}\n"
+        preview.record(STAGE, info)
+    report += "\n" + t1 + "\n" + t2 + "\n" + t3
     OUT_VALIDATION.write_text(report, encoding="utf-8")
-    g.serialize(destination=OUT_LINEAGE, format="turtle")
+    # con muestra (vista previa o degradación) no se escribe el linaje RDF: sería el de la muestra
+    # (el artefacto de auditoría perdería los registros no muestreados) y serializar Turtle es la
+    # parte más lenta de la etapa; se conserva el del run anterior (runs.CARRY_GLOBS)
+    write_lineage = not preview_n and fraction >= 1.0
+    if write_lineage:
+        with span("serialize") as sp:
+            # linaje = ontología (tal cual, sin reparsear) + datos; Turtle admite redefinir @prefix
+            with open(OUT_LINEAGE, "wb") as f:
+                if ONTOLOGY_FILE.exists():
+                    f.write(ONTOLOGY_FILE.read_bytes().rstrip() + b"\n\n")
+                f.write(g.serialize(format="turtle", encoding="utf-8"))
+            sp.set(triples=len(g), bytes=OUT_LINEAGE.stat().st_size)
+    with span("lineage_index") as sp, LineageIndex() as idx:
+        # con muestreo solo se añaden aristas: las de los registros no validados siguen vigentes
+        failing = {str(u) for u in f1 | f2 | f3}
+        sp.set(**idx.sync_stage(STAGE, [(("record", h), ("rdf_node", uri)) for h, uri in links], prune=fraction >= 1.0))
+        idx.upsert(("rdf_node", uri, None, None, {"conforms": uri not in failing}) for _, uri in links)
 
     print("SHACL GLOBAL:", "OK" if all([c1,c2,c3]) else "CONSTRAINTS FAILED")
     print(f"- Reporte: {OUT_VALIDATION}")
-    print(f"- Linaje RDF: {OUT_LINEAGE}")
+    print(f"- Linaje RDF: {OUT_LINEAGE}" + ("" if write_lineage else " (no se escribe con muestreo: se conserva el anterior)"))
 
 if __name__ == "__main__":
-    main()
+    with stage("SHACL.validate"):
+        main()
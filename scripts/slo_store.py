@@ -0,0 +1,193 @@
+"""
+Almacén de SLO con coste constante por ejecución.
+
+- ops/slo_history.jsonl: append real (una línea por run); se compacta por
+  retención solo cuando supera HISTORY_MAX_BYTES.
+- ops/slo_sketch.json: por etapa, un DDSketch histórico y uno por hora UTC
+  (últimos RETENTION_HOURS). Las ventanas 24h/7d se obtienen fusionando los
+  sketches horarios, así el informe no depende del tamaño del historial.
+- DDSketch: cuantiles con error relativo acotado (alpha) y fusionables.
+"""
+import fcntl, json, math, os, uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+HISTORY = Path("ops/slo_history.jsonl")
+STATE = Path("ops/slo_sketch.json")
+LOCK = Path("ops/slo_store.lock")
+ALPHA = 0.01                      # error relativo de los cuantiles (1 %)
+RETENTION_HOURS = 7 * 24          # sketches horarios conservados
+HISTORY_RETENTION_DAYS = 30       # líneas crudas conservadas al compactar
+HISTORY_MAX_BYTES = 8 * 1024 * 1024
+WINDOWS = {"24h": 24, "7d": 7 * 24}
+QUANTILES = {"p50_sec": 0.50, "p95_sec": 0.95, "p99_sec": 0.99}
+MIN_VALUE = 1e-9
+
+class DDSketch:
+    def __init__(self, alpha: float = ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float):
+        if x <= MIN_VALUE:
+            self.zero += 1
+        else:
+            i = math.ceil(math.log(x) / self._log_gamma)
+            self.bins[i] = self.bins.get(i, 0) + 1
+        self.count += 1
+        self.sum += x
+        self.min, self.max = min(self.min, x), max(self.max, x)
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))   # nearest-rank
+        seen = self.zero
+        if rank <= seen:
+            return 0.0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen >= rank:
+                # centro del bucket acotado por los extremos observados
+                return min(max(2 * self.gamma ** i / (self.gamma + 1), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "bins": {str(i): n for i, n in self.bins.items()}, "zero": self.zero,
+                "count": self.count, "sum": self.sum,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "DDSketch":
+        s = cls(d.get("alpha", ALPHA))
+        s.bins = {int(i): n for i, n in d.get("bins", {}).items()}
+        s.zero, s.count, s.sum = d.get("zero", 0), d.get("count", 0), d.get("sum", 0.0)
+        if s.count:
+            s.min, s.max = d["min"], d["max"]
+        return s
+
+def _hour(utc: datetime) -> str:
+    return utc.strftime("%Y-%m-%dT%H")
+
+def _parse_utc(s: str) -> datetime:
+    return datetime.fromisoformat(s.removesuffix("Z"))
+
+def summarize(sk: DDSketch) -> dict:
+    if not sk.count:
+        return {"count": 0}
+    out = {"count": sk.count, "mean_sec": round(sk.sum / sk.count, 4)}
+    out.update({k: round(sk.quantile(q), 4) for k, q in QUANTILES.items()})
+    out["max_sec"] = round(sk.max, 4)
+    return out
+
+class SLOStore:
+    def __init__(self, history: Path = HISTORY, state: Path = STATE, lock: Path = LOCK):
+        self.history, self.state_path, self.lock_path = Path(history), Path(state), Path(lock)
+
+    @contextmanager
+    def _locked(self):
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock_path.open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        if self.state_path.exists():
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        return self._rebuild_from_history()
+
+    def _save(self, state: dict):
+        tmp = self.state_path.with_name(f"{self.state_path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.state_path)
+
+    def _rebuild_from_history(self) -> dict:
+        # migración única: historial previo sin estado de sketches
+        state = {"stages": {}}
+        if self.history.exists():
+            with self.history.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._fold(state, json.loads(line))
+                    except Exception:
+                        pass
+        return state
+
+    def _fold(self, state: dict, run: dict):
+        hour = _hour(_parse_utc(run["utc"]))
+        for s in run["steps"]:
+            st = state["stages"].setdefault(s["name"], {"all": DDSketch().to_dict(), "hours": {}})
+            for key, holder in (("all", st), (hour, st["hours"])):
+                sk = DDSketch.from_dict(holder.get(key, DDSketch().to_dict()))
+                sk.add(float(s["duration_sec"]))
+                holder[key] = sk.to_dict()
+
+    def _expire(self, state: dict, now: datetime):
+        cutoff = _hour(now - timedelta(hours=RETENTION_HOURS))
+        for st in state["stages"].values():
+            st["hours"] = {h: v for h, v in st["hours"].items() if h > cutoff}
+
+    def _compact_history(self, now: datetime):
+        if not self.history.exists() or self.history.stat().st_size <= HISTORY_MAX_BYTES:
+            return
+        cutoff = now - timedelta(days=HISTORY_RETENTION_DAYS)
+        tmp = self.history.with_name(f"{self.history.name}.{uuid.uuid4().hex}.tmp")
+        with self.history.open(encoding="utf-8") as src, tmp.open("w", encoding="utf-8") as dst:
+            for line in src:
+                try:
+                    if _parse_utc(json.loads(line)["utc"]) >= cutoff:
+                        dst.write(line)
+                except Exception:
+                    pass
+        os.replace(tmp, self.history)
+
+    def record(self, run: dict) -> dict:
+        """Añade un run (append + actualización de sketches) y devuelve el informe agregado."""
+        now = _parse_utc(run["utc"])
+        with self._locked():
+            self.history.parent.mkdir(parents=True, exist_ok=True)
+            # se carga (o reconstruye desde el historial) antes del append: el run se pliega una sola vez
+            state = self._load()
+            with self.history.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(run) + "\n")
+            self._fold(state, run)
+            self._expire(state, now)
+            self._save(state)
+            self._compact_history(now)
+        return self.report(state, now)
+
+    def report(self, state: dict | None = None, now: datetime | None = None) -> dict:
+        state = state if state is not None else self._load()
+        now = now or datetime.utcnow()
+        out = {}
+        for name, st in state["stages"].items():
+            entry = {"all": summarize(DDSketch.from_dict(st["all"]))}
+            for w, hours in WINDOWS.items():
+                cutoff = _hour(now - timedelta(hours=hours))
+                sk = DDSketch()
+                for h, d in st["hours"].items():
+                    if h > cutoff:
+                        sk.merge(DDSketch.from_dict(d))
+                entry[w] = summarize(sk)
+            out[name] = entry
+        return out
@@ -0,0 +1,195 @@
+"""
+Trazas ligeras para las etapas del pipeline.
+
+    from tracing import stage, span
+    with stage("MCP.ingest"):                 # span raíz de la etapa; al salir escribe las trazas
+        with span("schema_validate", domain="energy") as sp:
+            ...
+            sp.set(records=len(records), bytes=n)
+
+Cada span registra duración, atributos (registros, bytes...) y memoria pico.
+Salidas (en ops/traces/ del directorio de trabajo):
+  <etapa>.trace.json   → Trace Event Format (chrome://tracing, Perfetto, speedscope)
+  <etapa>.folded       → pilas colapsadas "a;b;c µs" (flamegraph.pl / speedscope)
+  ops/trace.json y ops/flamegraph.folded → combinación de todas las etapas del run
+Cada traza lleva el STEELTRACE_RUN_ID del orquestador: la combinación y root_attrs()
+ignoran las trazas de otros runs que queden en el directorio.
+
+Perfilado opcional por etapa con STEELTRACE_PROFILE:
+  "cprofile" → <etapa>.prof (pstats)   "sample" → <etapa>.sampled.folded (muestreo cada 5 ms)
+  Se puede limitar a etapas concretas: STEELTRACE_PROFILE="sample:SHACL.validate,RAGA.compute".
+Memoria por span con tracemalloc (más coste) si STEELTRACE_TRACE_MEM=1; si no, RSS pico del proceso.
+El pico de un span incluye el de sus hijos (reset_peak() en un hijo no borra el del padre).
+La pila de spans es un ContextVar: los spans abiertos desde asyncio.to_thread o tareas
+cuelgan del span que los lanzó.
+Si el orquestador define STEELTRACE_SPAWN_TS (epoch al lanzar la etapa), el span raíz
+lleva startup_ms: arranque del intérprete + imports hasta entrar en la etapa.
+"""
+import contextvars, json, os, resource, sys, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_DIR = Path("ops/traces")
+SAMPLE_INTERVAL_SEC = 0.005
+_TRACE_MEM = os.environ.get("STEELTRACE_TRACE_MEM") == "1"
+
+_events: list[dict] = []
+_stack: contextvars.ContextVar[tuple["Span", ...]] = contextvars.ContextVar("steeltrace_spans", default=())
+_t0 = time.perf_counter_ns()
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.path = ";".join([*(s.name for s in _stack.get()), name])
+        self.child_ns = 0
+        self.peak = 0   # pico tracemalloc ya observado (antes de los reset_peak() de los hijos)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, **counters):
+        for k, v in counters.items():
+            self.attrs[k] = self.attrs.get(k, 0) + v
+        return self
+
+@contextmanager
+def span(name: str, **attrs):
+    sp = Span(name, attrs)
+    parent = _stack.get()[-1] if _stack.get() else None
+    token = _stack.set((*_stack.get(), sp))
+    if _TRACE_MEM:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if parent is not None:
+            parent.peak = max(parent.peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    start = time.perf_counter_ns()
+    try:
+        yield sp
+    finally:
+        dur = time.perf_counter_ns() - start
+        _stack.reset(token)
+        if parent is not None:
+            parent.child_ns += dur
+        if _TRACE_MEM:
+            import tracemalloc
+            sp.peak = max(sp.peak, tracemalloc.get_traced_memory()[1])
+            if parent is not None:
+                parent.peak = max(parent.peak, sp.peak)
+            sp.attrs["peak_alloc_mb"] = round(sp.peak / 2**20, 2)
+        sp.attrs["peak_rss_mb"] = _peak_rss_mb()
+        _events.append({
+            "name": name, "ph": "X", "cat": "steeltrace",
+            "ts": (start - _t0) / 1000, "dur": dur / 1000,
+            "pid": os.getpid(), "tid": threading.get_ident() % 100000,
+            "args": {**sp.attrs, "path": sp.path, "self_us": (dur - sp.child_ns) / 1000},
+        })
+
+def _profile_mode(stage_name: str) -> str | None:
+    cfg = os.environ.get("STEELTRACE_PROFILE", "").strip()
+    if not cfg:
+        return None
+    mode, _, stages = cfg.partition(":")
+    if stages and stage_name not in {s.strip() for s in stages.split(",")}:
+        return None
+    return mode
+
+class _Sampler(threading.Thread):
+    """Profiler de muestreo mínimo: pila del hilo principal cada SAMPLE_INTERVAL_SEC."""
+
+    def __init__(self, thread_id: int):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.counts: dict[str, int] = {}
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(SAMPLE_INTERVAL_SEC):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+def _out(stage_name: str, suffix: str) -> Path:
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in stage_name)
+    return TRACE_DIR / f"{safe}{suffix}"
+
+def _write_combined():
+    run_id = os.environ.get("STEELTRACE_RUN_ID")
+    merged, folded = [], []
+    for p in sorted(TRACE_DIR.glob("*.trace.json")):
+        data = json.loads(p.read_text(encoding="utf-8"))
+        if run_id and data.get("run_id") != run_id:
+            continue
+        merged.extend(data["traceEvents"])
+        f = p.with_name(p.name.removesuffix(".trace.json") + ".folded")
+        if f.exists():
+            folded.append(f.read_text(encoding="utf-8"))
+    Path("ops/trace.json").write_text(json.dumps({"traceEvents": merged, "displayTimeUnit": "ms", "run_id": run_id}))
+    Path("ops/flamegraph.folded").write_text("".join(folded), encoding="utf-8")
+
+def flush(stage_name: str):
+    TRACE_DIR.mkdir(parents=True, exist_ok=True)
+    # cada proceso mide con perf_counter; se ancla a time.time() para alinear las etapas en una misma línea temporal
+    epoch_us = time.time() * 1e6 - (time.perf_counter_ns() - _t0) / 1000
+    events = [{**e, "ts": e["ts"] + epoch_us} for e in _events]
+    _out(stage_name, ".trace.json").write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms",
+                                                           "run_id": os.environ.get("STEELTRACE_RUN_ID")}))
+    lines = [f"{e['args']['path']} {max(0, int(e['args']['self_us']))}" for e in _events]
+    _out(stage_name, ".folded").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _write_combined()
+
+def root_attrs(stage_name: str, base: Path = Path("."), run_id: str | None = None) -> dict:
+    """Atributos del span raíz de la última traza escrita por una etapa ({} si no hay o, con
+    run_id, si la escribió otro run)."""
+    p = base / _out(stage_name, ".trace.json")
+    if not p.exists():
+        return {}
+    data = json.loads(p.read_text(encoding="utf-8"))
+    if run_id and data.get("run_id") != run_id:
+        return {}
+    return next((e["args"] for e in data["traceEvents"] if e["args"].get("path") == stage_name), {})
+
+@contextmanager
+def stage(stage_name: str, **attrs):
+    """Span raíz de una etapa con perfilado opcional; escribe las trazas al terminar."""
+    spawned = os.environ.get("STEELTRACE_SPAWN_TS")
+    if spawned:
+        attrs["startup_ms"] = round((time.time() - float(spawned)) * 1000, 1)
+    mode = _profile_mode(stage_name)
+    prof = sampler = None
+    if mode == "cprofile":
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+    elif mode == "sample":
+        sampler = _Sampler(threading.get_ident())
+        sampler.start()
+    try:
+        with span(stage_name, **attrs) as sp:
+            yield sp
+    finally:
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(str(_out(stage_name, ".prof")))
+        if sampler is not None:
+            sampler.stop_event.set()
+            sampler.join()
+            us = SAMPLE_INTERVAL_SEC * 1e6
+            _out(stage_name, ".sampled.folded").write_text(
+                "".join(f"{k} {int(n * us)}\n" for k, n in sampler.counts.items()), encoding="utf-8")
+        flush(stage_name)
@@ -0,0 +1,231 @@
+"""
+TSA local estilo RFC-3161 (sustituto de una TSA real para el PoC).
+
+- LocalSigner: firma peticiones {messageImprint, nonce} con HMAC-SHA256.
+- serve(): expone el firmante por TCP (JSON por línea) para simular una TSA remota.
+- TSAClient: cliente asyncio con pool de conexiones hacia ese servicio.
+- stamp_roots(): agrega N raíces Merkle en un único árbol y pide UN token;
+  cada raíz recibe su prueba de inclusión.
+- verify_tokens(): verificación masiva (firma una vez por token agregado + pruebas).
+
+Backend configurable con STEELTRACE_TSA = "local" (por defecto) | "tcp://host:port".
+Sin STEELTRACE_TSA_KEY se firma con la clave de desarrollo DEFAULT_KEY: se avisa por
+stderr y los tokens llevan "dev": true en tstInfo (firmado).
+"""
+import asyncio, hashlib, hmac, json, os, secrets, sys
+from datetime import datetime
+from pathlib import Path
+from merkle import merkle_root_from_hashes, merkle_proof, verify_proof
+
+TSA_NAME = "STEELTRACE-LOCAL-TSA"
+POLICY_OID = "1.3.6.1.4.1.99999.1.1"   # OID de política ficticio (PoC)
+DEFAULT_KEY = "steeltrace-local-tsa-dev-key"
+
+_warned = False
+
+def _key() -> bytes:
+    global _warned
+    key = os.environ.get("STEELTRACE_TSA_KEY")
+    if key:
+        return key.encode("utf-8")
+    if not _warned:
+        print("AVISO: STEELTRACE_TSA_KEY no definida; se usa la clave de desarrollo y los tokens "
+              "se marcan dev: true (no válidos como evidencia)", file=sys.stderr)
+        _warned = True
+    return DEFAULT_KEY.encode("utf-8")
+
+def _canonical(obj) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+class LocalSigner:
+    def __init__(self, key: bytes | None = None, name: str = TSA_NAME):
+        self.key = key or _key()
+        self.dev = self.key == DEFAULT_KEY.encode("utf-8")
+        self.name = name
+        self._serial = 0
+
+    def sign(self, req: dict) -> dict:
+        # req: {"messageImprint": {"hashAlgorithm": "sha256", "hashedMessage": hex}, "nonce": int}
+        self._serial += 1
+        tst_info = {
+            "version": 1,
+            "policy": POLICY_OID,
+            "messageImprint": req["messageImprint"],
+            "serialNumber": f"{int(datetime.utcnow().timestamp())}-{self._serial}",
+            "genTime": datetime.utcnow().isoformat() + "Z",
+            "nonce": req.get("nonce"),
+            "tsa": self.name,
+        }
+        if self.dev:
+            tst_info["dev"] = True
+        sig = hmac.new(self.key, _canonical(tst_info), hashlib.sha256).hexdigest()
+        return {"status": "granted", "tstInfo": tst_info, "signature": f"HMAC-SHA256:{sig}"}
+
+def make_request(digest_hex: str) -> dict:
+    return {
+        "messageImprint": {"hashAlgorithm": "sha256", "hashedMessage": digest_hex.removeprefix("SHA256:")},
+        "nonce": secrets.randbits(63),
+    }
+
+# -------- Servicio TCP (stand-in de TSA remota) --------
+async def _handle(signer: LocalSigner, reader, writer):
+    try:
+        while line := await reader.readline():
+            try:
+                resp = signer.sign(json.loads(line))
+            except Exception as e:
+                resp = {"status": "rejection", "error": str(e)}
+            writer.write(_canonical(resp) + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(host="127.0.0.1", port=3161, signer: LocalSigner | None = None):
+    signer = signer or LocalSigner()
+    server = await asyncio.start_server(lambda r, w: _handle(signer, r, w), host, port)
+    async with server:
+        await server.serve_forever()
+
+# -------- Clientes --------
+class TSAClient:
+    """Cliente asyncio con pool de conexiones persistentes (una petición en vuelo por conexión)."""
+
+    def __init__(self, host="127.0.0.1", port=3161, pool_size=4):
+        self.host, self.port, self.pool_size = host, port, pool_size
+        self._pool: asyncio.Queue | None = None
+        self._opened = 0
+
+    async def _acquire(self):
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+        if self._pool.empty() and self._opened < self.pool_size:
+            self._opened += 1   # se reserva antes del await; se devuelve si la conexión falla
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except BaseException:
+                self._opened -= 1
+                raise
+        return await self._pool.get()
+
+    async def timestamp(self, req: dict) -> dict:
+        reader, writer = await self._acquire()
+        try:
+            writer.write(_canonical(req) + b"\n")
+            await writer.drain()
+            resp = json.loads(await reader.readline())
+        except Exception:
+            writer.close()
+            self._opened -= 1
+            raise
+        self._pool.put_nowait((reader, writer))
+        return resp
+
+    async def close(self):
+        while self._pool is not None and not self._pool.empty():
+            _, writer = self._pool.get_nowait()
+            writer.close()
+        self._opened = 0
+
+class InProcessClient:
+    """Misma interfaz que TSAClient pero firmando en proceso (sin red)."""
+
+    def __init__(self, signer: LocalSigner | None = None):
+        self.signer = signer or LocalSigner()
+
+    async def timestamp(self, req: dict) -> dict:
+        return self.signer.sign(req)
+
+    async def close(self):
+        pass
+
+def get_client():
+    target = os.environ.get("STEELTRACE_TSA", "local")
+    if target.startswith("tcp://"):
+        host, port = target[len("tcp://"):].rsplit(":", 1)
+        return TSAClient(host, int(port))
+    return InProcessClient()
+
+# -------- Sellado por lotes y verificación --------
+async def stamp_roots_async(roots: list[str], client=None) -> list[dict]:
+    """Un único round-trip para N raíces: se sella la raíz del árbol de raíces."""
+    if not roots:
+        return []
+    own = client is None
+    client = client or get_client()
+    leaves = [r.removeprefix("SHA256:") for r in roots]
+    agg_root = merkle_root_from_hashes(leaves)
+    req = make_request(agg_root)
+    try:
+        resp = await client.timestamp(req)
+    finally:
+        if own:   # un cliente recibido sigue siendo del llamador (p.ej. pool compartido)
+            await client.close()
+    if resp.get("status") != "granted":
+        raise RuntimeError(f"TSA rechazó la petición: {resp.get('error')}")
+    if resp["tstInfo"]["nonce"] != req["nonce"]:
+        raise RuntimeError("TSA devolvió un nonce distinto al solicitado")
+    return [{
+        "tsa": resp["tstInfo"]["tsa"],
+        "ts_utc": resp["tstInfo"]["genTime"],
+        "merkle_root": roots[i],
+        "aggregate_root": f"SHA256:{agg_root}",
+        "inclusion_proof": merkle_proof(leaves, i),
+        "token": resp,
+    } for i in range(len(roots))]
+
+def stamp_roots(roots: list[str], client=None) -> list[dict]:
+    return asyncio.run(stamp_roots_async(roots, client))
+
+def verify_tokens(tokens: list[dict], key: bytes | None = None) -> list[dict]:
+    """Verifica en bloque; la firma de cada token agregado se comprueba una sola vez.
+
+    La caché va por (firma, tstInfo canónico): un token que reutilice la firma de otro con
+    un tstInfo distinto no hereda su resultado."""
+    key = key or _key()
+    sig_ok: dict[tuple[str, bytes], bool] = {}
+    out = []
+    for t in tokens:
+        tok = t.get("token", {})
+        info = tok.get("tstInfo", {})
+        sig = tok.get("signature", "")
+        signed = (sig, _canonical(info))
+        if signed not in sig_ok:
+            expected = hmac.new(key, signed[1], hashlib.sha256).hexdigest()
+            sig_ok[signed] = hmac.compare_digest(sig, f"HMAC-SHA256:{expected}")
+        imprint_ok = info.get("messageImprint", {}).get("hashedMessage") == t.get("aggregate_root", "").removeprefix("SHA256:")
+        leaf = t.get("merkle_root", "").removeprefix("SHA256:")
+        proof_ok = verify_proof(leaf, t.get("inclusion_proof", []), t.get("aggregate_root", ""))
+        out.append({"merkle_root": t.get("merkle_root"), "signature": sig_ok[signed],
+                    "imprint": imprint_ok, "inclusion": proof_ok, "dev": bool(info.get("dev")),
+                    "ok": sig_ok[signed] and imprint_ok and proof_ok})
+    return out
+
+def main(argv: list[str]):
+    # python scripts/tsa.py serve [port]
+    # python scripts/tsa.py stamp evidence/a_manifest.json evidence/b_manifest.json ...
+    # python scripts/tsa.py verify evidence/tokens/*.tsr
+    cmd = argv[0] if argv else "verify"
+    if cmd == "serve":
+        port = int(argv[1]) if len(argv) > 1 else 3161
+        print(f"TSA local escuchando en 127.0.0.1:{port}")
+        asyncio.run(serve(port=port))
+    elif cmd == "stamp":
+        mans = [Path(p) for p in argv[1:]]
+        roots = [json.loads(p.read_text(encoding="utf-8"))["merkle_root"] for p in mans]
+        Path("evidence/tokens").mkdir(parents=True, exist_ok=True)
+        for p, tok in zip(mans, stamp_roots(roots)):
+            out = Path("evidence/tokens") / (p.stem + ".tsr")
+            out.write_text(json.dumps(tok, indent=2))
+            print("Token →", out)
+    elif cmd == "verify":
+        paths = argv[1:] or [str(p) for p in sorted(Path("evidence/tokens").glob("*.tsr"))]
+        res = verify_tokens([json.loads(Path(p).read_text(encoding="utf-8")) for p in paths])
+        for p, r in zip(paths, res):
+            print("OK  " if r["ok"] else "FAIL", p, r)
+        if not all(r["ok"] for r in res):
+            raise SystemExit(1)
+    else:
+        raise SystemExit(f"Comando desconocido: {cmd}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,204 @@
+"""
+Propagación de incertidumbre de las entradas a los KPIs (Monte Carlo vectorizado con NumPy).
+
+    cfg = load_config()                             # bloque `uncertainty` de raga/rules.yaml
+    res = propagate("energy", records, cfg)         # → valor, media, σ, IC, residual, por grupo
+
+- Cada entrada con incertidumbre (rules.yaml → uncertainty.inputs) se muestrea como
+  matriz registros × muestras (float32): rel/abs → normal, range → uniforme; las demás se difunden
+  con su valor nominal. Las cantidades físicas se recortan a ≥ 0.
+- Los términos sumables y la fórmula del KPI son los de kpi_state.DOMAINS, evaluados
+  sobre las matrices: suma por grupo (entidad|periodo|source_system) con np.add.reduceat
+  y cuantiles del IC por fila, por bloques de grupos para acotar la memoria
+  (MAX_CELLS celdas por matriz); el total del DP acumula las sumas de todos los bloques
+  con las mismas muestras. Los bloques se reparten entre hilos (STEELTRACE_MC_WORKERS).
+- method: analytic → propagación lineal (método delta) con las mismas fórmulas, O(registros):
+  para lotes muy grandes o como contraste del Monte Carlo.
+- residual = semiamplitud del IC / |valor nominal|, recortado a [0, 1].
+"""
+import json, os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+import numpy as np
+from kpi_state import DOMAINS, group_key, inputs
+from utils_hash import sha256_json
+
+RULES = Path("raga/rules.yaml")
+MAX_CELLS = 2_000_000   # celdas registros × muestras por bloque (~8 MB por matriz float32)
+WORKERS = int(os.environ.get("STEELTRACE_MC_WORKERS", os.cpu_count() or 4))
+DEFAULTS = {"method": "montecarlo", "samples": 100_000, "level": 0.95, "seed": 0, "inputs": {}}
+
+def load_config(path: Path = RULES) -> dict:
+    import yaml
+    cfg = (yaml.safe_load(path.read_text(encoding="utf-8")) or {}).get("uncertainty") or {}
+    return {**DEFAULTS, **cfg}
+
+def config_hash(cfg: dict, domain: str) -> str:
+    # cambia si cambian las incertidumbres del dominio o los parámetros del muestreo
+    return sha256_json({k: cfg[k] for k in ("method", "samples", "level", "seed")}
+                       | {"inputs": cfg["inputs"].get(domain, {})})[:16]
+
+def _draw(rng, nominal: np.ndarray, spec: dict, n: int) -> np.ndarray:
+    """Registros × muestras (float32, in situ: es el paso dominante)."""
+    shape, col = (len(nominal), n), nominal[:, None].astype(np.float32)
+    if "range" in spec:
+        x = rng.random(shape, dtype=np.float32)
+        x *= np.float32(2 * spec["range"])
+        x += np.float32(1 - spec["range"])
+        x *= col
+    elif "rel" in spec:
+        x = rng.standard_normal(shape, dtype=np.float32)
+        x *= np.float32(spec["rel"])
+        x += np.float32(1)
+        x *= col
+    elif "abs" in spec:
+        x = rng.standard_normal(shape, dtype=np.float32)
+        x *= np.float32(spec["abs"])
+        x += col
+    else:
+        raise ValueError(f"incertidumbre sin rel/abs/range: {spec}")
+    return np.maximum(x, 0, out=x)
+
+def _residual(nominal: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    half = (hi - lo) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(nominal != 0, half / np.abs(nominal), np.where(half > 0, 1.0, 0.0))
+    return np.clip(r, 0.0, 1.0)
+
+def _quantiles(a: np.ndarray, q: list[float]) -> np.ndarray:
+    """Cuantiles por fila (interpolación lineal, como np.quantile). Ordenar filas float32 es
+    más rápido que np.partition con varios k."""
+    a = np.sort(a, axis=-1)
+    pos = np.asarray(q) * (a.shape[-1] - 1)
+    i = np.floor(pos).astype(int)
+    j = np.minimum(i + 1, a.shape[-1] - 1)
+    return a[..., i] + (a[..., j] - a[..., i]) * (pos - i)
+
+def _blocks(starts: np.ndarray, n_records: int, samples: int):
+    """Bloques de grupos contiguos [g0, g1) con ≤ MAX_CELLS celdas (un grupo nunca se parte)."""
+    per_block = max(1, MAX_CELLS // samples)
+    ends = np.append(starts[1:], n_records)
+    g0 = 0
+    while g0 < len(starts):
+        g1 = int(np.searchsorted(ends, starts[g0] + per_block, side="right"))
+        g1 = max(g1, g0 + 1)
+        yield g0, g1
+        g0 = g1
+
+def _prepare(domain: str, records: list[dict]):
+    """Registros ordenados por grupo: claves de grupo, inicio de cada grupo y entradas nominales (float64)."""
+    keys = [group_key(domain, r) for r in records]
+    order = sorted(range(len(records)), key=keys.__getitem__)
+    groups, starts = np.unique(np.array([keys[i] for i in order], dtype=str), return_index=True)
+    x = {k: np.array([float(inputs(domain, records[i])[k] or 0) for i in order]) for k in DOMAINS[domain]["inputs"]}
+    return groups, starts, x
+
+def _mc_block(spec: dict, unc: dict, x: dict, starts: np.ndarray, n_records: int, g0: int, g1: int,
+              n: int, q: list[float], seed) -> tuple:
+    rng = np.random.default_rng(seed)
+    r0 = starts[g0]
+    r1 = starts[g1] if g1 < len(starts) else n_records
+    local = starts[g0:g1] - r0
+    nominal = {k: v[r0:r1] for k, v in x.items()}
+    draws = {k: (_draw(rng, v, unc[k], n) if k in unc else v[:, None]) for k, v in nominal.items()}
+    terms = spec["terms"](draws)
+    # grupos de un solo registro (lo habitual): la suma por grupo es el propio registro
+    sums = {t: np.broadcast_to(v, (r1 - r0, n)) if len(local) == r1 - r0
+            else np.add.reduceat(np.broadcast_to(v, (r1 - r0, n)), local, axis=0) for t, v in terms.items()}
+    nom = spec["formula"]({t: np.add.reduceat(v, local) for t, v in spec["terms"](nominal).items()})
+    lo, hi = _quantiles(spec["formula"](sums), q).T
+    return nom, lo, hi, {t: v.sum(axis=0, dtype=np.float64) for t, v in sums.items()}
+
+def montecarlo(domain: str, groups, starts, x: dict, cfg: dict, workers: int = WORKERS) -> dict:
+    """Muestras por bloques de grupos en paralelo; cada bloque tiene su semilla (resultado
+    independiente del número de hilos: NumPy libera el GIL al muestrear y ordenar)."""
+    spec, unc = DOMAINS[domain], cfg["inputs"].get(domain, {})
+    n, level = int(cfg["samples"]), float(cfg["level"])
+    q = [(1 - level) / 2, (1 + level) / 2]
+    n_records = len(next(iter(x.values())))
+    blocks = list(_blocks(starts, n_records, n))
+    seeds = np.random.SeedSequence([int(cfg["seed"]), list(DOMAINS).index(domain)]).spawn(len(blocks))
+    total = {t: np.zeros(n) for t in spec["terms"]({k: 0.0 for k in spec["inputs"]})}
+    parts = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for nom, lo, hi, sums in pool.map(lambda a: _mc_block(spec, unc, x, starts, n_records, *a[0], n, q, a[1]),
+                                          zip(blocks, seeds)):
+            for t, v in sums.items():
+                total[t] += v
+            parts.append((nom, lo, hi))
+    values = spec["formula"](total)
+    lo, hi = _quantiles(values, q)
+    g_nom, g_lo, g_hi = (np.concatenate(a) for a in zip(*parts))
+    return {"mean": float(values.mean()), "std": float(values.std()), "ci": (float(lo), float(hi)),
+            "groups": (g_nom, g_lo, g_hi)}
+
+def _grad(f, base: dict, keys) -> dict:
+    # diferencias centrales, vectorizadas sobre registros/grupos
+    out = {}
+    for k in keys:
+        h = np.maximum(np.abs(base[k]) * 1e-6, 1e-9)
+        up, down = dict(base), dict(base)
+        up[k], down[k] = base[k] + h, base[k] - h
+        fu, fd = f(up), f(down)
+        out[k] = {t: (fu[t] - fd[t]) / (2 * h) for t in fu} if isinstance(fu, dict) else (fu - fd) / (2 * h)
+    return out
+
+def analytic(domain: str, groups, starts, x: dict, cfg: dict) -> dict:
+    """Propagación lineal (método delta): Var(KPI) ≈ ∇fᵀ · Cov(sumas) · ∇f, con Cov(sumas)
+    acumulada registro a registro a partir de σ de las entradas. O(registros), sin muestreo."""
+    spec, unc = DOMAINS[domain], cfg["inputs"].get(domain, {})
+    level = float(cfg["level"])
+    z = NormalDist().inv_cdf((1 + level) / 2)
+    sd = {k: np.full_like(x[k], float(u["abs"])) if "abs" in u
+          else np.abs(x[k]) * float(u.get("rel", u.get("range", 0) / np.sqrt(3))) for k, u in unc.items()}
+    names = list(spec["terms"]({k: 0.0 for k in spec["inputs"]}))
+    jac = _grad(spec["terms"], x, unc)                          # ∂término/∂entrada por registro
+    cov = np.zeros((len(next(iter(x.values()))), len(names), len(names)))
+    for k in unc:
+        g = np.stack([jac[k][t] for t in names], axis=1) * sd[k][:, None]
+        cov += g[:, :, None] * g[:, None, :]
+    sums = {t: np.add.reduceat(v, starts) for t, v in spec["terms"](x).items()} if len(starts) else {}
+
+    def spread(s: dict, c: np.ndarray):
+        gf = _grad(spec["formula"], s, names)                   # ∂KPI/∂suma
+        g = np.stack([np.broadcast_to(gf[t], np.shape(s[names[0]])) for t in names], axis=-1)
+        return np.sqrt(np.einsum("...i,...ij,...j->...", g, c, g))
+
+    g_cov = np.add.reduceat(cov, starts, axis=0) if len(starts) else cov
+    g_nom = spec["formula"](sums) if sums else np.empty(0)
+    g_sd = spread(sums, g_cov) if sums else np.empty(0)
+    tot = {t: v.sum() for t, v in sums.items()}
+    nominal, sd_tot = float(spec["formula"](tot)), float(spread(tot, cov.sum(axis=0)))
+    return {"mean": nominal, "std": sd_tot, "ci": (nominal - z * sd_tot, nominal + z * sd_tot),
+            "groups": (g_nom, g_nom - z * g_sd, g_nom + z * g_sd)}
+
+METHODS = {"montecarlo": montecarlo, "analytic": analytic}
+
+def propagate(domain: str, records: list[dict], cfg: dict) -> dict:
+    spec, method = DOMAINS[domain], cfg.get("method", "montecarlo")
+    nd, level = spec["ndigits"], float(cfg["level"])
+    groups, starts, x = _prepare(domain, records)
+    nominal = float(spec["formula"]({t: v.sum() for t, v in spec["terms"](x).items()}))
+    if not records:
+        res = {"mean": nominal, "std": 0.0, "ci": (nominal, nominal), "groups": (np.empty(0),) * 3}
+    else:
+        res = METHODS[method](domain, groups, starts, x, cfg)
+    lo, hi = res["ci"]
+    g_nom, g_lo, g_hi = res["groups"]
+    g_res = _residual(g_nom, g_lo, g_hi)
+    ci = f"ci{round(level * 100)}"
+    return {
+        "method": method, "samples": int(cfg["samples"]) if method == "montecarlo" else None,
+        "level": level, "inputs": cfg["inputs"].get(domain, {}), "config": config_hash(cfg, domain),
+        "value": round(nominal, nd), "mean": round(res["mean"], nd + 2), "std": round(res["std"], nd + 2),
+        ci: [round(lo, nd + 2), round(hi, nd + 2)],
+        "residual": round(float(_residual(np.array([nominal]), np.array([lo]), np.array([hi]))[0]), 4),
+        "by_group": {str(g): {"value": round(float(v), nd), ci: [round(float(a), nd + 2), round(float(b), nd + 2)],
+                              "residual": round(float(r), 4)}
+                     for g, v, a, b, r in zip(groups, g_nom, g_lo, g_hi, g_res)},
+    }
+
+def propagate_file(domain: str, cfg: dict, path: Path | None = None) -> dict:
+    records = json.loads(Path(path or DOMAINS[domain]["normalized"]).read_text(encoding="utf-8"))
+    return propagate(domain, records, cfg)
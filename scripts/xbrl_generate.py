@@ -1,18 +1,27 @@
 from pathlib import Path
 import json
 from lxml import etree
+from tracing import stage, span
+from kpi_state import dirty_dps
+from lineage_index import LineageIndex
+import materiality
 
 KPI_FILE = Path("raga/kpis.json")
 OUT_XML  = Path("xbrl/informe.xbrl")
 XSD_FILE = Path("xbrl/schema/basic_xbrl.xsd")
 VAL_LOG  = Path("xbrl/validation.log")
 
+def load_kpis() -> dict:
+    # solo DP de temas materiales (raga/materiality.json); sin mapa → todos
+    kpis = json.loads(KPI_FILE.read_text(encoding="utf-8"))
+    return {dp: kpis[dp] for dp in materiality.split(kpis, materiality.load_map())[0]}
+
 def build_xml(entity="ACME", period="2024-01"):
     ns = {"x": "http://example.com/xbrl"}
     root = etree.Element("{http://example.com/xbrl}Report", version="0.1")
     etree.SubElement(root, "{http://example.com/xbrl}Entity").text = entity
     etree.SubElement(root, "{http://example.com/xbrl}Period").text = period
-    kpis = json.loads(KPI_FILE.read_text(encoding="utf-8"))
+    kpis = load_kpis()
     for k, v in kpis.items():
         kpi = etree.SubElement(root, "{http://example.com/xbrl}KPI")
         etree.SubElement(kpi, "{http://example.com/xbrl}Id").text = k
@@ -21,17 +30,63 @@ def build_xml(entity="ACME", period="2024-01"):
         # etree.SubElement(kpi, "{http://example.com/xbrl}Unit").text = "tCO2e"  # etc.
     return root
 
+def update_xml(dirty: set[str]):
+    """Informe existente con solo los KPI sucios actualizados (altas y bajas incluidas); None si no se puede."""
+    x = "{http://example.com/xbrl}"
+    try:
+        root = etree.parse(str(OUT_XML)).getroot()
+    except (OSError, etree.XMLSyntaxError):
+        return None
+    kpis = load_kpis()
+    present = {el.findtext(f"{x}Id"): el for el in root.findall(f"{x}KPI")}
+    for k, el in present.items():
+        if k not in kpis:
+            root.remove(el)
+    for k in kpis:
+        if k in present and k not in dirty:
+            continue
+        el = present.get(k)
+        if el is None:
+            el = etree.SubElement(root, f"{x}KPI")
+            etree.SubElement(el, f"{x}Id").text = k
+            etree.SubElement(el, f"{x}Value")
+        el.find(f"{x}Value").text = str(kpis[k])
+    return root
+
 def validate_xml(xml_tree):
     schema_doc = etree.parse(str(XSD_FILE))
     schema = etree.XMLSchema(schema_doc)
     return schema.validate(xml_tree), schema.error_log
 
+def index_facts(root):
+    """Linaje KPI → hecho XBRL en el índice consultable (lineage_index.py)."""
+    x = "{http://example.com/xbrl}"
+    facts = {el.findtext(f"{x}Id"): el.findtext(f"{x}Value") for el in root.findall(f"{x}KPI")}
+    with span("lineage_index") as sp, LineageIndex() as idx:
+        sp.set(**idx.sync_stage("XBRL.generate", [(("kpi", dp), ("xbrl_fact", f"{OUT_XML}#{dp}")) for dp in facts]))
+        idx.upsert([("xbrl_fact", f"{OUT_XML}#{dp}", None, None, {"value": v}) for dp, v in facts.items()])
+
 def main():
     OUT_XML.parent.mkdir(parents=True, exist_ok=True)
-    xml = build_xml()
-    tree = etree.ElementTree(xml)
-    ok, errors = validate_xml(tree)
-    tree.write(str(OUT_XML), encoding="utf-8", xml_declaration=True, pretty_print=True)
+    # con raga/dirty.json solo se tocan los KPI sucios del informe existente
+    dirty = dirty_dps()
+    if dirty is not None and not dirty and OUT_XML.exists() and VAL_LOG.exists():
+        index_facts(etree.parse(str(OUT_XML)).getroot())   # el índice puede ser más nuevo que el informe
+        print("XBRL sin cambios (ningún KPI sucio) →", OUT_XML)
+        return
+    with span("build_xml") as sp:
+        xml = update_xml(dirty) if dirty is not None and OUT_XML.exists() else None
+        sp.set(incremental=xml is not None, dirty=len(dirty) if dirty is not None else None)
+        if xml is None:
+            xml = build_xml()
+        tree = etree.ElementTree(xml)
+        sp.set(kpis=len(xml.findall("{http://example.com/xbrl}KPI")))
+    with span("validate_xsd"):
+        ok, errors = validate_xml(tree)
+    with span("write") as sp:
+        tree.write(str(OUT_XML), encoding="utf-8", xml_declaration=True, pretty_print=True)
+        sp.set(bytes=OUT_XML.stat().st_size)
+    index_facts(xml)
 
     if ok:
         VAL_LOG.write_text("XBRL basic schema validation: OK\n", encoding="utf-8")
@@ -41,4 +96,5 @@ def main():
         print("XBRL FAILED. See", VAL_LOG)
 
 if __name__ == "__main__":
-    main()
+    with stage("XBRL.generate"):
+        main()
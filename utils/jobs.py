@@ -0,0 +1,223 @@
+# utils/jobs.py
+"""
+Gestor de ejecuciones del pipeline en segundo plano para la app Streamlit.
+
+- Cola + pool de workers (hilos) que lanzan cada etapa como subproceso.
+- stdout/stderr se leen línea a línea mientras la etapa corre (log en vivo).
+- Estado por etapa, cancelación y timeout configurable por etapa.
+- Las ejecuciones en curso se comparten: si otra sesión pide las mismas
+  etapas sobre las mismas entradas (mismo hash), recibe el job existente.
+- Con STEELTRACE_FORKSERVER las etapas se lanzan desde un worker precalentado
+  (scripts/forkserver.py) con las dependencias pesadas ya importadas.
+- Cada job trabaja en su propio directorio de run (scripts/runs.py) partiendo
+  de las salidas del "current" de su partición; al terminar bien se publica
+  como nuevo current. Jobs de particiones distintas corren en paralelo.
+- `env` añade variables a las etapas del job (p.ej. STEELTRACE_PREVIEW) y entra en la clave;
+  `then` encadena otro submit cuando el job termina bien (vista previa → ejecución completa).
+"""
+import hashlib, os, subprocess, sys, threading, time, uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from runs import new_run, finalize, current, partition_dir, DEFAULT_PARTITION, INPUT_GLOBS  # INPUT_GLOBS: entradas que determinan el resultado
+from forkserver import spawn, ensure_server
+
+DEFAULT_TIMEOUT_SEC = float(os.environ.get("STEELTRACE_STAGE_TIMEOUT", 600))
+STAGE_TIMEOUTS = {"shacl_validate.py": 1800}
+MAX_LOG_LINES = 5000
+MAX_JOBS = 50
+ACTIVE = ("queued", "running")
+
+def input_hash(root: Path) -> str:
+    # (ruta, tamaño, mtime_ns) en lugar del contenido: submit no relee todas las entradas
+    h = hashlib.sha256()
+    for pattern in INPUT_GLOBS:
+        for p in sorted(root.glob(pattern)):
+            if p.is_file():
+                st = p.stat()
+                h.update(f"{p.relative_to(root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+class Job:
+    def __init__(self, key: str, stages: list[str], timeouts: dict, partition: str,
+                 env: dict | None = None, then: dict | None = None):
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.partition = partition
+        self.env = dict(env or {})
+        self.then = then
+        self.followup = None
+        self.run_id = None
+        self.run_dir = None
+        self.status = "queued"
+        self.timeouts = timeouts
+        self.stages = [{"name": s, "status": "pending", "returncode": None, "duration_sec": None} for s in stages]
+        self.log = deque(maxlen=MAX_LOG_LINES)
+        self.submitted = time.time()
+        self.ended = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def append(self, stream: str, line: str):
+        with self.lock:
+            self.log.append((stream, line.rstrip("\n")))
+
+    def update(self, stage: dict | None = None, **fields):
+        """Muta el estado del job (o de una de sus etapas) con el lock tomado, como lo lee snapshot()."""
+        with self.lock:
+            if stage is not None:
+                stage.update(fields)
+            else:
+                for k, v in fields.items():
+                    setattr(self, k, v)
+
+    def snapshot(self, tail: int = 200) -> dict:
+        with self.lock:
+            done = sum(1 for s in self.stages if s["status"] in ("ok", "failed", "timeout", "cancelled", "skipped"))
+            return {
+                "id": self.id, "status": self.status,
+                "partition": self.partition, "run_id": self.run_id,
+                "env": dict(self.env), "followup": self.followup,
+                "stages": [dict(s) for s in self.stages],
+                "progress": done / max(1, len(self.stages)),
+                "log": list(self.log)[-tail:],
+                "submitted": self.submitted, "ended": self.ended,
+            }
+
+class JobManager:
+    def __init__(self, root: Path, workers: int | None = None):
+        self.root = Path(root).resolve()
+        self.pool = ThreadPoolExecutor(max_workers=workers or int(os.environ.get("STEELTRACE_JOB_WORKERS", 4)))
+        self.jobs: dict[str, Job] = {}
+        self.lock = threading.Lock()
+        # STEELTRACE_FORKSERVER: etapas despachadas a un worker precalentado en vez de un intérprete nuevo
+        ensure_server()
+
+    def submit(self, stages: list[str], default_timeout: float | None = None, timeouts: dict | None = None,
+               partition: str = DEFAULT_PARTITION, env: dict | None = None, then: dict | None = None) -> Job:
+        partition_dir(partition)   # ValueError si el nombre no es válido, antes de encolar
+        env = {k: str(v) for k, v in (env or {}).items()}
+        key = hashlib.sha256(("|".join([partition, *stages, *sorted(f"{k}={v}" for k, v in env.items())])
+                              + input_hash(self.root)).encode("utf-8")).hexdigest()
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.status in ACTIVE:
+                    return job
+            tmo = {s: STAGE_TIMEOUTS.get(s, default_timeout or DEFAULT_TIMEOUT_SEC) for s in stages}
+            tmo.update(timeouts or {})
+            job = Job(key, stages, tmo, partition, env, then)
+            self.jobs[job.id] = job
+            self._prune()
+        self.pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job:
+            job.cancel_event.set()
+
+    def recent(self, n: int = 5) -> list[Job]:
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda j: j.submitted, reverse=True)[:n]
+
+    def _prune(self):
+        done = sorted((j for j in self.jobs.values() if j.status not in ACTIVE), key=lambda j: j.submitted)
+        for j in done[:max(0, len(self.jobs) - MAX_JOBS)]:
+            del self.jobs[j.id]
+
+    def _pump(self, job: Job, stream, name: str):
+        for line in iter(stream.readline, ""):
+            job.append(name, line)
+        stream.close()
+
+    def _run_stage(self, job: Job, stage: dict) -> str:
+        script = self.root / "scripts" / stage["name"]
+        env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+        env["STEELTRACE_CAS"] = str(self.root / "release" / "cas")
+        env["STEELTRACE_SLO_STATE"] = str(self.root / "ops" / "slo_sketch.json")
+        env["STEELTRACE_RUN_STARTED"] = str(job.submitted)
+        env.setdefault("STEELTRACE_RUN_ID", job.run_id)
+        env["STEELTRACE_SPAWN_TS"] = str(time.time())
+        env.update(job.env)
+        proc = spawn(script, job.run_dir, env)
+        readers = [threading.Thread(target=self._pump, args=(job, proc.stdout, "stdout"), daemon=True),
+                   threading.Thread(target=self._pump, args=(job, proc.stderr, "stderr"), daemon=True)]
+        for r in readers:
+            r.start()
+        t0 = time.perf_counter()
+        limit = job.timeouts.get(stage["name"], DEFAULT_TIMEOUT_SEC)
+        status = None
+        while proc.poll() is None:
+            if job.cancel_event.is_set():
+                status = "cancelled"
+            elif limit and time.perf_counter() - t0 > limit:
+                status = "timeout"
+            if status:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                break
+            time.sleep(0.2)
+        proc.wait()
+        for r in readers:
+            r.join(timeout=5)
+        with job.lock:
+            stage["returncode"] = proc.returncode
+            stage["duration_sec"] = round(time.perf_counter() - t0, 3)
+        if status == "timeout":
+            job.append("stderr", f"⏱️ {stage['name']} superó el timeout de {limit} s")
+        return status or ("ok" if proc.returncode == 0 else "failed")
+
+    def _run(self, job: Job):
+        job.update(status="running")
+        status = "failed"
+        try:
+            try:
+                run_id, run_dir = new_run(job.partition, base=current(job.partition))
+            except Exception as e:
+                job.append("stderr", f"❌ No se pudo preparar el directorio del run: {e}")
+                return
+            job.update(run_id=run_id, run_dir=run_dir)
+            job.append("stdout", f"📁 run {job.run_id} ({job.partition})")
+            for stage in job.stages:
+                if job.cancel_event.is_set():
+                    job.update(stage, status="cancelled")
+                    continue
+                job.update(stage, status="running")
+                job.append("stdout", f"▶️ {stage['name']}")
+                try:
+                    result = self._run_stage(job, stage)
+                except Exception as e:
+                    job.append("stderr", f"❌ {stage['name']}: {e}")
+                    result = "failed"
+                job.update(stage, status=result)
+                if result != "ok":
+                    with job.lock:
+                        for rest in job.stages:
+                            if rest["status"] == "pending":
+                                rest["status"] = "cancelled" if result == "cancelled" else "skipped"
+                    break
+            statuses = {s["status"] for s in job.stages}
+            outcome = next((s for s in ("cancelled", "timeout", "failed") if s in statuses), "ok")
+            try:
+                job.update(run_dir=finalize(job.run_dir, ok=outcome == "ok"))
+            except Exception as e:
+                job.append("stderr", f"❌ No se pudo publicar el run: {e}")
+                return
+            status = outcome
+            if status == "ok" and job.then:
+                try:
+                    nxt = self.submit(**job.then)
+                except Exception as e:
+                    job.append("stderr", f"❌ No se pudo encadenar la ejecución siguiente: {e}")
+                else:
+                    job.update(followup=nxt.id)
+                    job.append("stdout", f"⏩ continúa en el job {nxt.id} ({nxt.partition})")
+        finally:
+            # siempre termina en un estado final: la UI deja de sondear el job
+            job.update(status=status, ended=time.time())
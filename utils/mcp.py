@@ -1,46 +1,27 @@
 # utils/mcp.py
-import re
-from datetime import datetime
+import sys
+from pathlib import Path
 
-# Reglas simples hardcodeadas para el MVP (adaptado de tu dq_rules.yaml)
-RULES = {
-    "energy": [
-        {"field": "kwh", "rule": ">=0"},
-        {"field": "period_start", "rule": "is_date"}
-    ],
-    "hr": [
-        {"field": "employees_start", "rule": ">=0"},
-        {"field": "exits", "rule": ">=0"}
-    ]
-}
+# mismo motor DQ que mcp_ingest: las reglas salen de contracts/dq_rules.yaml
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from dq_service import DQService
+
+ROOT = Path(__file__).resolve().parent.parent
+_service: DQService | None = None
+
+def get_service() -> DQService:
+    """Servicio DQ compartido del proceso (el YAML se carga y compila una sola vez)."""
+    global _service
+    if _service is None:
+        _service = DQService(ROOT / "contracts" / "dq_rules.yaml")
+    return _service
 
 def check_dq(data_list, domain):
-    """Recibe una lista de dicts y devuelve el % de calidad"""
-    if not data_list: return 0.0, []
-    
-    domain_rules = RULES.get(domain, [])
-    passed_count = 0
-    total_checks = 0
-    
-    for row in data_list:
-        for r in domain_rules:
-            total_checks += 1
-            field = r["field"]
-            val = row.get(field)
-            
-            # Lógica simplificada de tu apply_rule
-            passed = False
-            if r["rule"] == ">=0":
-                try: passed = float(val) >= 0
-                except: passed = False
-            elif r["rule"] == "is_date":
-                try: 
-                    datetime.strptime(val, "%Y-%m-%d")
-                    passed = True
-                except: passed = False
-            # ... puedes añadir más reglas aquí
-            
-            if passed: passed_count += 1
-            
-    score = (passed_count / total_checks) if total_checks > 0 else 1.0
-    return round(score * 100, 1)
+    """Recibe una lista de dicts y devuelve el % medio de aprobación por regla (0.0 si no hay datos)"""
+    if not data_list: return 0.0
+    svc = get_service()
+    if domain not in svc.rules: return 100.0
+    # evaluate() no toca los contadores acumulados/móviles del servicio compartido
+    by_rule = [x for v in svc.evaluate(data_list, domain)["by_rule"].values() for x in v]
+    if not by_rule: return 100.0
+    return round(sum(x["pass_rate"] for x in by_rule) / len(by_rule) * 100, 1)